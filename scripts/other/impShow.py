@@ -1,10 +1,11 @@
 import optparse
-import matplotlib.pyplot as plt
-import rgbe.io
-from matplotlib import cm
+import rgbe.image
+import rgbe.utils
 import math
+import numpy
 from glob import glob
 import os
+import sys
 try:
     import Image
     import ImageDraw
@@ -12,27 +13,21 @@ except ImportError:
     from PIL import Image
     from PIL import ImageDraw
 
+# Colormaps of the results scripts
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "results"))
+import colormaps
 
 def convertImage(p, h, w, inver):
-    data = []
-    for x in range(h):
-        tmp = []
-        for y in range(w):
-            p1 = 1-(p[x*w+y][0])
-            tmp.append(p1)
-        data.append(tmp)
-    return data
+    "1 - red channel [h, w] of the image array"
+    return 1 - p[..., 0].astype(numpy.float64).reshape(h, w)
 def convertImageImp(path, out, 
                     clMin = -1, clMax = -1, inver = False, 
                     usePourcentage = False, pourcent = 0.90):
-    (w, h),pRef = rgbe.io.read(path)
-    
-    fig = plt.figure(figsize=((w/100.0), (h/100.0)), dpi=100)
+    (w, h),pRef = rgbe.image.read_array(path)
 
     data = convertImage(pRef, h, w, inver)
     
-    pRefLum = [p[0] for p in pRef]
-    pRefLum.sort()
+    pRefLum = numpy.sort(pRef[..., 0].astype(numpy.float64), axis=None)
     
     maxData = pRefLum[-1]
     minData = pRefLum[0]
@@ -49,16 +44,8 @@ def convertImageImp(path, out,
     	maxData = clMax
 
     #print(data)
-    cax = plt.figimage(data, vmin=minData, vmax=maxData, cmap=cm.get_cmap("viridis"))
-    fig.savefig(out)#, bbox_inches=extent)
-    plt.close()
-    
-    im = Image.open(out)
-    (widthN, heightN) = im.size
-    im = im.crop(((widthN-w), 
-                  (heightN-h),
-                  w,
-                  h))
+    lut = rgbe.utils.lutFromColors(colormaps.colors["viridis"])
+    im = Image.fromarray(rgbe.utils.applyLUT(data, lut, minData, maxData), "RGB")
     im.save(out)
     im.close()
     
@@ -0,0 +1,182 @@
+"""
+In-process pipeline of run.py
+
+The stages (scene generation, rendering, packing, metrics, HTML) are the
+main functions of their scripts, called inside the same process: each
+module is imported once and the stages share a Context (decoded images)
+and the directory indices of dir_index.
+
+A stage is skipped when its arguments and its inputs (files, glob
+patterns or the files directly inside a directory, hidden files
+excepted) did not change since its last successful run and its outputs
+still exist. The fingerprints are kept in a state file (.run_stages.json).
+A stage is not run if one of the stages it depends on failed.
+"""
+
+import os
+import sys
+import glob
+import json
+import time
+import hashlib
+import traceback
+import collections
+
+SCRIPTS_DIR = os.path.dirname(os.path.abspath(__file__))
+for subdir in ["results", "run", "scene"]:
+    sys.path.append(os.path.join(SCRIPTS_DIR, subdir))
+
+import metric_cache
+
+STATE_NAME = ".run_stages.json"
+
+class Context:
+    """State shared by the stages of a run"""
+    def __init__(self):
+        self.hashes = {} # path -> ((size, mtime), sha1)
+        self.images = {} # sha1 -> ((width, height), array)
+
+    def fileHash(self, path):
+        """Content hash of a file (computed again only if the file changed)"""
+        st = os.stat(path)
+        key = (st.st_size, st.st_mtime_ns)
+        path = os.path.abspath(path)
+        if(path not in self.hashes or self.hashes[path][0] != key):
+            self.hashes[path] = (key, metric_cache.fileHash(path))
+        return self.hashes[path][1]
+
+    def readImage(self, path):
+        """Return ((width, height), array) of the image (read only array).
+        The files with the same content (the reference and its packed
+        copy) are decoded only once."""
+        # Not needed by the scene generation (no compiled module)
+        import rgbe.container
+        if(not os.path.exists(path)):
+            # Inside an iteration dump container
+            return rgbe.container.read_array(path)
+        h = self.fileHash(path)
+        if(h not in self.images):
+            (width,height),p = rgbe.container.read_array(path)
+            p.flags.writeable = False
+            self.images[h] = ((width,height),p)
+        return self.images[h]
+
+def pathSignature(path):
+    """Identity (name, size, mtime) of the files of an input: a file,
+    a glob pattern or the files directly inside a directory"""
+    if(os.path.isdir(path)):
+        files = [e.path for e in os.scandir(path) if e.is_file() and not e.name.startswith(".")]
+    elif(glob.has_magic(path)):
+        files = glob.glob(path)
+    else:
+        files = [path] if os.path.exists(path) else []
+    signature = []
+    for f in sorted(files):
+        st = os.stat(f)
+        signature.append([os.path.basename(f), st.st_size, st.st_mtime_ns])
+    return signature
+
+def pathExists(path):
+    """The file or the directory exists (or the glob pattern matches a file)"""
+    if(glob.has_magic(path)):
+        return len(glob.glob(path)) != 0
+    return os.path.exists(path)
+
+Stage = collections.namedtuple("Stage", ["name", "function", "argv", "inputs", "outputs", "after", "cache"])
+
+class Pipeline:
+    def __init__(self, stateFile, force=False):
+        """
+        :param stateFile: fingerprints of the stages of the last runs
+        :param force: run all the stages (the fingerprints are updated)
+        """
+        self.stateFile = stateFile
+        self.force = force
+        self.stages = []
+        self.context = Context()
+        self.state = {}
+        try:
+            with open(stateFile, "r") as f:
+                self.state = json.load(f)
+        except (OSError, ValueError):
+            pass
+
+    def add(self, name, function, argv, inputs=(), outputs=(), after=(), cache=True):
+        """
+        Add a stage: function(argv, context) is called to run it
+        :param after: names of the stages it depends on
+        :param cache: skip the stage if its inputs did not change
+        """
+        self.stages.append(Stage(name, function, [str(a) for a in argv], list(inputs),
+                                 list(outputs), list(after), cache))
+
+    def fingerprint(self, stage):
+        content = [stage.argv] + [[p, pathSignature(p)] for p in stage.inputs]
+        return hashlib.sha1(json.dumps(content).encode("utf-8")).hexdigest()
+
+    def isUpToDate(self, stage):
+        return (stage.cache and not self.force and
+                self.state.get(stage.name) == self.fingerprint(stage) and
+                all(pathExists(p) for p in stage.outputs))
+
+    def saveState(self):
+        directory = os.path.dirname(os.path.abspath(self.stateFile))
+        if(not os.path.exists(directory)):
+            os.makedirs(directory)
+        tmpFile = self.stateFile + ".tmp"
+        with open(tmpFile, "w") as f:
+            json.dump(self.state, f, indent=1, sort_keys=True)
+        os.replace(tmpFile, self.stateFile)
+
+    def runStage(self, stage):
+        """:return: True if the stage succeeded"""
+        print("[INFO] Stage %s: %s" % (stage.name, " ".join(stage.argv)))
+        sys.stdout.flush()
+        try:
+            stage.function(stage.argv, self.context)
+        except SystemExit as e:
+            # Error reported by the stage (option parser, missing input, ...)
+            return e.code is None or e.code == 0
+        except Exception:
+            traceback.print_exc()
+            return False
+        return True
+
+    def run(self):
+        """
+        Run all the stages (in the order they were added)
+        :return: status ("done", "skipped", "failed", "blocked") and wall time of each stage
+        """
+        report = collections.OrderedDict()
+        for stage in self.stages:
+            failed = [name for name in stage.after if report.get(name, ("done",))[0] in ("failed", "blocked")]
+            if(len(failed) != 0):
+                print("[WARN] Stage %s not run: %s failed" % (stage.name, " ".join(failed)))
+                report[stage.name] = ("blocked", 0.0)
+                continue
+            if(self.isUpToDate(stage)):
+                print("[INFO] Stage %s: up to date, skipped" % stage.name)
+                report[stage.name] = ("skipped", 0.0)
+                continue
+
+            start = time.time()
+            success = self.runStage(stage)
+            elapsed = time.time() - start
+            if(success):
+                print("[INFO] Stage %s: done in %.1fs" % (stage.name, elapsed))
+                report[stage.name] = ("done", elapsed)
+                if(stage.cache):
+                    # After the run: the stage can write inside its inputs
+                    self.state[stage.name] = self.fingerprint(stage)
+                else:
+                    self.state.pop(stage.name, None)
+            else:
+                print("[ERROR] Stage %s: failed after %.1fs" % (stage.name, elapsed))
+                report[stage.name] = ("failed", elapsed)
+                self.state.pop(stage.name, None)
+            self.saveState()
+
+        print("[INFO] ==== Stages")
+        for name, (status, elapsed) in report.items():
+            print("[INFO] %-12s %-8s %8.1fs" % (name, status, elapsed))
+        return report
@@ -1042,17 +1042,28 @@ _viridis_data = [[0.267004, 0.004874, 0.329415],
                  [0.983868, 0.904867, 0.136897],
                  [0.993248, 0.906157, 0.143936]]
 
-from matplotlib.colors import ListedColormap
+# Raw colors (usable without matplotlib, see rgbe.utils.lutFromColors)
+colors = {'magma': _magma_data,
+          'inferno': _inferno_data,
+          'plasma': _plasma_data,
+          'viridis': _viridis_data}
+
+# The matplotlib colormaps are only available if matplotlib is installed
+try:
+    from matplotlib.colors import ListedColormap
+except ImportError:
+    ListedColormap = None
 
 cmaps = {}
-for (name, data) in (('magma', _magma_data),
-                     ('inferno', _inferno_data),
-                     ('plasma', _plasma_data),
-                     ('viridis', _viridis_data)):
+if ListedColormap is not None:
+    for (name, data) in (('magma', _magma_data),
+                         ('inferno', _inferno_data),
+                         ('plasma', _plasma_data),
+                         ('viridis', _viridis_data)):
 
-    cmaps[name] = ListedColormap(data, name=name)
+        cmaps[name] = ListedColormap(data, name=name)
 
-magma = cmaps['magma']
-inferno = cmaps['inferno']
-plasma = cmaps['plasma']
-viridis = cmaps['viridis']
+magma = cmaps.get('magma')
+inferno = cmaps.get('inferno')
+plasma = cmaps.get('plasma')
+viridis = cmaps.get('viridis')
@@ -1,16 +1,12 @@
 import optparse
+import time_index
 
 def nbIter(filename, timeLimit):
+    """Number of iterations to reach the time limit (0: all the iterations)"""
+    index = time_index.TimeIndex.fromCSV(filename)
     if(timeLimit == 0.0):
-        return len(open(filename, "r").readlines())
-    else:
-        lines = open(filename, "r").readlines()
-        times = [float(v.replace(",\n", "")) for v in lines]
-        cum, nb = 0, 0
-        while(cum < timeLimit):
-            cum += times[nb]
-            nb += 1
-        return nb
+        return len(index)
+    return index.iterationsToReach(timeLimit)
 if __name__=="__main__":
     parser = optparse.OptionParser()
     parser.add_option('-i','--input', help="input directory", default="")
@@ -1,16 +1,15 @@
 import glob
+import numpy
 import rgbe.io
+import rgbe.image
 import optparse
 
 def crop(inFile, outFile, cX, cY, cXSize, cYSize):
-    (width,height),pixelsHDR = rgbe.io.read(inFile)
-    pixelsHDRCrop = [(0,0,0)] * cXSize * cYSize
-    for i in range(len(pixelsHDR)):
-        x = i % width
-        y = (i - x) // width
-        if(x >= cX and x < cX+cXSize and y >= cY and y < cY+cYSize):
-            k = (x - cX) + cXSize * (y - cY)
-            pixelsHDRCrop[k] = pixelsHDR[i]
+    (width,height),pixelsHDR = rgbe.image.read_array(inFile)
+    # Pixels outside the image stay black
+    pixelsHDRCrop = numpy.zeros((cYSize, cXSize, 3), dtype=numpy.float32)
+    sub = pixelsHDR[cY:cY+cYSize, cX:cX+cXSize]
+    pixelsHDRCrop[:sub.shape[0], :sub.shape[1]] = sub
     rgbe.io.write_hdr(outFile, cXSize, cYSize, pixelsHDRCrop)
 
 if __name__ == "__main__":
@@ -1,8 +1,133 @@
-import math
+import os
 import logging
+import warnings
+import numpy
 
 logger = logging.getLogger(__name__)
 
+# Keep the parsed CSV files in binary sidecars (.<name>.npz, next to the CSV)
+SIDECAR_CACHE = True
+
+class CSVError(Exception):
+    """Malformed CSV file"""
+    pass
+
+def parseCSVFast(text):
+    """ Parse the usual renderer output (complete lines, no comment, no
+    blank line) without any per line Python code. None if the text is
+    not in this format (parseCSV handles it) """
+    if('#' in text or not text.endswith("\n")):
+        return None
+    body = text.replace("\r", "").replace(",\n", "\n").rstrip("\n")
+    if(body == "" or "\n\n" in body):
+        return None
+    nbRows = body.count("\n") + 1
+    nbColumns = body[:body.find("\n")].count(',') + 1 if nbRows > 1 else body.count(',') + 1
+    if(nbColumns > 1):
+        # All the rows need the same number of columns
+        chars = numpy.frombuffer(body.encode(), dtype=numpy.uint8)
+        commas = numpy.cumsum(chars == ord(','))
+        ends = numpy.concatenate([commas[chars == ord('\n')], commas[-1:]])
+        if(numpy.any(numpy.diff(ends, prepend=0) != nbColumns - 1)):
+            return None
+    with warnings.catch_warnings():
+        warnings.simplefilter("error") # Raised by fromstring on a bad number
+        try:
+            values = numpy.fromstring(body.replace("\n", ","), dtype=numpy.float64, sep=",")
+        except (ValueError, DeprecationWarning):
+            return None
+    if(values.size != nbRows * nbColumns):
+        return None
+    return values.reshape(nbRows, nbColumns)
+
+def parseCSV(filename):
+    """ All the numbers of a CSV file (float array [rows, columns])
+    The lines beginning with # are skipped and the trailing comma
+    of the lines is optional. An incomplete last line (file still
+    written by the renderer) is ignored.
+    """
+    with open(filename, "r") as fileCSV:
+        text = fileCSV.read()
+    data = parseCSVFast(text)
+    if(data is not None):
+        return data
+
+    lines = text.split("\n")
+    if(not text.endswith("\n")):
+        # The last line is still written (even if its beginning parses)
+        lines.pop()
+    rows = [line.strip(' \r') for line in lines]
+    rows = [line[:-1] if line.endswith(",") else line for line in rows if line and line[0] != '#']
+    if(len(rows) == 0):
+        return numpy.zeros((0, 0))
+
+    nbColumns = rows[0].count(',') + 1
+    if(any(row.count(',') != nbColumns - 1 for row in rows)):
+        raise CSVError("Rows with different number of columns")
+    fields = ",".join(rows).split(',')
+    try:
+        return numpy.array(fields, dtype=numpy.float64).reshape(len(rows), nbColumns)
+    except ValueError as e:
+        raise CSVError(str(e))
+
+def sidecarName(filename):
+    directory, name = os.path.split(filename)
+    return os.path.join(directory, "." + name + ".npz")
+
+def readSidecar(filename, key):
+    """Cached array of the CSV file or None if the sidecar is missing or outdated"""
+    try:
+        with numpy.load(sidecarName(filename)) as sidecar:
+            if(tuple(sidecar["key"].tolist()) != key):
+                return None
+            return sidecar["data"]
+    except (OSError, ValueError, KeyError):
+        return None
+
+def writeSidecar(filename, key, data):
+    sidecar = sidecarName(filename)
+    tmpFile = sidecar + ".tmp.npz"
+    try:
+        numpy.savez(tmpFile, key=numpy.array(key, dtype=numpy.int64), data=data)
+        os.replace(tmpFile, sidecar)
+    except OSError as e:
+        # Read only input directory: only the memory cache is used
+        logger.debug("Impossible to write the CSV cache %s: %s", sidecar, e)
+
+# Parsed files of the process: path -> ((size, mtime), array)
+_loaded = {}
+
+def loadCSV(filename):
+    """ Columnar content of a CSV file (read only float64 array [rows, columns])
+    The file is parsed once: the array is kept in memory and in a binary
+    sidecar, both keyed on the size and the modification time of the file.
+    :raise OSError: if the file can not be read
+    :raise CSVError: if the file is malformed
+    """
+    st = os.stat(filename)
+    key = (st.st_size, st.st_mtime_ns)
+    path = os.path.abspath(filename)
+    if(path in _loaded and _loaded[path][0] == key):
+        return _loaded[path][1]
+
+    data = readSidecar(filename, key) if SIDECAR_CACHE else None
+    if(data is None):
+        data = parseCSV(filename)
+        if(SIDECAR_CACHE):
+            writeSidecar(filename, key, data)
+    data.flags.writeable = False
+    _loaded[path] = (key, data)
+    return data
+
+def loadCSVColumn(filename, column=0):
+    """ One column of a CSV file (see loadCSV) """
+    data = loadCSV(filename)
+    if(data.shape[0] == 0):
+        return numpy.zeros(0)
+    if(column >= data.shape[1]):
+        raise CSVError("No column %i (%i columns)" % (column, data.shape[1]))
+    return data[:, column]
+
 def extractCSVColumn(filename):
     """ Extract the number of column 
     for the CSV file ..
@@ -18,14 +143,12 @@ def isCSVHeader(filename):
     """Test if the CSV file begun with
     an # symbol"""
     try:
-        fileCSV = open(filename, "r")
-        lines = fileCSV.readlines()
-        if(len(lines) > 0):
-            if(lines[0][0] == '#'):
+        with open(filename, "r") as fileCSV:
+            if(fileCSV.read(1) == '#'):
                 logger.debug("Found header :)")
                 return True
         return False
-    except:
+    except OSError:
         return False
 
 def extractCSVHeader(filename):
@@ -33,17 +156,36 @@ def extractCSVHeader(filename):
     for the CSV file ..
     """
     try: 
-        fileCSV = open(filename, "r")
-        lines = fileCSV.readlines()
-        if(len(lines) > 0):
-            line = lines[0][1:]
-            return line.split(',')
+        with open(filename, "r") as fileCSV:
+            line = fileCSV.readline()
+        if(len(line) > 0):
+            return line[1:].split(',')
         return []
-    except:
+    except OSError:
         logger.error("CSV file header error: " + filename)
         return []
 
 
+def readCSVNumber(filename, column=0):
+    """ Same as extractCSVNumber but return a float array """
+    try:
+        return loadCSVColumn(filename, column)
+    except (OSError, CSVError) as e:
+        logger.error("CSV file IO error: " + filename + " (" + str(e) + ")")
+        return numpy.zeros(0)
+
+def readCSVNumberLog(filename, mul, column=0):
+    """ Same as extractCSVNumberLog but return a float array """
+    try:
+        numbers = loadCSVColumn(filename, column)
+    except (OSError, CSVError) as e:
+        logger.error("CSV file IO (logarithm) error: " + filename + " (" + str(e) + ")")
+        return numpy.zeros(0)
+    if(numpy.any(~(numbers > 0.0))):
+        logger.error("CSV file IO (logarithm) error: " + filename + " (value <= 0)")
+        return numpy.zeros(0)
+    return mul * numpy.log10(numbers)
+
 def extractCSVNumberLog(filename, mul, column=0):
     """ The CSV file format need to be, somethings like:
         <number>,
@@ -51,28 +193,7 @@ def extractCSVNumberLog(filename, mul, column=0):
         ...
         eof
     """
-    beginEntry = 0
-    if(isCSVHeader(filename)):
-        beginEntry += 1 
-    numbers = []
-
-    try:
-        fileCSV = open(filename, "r")
-        lines = fileCSV.readlines()
-        for line in lines:
-            line = line.strip(' \r\n') # Remove all unessary symbols
-            if not line:               # Skip blank lines
-                continue
-            if(line[-1] != ","):
-                raise Exception('Error format CSV handling', line)
-            num = float(line.split(',')[column])
-            num = math.log10( num )
-            numbers.append( mul*num ) # Remove the , character
-
-        return numbers
-    except:
-        logger.error("CSV file IO (logarithm) error: " + filename)
-        return []
+    return readCSVNumberLog(filename, mul, column).tolist()
 
 def extractCSVNumber(filename, column=0):
     """ The CSV file format need to be, somethings like:
@@ -81,64 +202,40 @@ def extractCSVNumber(filename, column=0):
         ...
         eof
     """
-    beginEntry = 0
-    if(isCSVHeader(filename)):
-        beginEntry += 1 
-        
-    numbers = []
-    try:
-        fileCSV = open(filename, "r")
-        lines = fileCSV.readlines()
-        for line in lines:
-            line = line.strip(' \r\n') # Remove all unessary symbols
-            if not line:               # Skip blank lines
-                continue
-            if(line[-1] != ","):
-                raise Exception('Error format CSV handling', line)
-            numbers.append(float(line.split(',')[column])) # Remove the , character
-        return numbers
-    except:
-        logger.error("CSV file IO error: " + filename)
-        return []
+    return readCSVNumber(filename, column).tolist()
 
 class Technique:
+    """ Curve of a technique: x is the cumulated time (one entry
+    every step iterations) and y the metric (float arrays) """
     def __init__(self, name, color, xCSVFile, yCSVFile, step, log, shift=0, column=0):
         self.name = name
         self.color = color
         self.shift = shift
         
+        x = readCSVNumber(xCSVFile)
         if log:
-            self.x = extractCSVNumber(xCSVFile)
-            self.y = extractCSVNumberLog(yCSVFile, 20, column)
+            self.y = readCSVNumberLog(yCSVFile, 20, column)
         else:
-            self.x = extractCSVNumber(xCSVFile)
-            self.y = extractCSVNumber(yCSVFile, column)
+            self.y = numpy.array(readCSVNumber(yCSVFile, column))
         
         self.step = step
         
         if self.shift > 0:
-            self.x = self.x[0:-self.shift]
+            x = x[0:-self.shift]
             self.y = self.y[self.shift::]
         
         # Compute the cumulate time
-        currentX = 0.0
-        for i in range(len(self.x)):
-            currentX = currentX + self.x[i]
-            if(log):
-                self.x[i] = math.log10( currentX )
-            else:
-                self.x[i] = currentX
-            
-        Xconcat = []
-        for i in range(0, len(self.x), self.step):
-            Xconcat.append(self.x[i])
-        self.x = Xconcat
+        x = numpy.cumsum(x)
+        if(log):
+            with numpy.errstate(divide='ignore'):
+                x = numpy.log10(x)
+        self.x = x[::self.step]
 
-        logger.debug(self.name,self.y)
+        logger.debug("%s %s", self.name, self.y)
         
-        if((len(self.x)/self.step) != len(self.y)):
+        if(len(self.x) != len(self.y)):
             logger.info("===============================================")
-            logger.warn("The CSV Files doesn't have the same size")
+            logger.warning("The CSV Files doesn't have the same size")
             self.dump()
             logger.info("Clip to the minimum ... :(")
             sizeMin = min(len(self.x), len(self.y))
@@ -0,0 +1,91 @@
+"""
+Export of the curves of the HTML report (run_html.py)
+
+The series are decimated to a point budget with the largest triangle
+three buckets algorithm (LTTB), which keeps the visual shape of the curve.
+The data of a curve is written as compact JSON inside a small script
+(<name>_data.js) loaded lazily by the page (see data/js/lazy-curves.js).
+A script is used instead of a .json file so that the report still works
+when it is opened directly from the disk (file://).
+"""
+
+import json
+import numpy
+
+DATA_SUFFIX = "_data.js"
+
+def lttb(x, y, threshold):
+    """
+    Indices of the points kept by the largest triangle three buckets algorithm
+    :param x, y: the series (x sorted)
+    :param threshold: number of points to keep (0: keep all)
+    :return: sorted indices (the first and last points are always kept)
+    """
+    n = len(x)
+    if(threshold <= 0 or threshold >= n or n <= 2):
+        return numpy.arange(n)
+    threshold = max(threshold, 3)
+    x = numpy.asarray(x, dtype=numpy.float64)
+    y = numpy.asarray(y, dtype=numpy.float64)
+
+    # The n-2 middle points are split into threshold-2 buckets
+    edges = numpy.linspace(1, n - 1, threshold - 1).astype(numpy.intp)
+    indices = numpy.empty(threshold, dtype=numpy.intp)
+    indices[0] = 0
+    indices[-1] = n - 1
+    a = 0
+    for i in range(threshold - 2):
+        start, end = edges[i], edges[i + 1]
+        # Average point of the next bucket (the last point for the last bucket)
+        if(i + 2 < len(edges)):
+            nextStart, nextEnd = edges[i + 1], edges[i + 2]
+        else:
+            nextStart, nextEnd = n - 1, n
+        avgX = x[nextStart:nextEnd].mean()
+        avgY = y[nextStart:nextEnd].mean()
+
+        # Keep the point making the largest triangle with
+        # the previous kept point and the next bucket average
+        area = numpy.abs((x[a] - avgX) * (y[start:end] - y[a]) -
+                         (x[a] - x[start:end]) * (avgY - y[a]))
+        a = start + int(numpy.argmax(numpy.nan_to_num(area, nan=-1.0)))
+        indices[i + 1] = a
+    return indices
+
+def decimate(x, y, threshold, log=False):
+    """
+    Decimated (x, y) lists of a series
+    :param log: the curve is shown with logarithmic axes
+                (the shape is preserved in this space)
+    """
+    if(threshold <= 0 or len(x) <= threshold):
+        return list(x), list(y)
+    xs = numpy.asarray(x, dtype=numpy.float64)
+    ys = numpy.asarray(y, dtype=numpy.float64)
+    if(log):
+        # The values <= 0 can not be shown anyway
+        xs = numpy.log10(numpy.maximum(xs, 1e-300))
+        ys = numpy.log10(numpy.maximum(ys, 1e-300))
+    indices = lttb(xs, ys, threshold)
+    return [x[i] for i in indices], [y[i] for i in indices]
+
+def compact(values, digits=6):
+    """Round the values to a number of significant digits (shorter JSON)"""
+    res = []
+    for v in values:
+        v = float("%.*g" % (digits, v))
+        res.append(int(v) if v.is_integer() else v)
+    return res
+
+def curveDataJS(name, series, digits=6):
+    """
+    Content of the lazy loaded data script of a curve
+    :param series: list of (x, y) of all the datasets
+    """
+    payload = {"x": [compact(x, digits) for x, y in series],
+               "y": [compact(y, digits) for x, y in series]}
+    return "registerCurveData(" + json.dumps(name) + "," + json.dumps(payload, separators=(",", ":")) + ");\n"
+
+def writeCurveData(filename, name, series, digits=6):
+    with open(filename, "w") as f:
+        f.write(curveDataJS(name, series, digits))
@@ -0,0 +1,46 @@
+// Lazy loading of the curves data (generated by run_html.py)
+// The data of a curve is inside <name>_data.js, which calls registerCurveData.
+// This script is only inserted when the curve becomes visible.
+var curveCallbacks = {};
+
+function registerCurveData(name, data) {
+	var callback = curveCallbacks[name];
+	delete curveCallbacks[name];
+	if (callback) {
+		callback(data);
+	}
+}
+
+function lazyCurve(name, callback) {
+	var load = function() {
+		curveCallbacks[name] = callback;
+		var script = document.createElement("script");
+		script.src = name + "_data.js";
+		document.body.appendChild(script);
+	};
+
+	var element = document.getElementById(name);
+	if (!element || !("IntersectionObserver" in window)) {
+		load();
+		return;
+	}
+	var observer = new IntersectionObserver(function(entries) {
+		for (var i = 0; i < entries.length; i++) {
+			if (entries[i].isIntersecting) {
+				observer.disconnect();
+				load();
+				return;
+			}
+		}
+	}, {rootMargin: "200px"});
+	observer.observe(element);
+}
+
+// Chart.js points of a dataset
+function curvePoints(xs, ys) {
+	var points = new Array(xs.length);
+	for (var i = 0; i < xs.length; i++) {
+		points[i] = {x: xs[i], y: ys[i]};
+	}
+	return points;
+}
@@ -0,0 +1,197 @@
+// Tiled 4-way image comparison (run_html.py -T)
+// Same split view as image-compare.js, but the images are multi-resolution
+// pyramids of tiles (<image>_tiles/<level>/<col>_<row>.png, level 0 is the
+// full resolution, see image_pyramid.py). Only the tiles visible inside each
+// quarter at the current zoom are loaded.
+// Mouse wheel: zoom, drag: pan, double click: reset the view.
+(function($){
+	function TiledCompare(element) {
+		var i = $(element);
+		this.width = parseInt(i.attr('data-width'), 10);
+		this.height = parseInt(i.attr('data-height'), 10);
+		this.levels = parseInt(i.attr('data-levels'), 10);
+		this.tileSize = parseInt(i.attr('data-tile'), 10);
+		this.canvas = i.children('canvas')[0];
+		this.context = this.canvas.getContext('2d');
+		this.tiles = {}; // url -> Image (loaded or loading)
+
+		this.layers = [];
+		var classes = ['tl', 'tr', 'bl', 'br'];
+		var self = this;
+		i.children('span').each(function(k) {
+			self.layers.push({dir: $(this).attr('data-tiles'),
+			                  caption: $('<div class="ba-caption_' + classes[k] + '">' + $(this).attr('data-desc') + '</div>')});
+		});
+		for (var k = 0; k < this.layers.length; k++) {
+			i.append(this.layers[k].caption);
+			this.layers[k].caption.show();
+		}
+
+		this.splitX = this.canvas.width * 0.5;
+		this.splitY = this.canvas.height * 0.5;
+		this.drag = null;
+		this.pending = false;
+		this.reset();
+
+		$(this.canvas).mousemove(function(e) {
+			var offset = $(self.canvas).offset();
+			var x = e.pageX - offset.left;
+			var y = e.pageY - offset.top;
+			if (self.drag) {
+				self.viewX -= (x - self.drag.x) / self.scale;
+				self.viewY -= (y - self.drag.y) / self.scale;
+				self.drag = {x: x, y: y};
+				self.clamp();
+			} else {
+				self.splitX = x;
+				self.splitY = y;
+			}
+			self.redraw();
+		});
+		$(this.canvas).mousedown(function(e) {
+			var offset = $(self.canvas).offset();
+			self.drag = {x: e.pageX - offset.left, y: e.pageY - offset.top};
+			e.preventDefault();
+		});
+		$(this.canvas).on('mouseup mouseleave', function() {
+			self.drag = null;
+		});
+		$(this.canvas).dblclick(function() {
+			self.reset();
+			self.redraw();
+		});
+		this.canvas.addEventListener('wheel', function(e) {
+			e.preventDefault();
+			var offset = $(self.canvas).offset();
+			var x = e.pageX - offset.left;
+			var y = e.pageY - offset.top;
+			// Keep the image point under the mouse at the same place
+			var imageX = self.viewX + x / self.scale;
+			var imageY = self.viewY + y / self.scale;
+			var scale = self.scale * (e.deltaY < 0 ? 1.25 : 0.8);
+			self.scale = Math.min(Math.max(scale, self.fitScale), 8.0);
+			self.viewX = imageX - x / self.scale;
+			self.viewY = imageY - y / self.scale;
+			self.clamp();
+			self.redraw();
+		});
+	}
+
+	// Whole image visible
+	TiledCompare.prototype.reset = function() {
+		this.fitScale = Math.min(this.canvas.width / this.width, this.canvas.height / this.height);
+		this.scale = this.fitScale;
+		this.viewX = 0;
+		this.viewY = 0;
+		this.clamp();
+		this.draw();
+	};
+
+	// Center the image if it is smaller than the view, else stay inside it
+	TiledCompare.prototype.clamp = function() {
+		var w = this.canvas.width / this.scale;
+		var h = this.canvas.height / this.scale;
+		this.viewX = (w >= this.width) ? (this.width - w) * 0.5 : Math.min(Math.max(this.viewX, 0), this.width - w);
+		this.viewY = (h >= this.height) ? (this.height - h) * 0.5 : Math.min(Math.max(this.viewY, 0), this.height - h);
+	};
+
+	// Coarsest level with at least one tile pixel per screen pixel
+	TiledCompare.prototype.level = function() {
+		var level = Math.floor(Math.log(1.0 / this.scale) / Math.LN2);
+		return Math.min(Math.max(level, 0), this.levels - 1);
+	};
+
+	TiledCompare.prototype.tile = function(layer, level, col, row) {
+		var url = layer.dir + '/' + level + '/' + col + '_' + row + '.png';
+		var img = this.tiles[url];
+		if (!img) {
+			var self = this;
+			img = new Image();
+			img.onload = function() { self.redraw(); };
+			img.src = url;
+			this.tiles[url] = img;
+		}
+		return img;
+	};
+
+	// Draw the tiles of a level intersecting the rectangle (canvas pixels)
+	TiledCompare.prototype.drawLevel = function(layer, level, x, y, w, h) {
+		var factor = Math.pow(2, level);
+		var span = this.tileSize * factor; // Full resolution pixels per tile
+		var col0 = Math.max(0, Math.floor((this.viewX + x / this.scale) / span));
+		var row0 = Math.max(0, Math.floor((this.viewY + y / this.scale) / span));
+		var col1 = Math.min(Math.ceil(this.width / span), Math.ceil((this.viewX + (x + w) / this.scale) / span));
+		var row1 = Math.min(Math.ceil(this.height / span), Math.ceil((this.viewY + (y + h) / this.scale) / span));
+		for (var row = row0; row < row1; row++) {
+			for (var col = col0; col < col1; col++) {
+				var img = this.tile(layer, level, col, row);
+				if (img.complete && img.naturalWidth > 0) {
+					this.context.drawImage(img,
+						(col * span - this.viewX) * this.scale, (row * span - this.viewY) * this.scale,
+						img.naturalWidth * factor * this.scale, img.naturalHeight * factor * this.scale);
+				}
+			}
+		}
+	};
+
+	TiledCompare.prototype.drawLayer = function(layer, x, y, w, h) {
+		if (w <= 0 || h <= 0) {
+			return;
+		}
+		var ctx = this.context;
+		ctx.save();
+		ctx.beginPath();
+		ctx.rect(x, y, w, h);
+		ctx.clip();
+		// The coarsest level (one tile) is shown while the others are loading
+		var level = this.level();
+		if (level != this.levels - 1) {
+			this.drawLevel(layer, this.levels - 1, x, y, w, h);
+		}
+		this.drawLevel(layer, level, x, y, w, h);
+		ctx.restore();
+	};
+
+	TiledCompare.prototype.draw = function() {
+		this.pending = false;
+		var ctx = this.context;
+		var W = this.canvas.width, H = this.canvas.height;
+		var x = this.splitX, y = this.splitY;
+		ctx.imageSmoothingEnabled = this.scale < 1.0;
+		ctx.fillStyle = '#000';
+		ctx.fillRect(0, 0, W, H);
+		var rects = [[0, 0, x, y], [x, 0, W - x, y], [0, y, x, H - y], [x, y, W - x, H - y]];
+		for (var k = 0; k < this.layers.length; k++) {
+			this.drawLayer(this.layers[k], rects[k][0], rects[k][1], rects[k][2], rects[k][3]);
+		}
+		ctx.fillStyle = '#333';
+		ctx.fillRect(x - 1.5, 0, 3, H);
+		ctx.fillRect(0, y - 1.5, W, 3);
+
+		if (this.layers.length == 4) {
+			this.layers[0].caption.css({bottom: H - y, right: W - x});
+			this.layers[1].caption.css({bottom: H - y, left: x});
+			this.layers[2].caption.css({top: y, right: W - x});
+			this.layers[3].caption.css({top: y, left: x});
+		}
+	};
+
+	// Draw at most once per frame
+	TiledCompare.prototype.redraw = function() {
+		if (this.pending) {
+			return;
+		}
+		this.pending = true;
+		var self = this;
+		(window.requestAnimationFrame || setTimeout)(function() { self.draw(); });
+	};
+
+	$.fn.extend({
+		//plugin name - qtiledcompare
+		qtiledcompare: function() {
+			return this.each(function() {
+				new TiledCompare(this);
+			});
+		}
+	});
+})(jQuery);
@@ -0,0 +1,157 @@
+"""
+Index of a result directory
+
+The directory is listed once (os.scandir) and the file names are parsed:
+ - techniques: <TECH>_time.csv
+ - dumped images series: <TECH>_<prefix>_<iter>.<ext> (nameBase: <TECH>_<prefix>_)
+The list of names is cached inside the directory (INDEX_NAME) and
+invalidated when the directory mtime changes (a file is added/removed).
+The cache file is always rewritten in place: this does not change
+the directory mtime.
+A writer knowing the whole content of the directory (run_pack.py)
+can record it with saveIndex: the directory is then never scanned.
+"""
+
+import os
+import re
+import json
+import time
+import fnmatch
+import logging
+
+logger = logging.getLogger(__name__)
+
+INDEX_NAME = ".dir_index.json"
+INDEX_VERSION = 1
+
+# If the directory was modified less than RACY_TIME seconds before the scan,
+# a file created just after the scan may not change the directory mtime
+# (timestamp granularity): the cache is not trusted in this case
+RACY_TIME = 2.0
+
+SERIES_RE = re.compile(r"^(.+_)(\d+)\.\w+$")
+
+class DirIndex:
+    def __init__(self, directory, mtime, names, scanTime):
+        self.directory = directory
+        self.mtime = mtime
+        self.scanTime = scanTime
+        self.names = sorted(n for n in names if n != INDEX_NAME)
+        self.nameSet = set(self.names)
+
+        # Dumped images series
+        self.series = {}
+        for name in self.names:
+            match = SERIES_RE.match(name)
+            if(match is not None):
+                self.series.setdefault(match.group(1), set()).add(int(match.group(2)))
+
+    def isValid(self, mtime):
+        return self.mtime == mtime and self.scanTime - mtime * 1e-9 >= RACY_TIME
+
+    def path(self, name):
+        return self.directory + os.path.sep + name
+
+    def contains(self, name):
+        return name in self.nameSet
+
+    def match(self, pattern):
+        """Same as glob.glob(directory/pattern) (sorted)"""
+        hidden = pattern.startswith(".")
+        return [self.path(n) for n in self.names
+                if fnmatch.fnmatch(n, pattern) and (hidden or not n.startswith("."))]
+
+    def techniques(self):
+        """Techniques names (<TECH>_time.csv files)"""
+        return [n[:-len("_time.csv")] for n in self.names
+                if n.endswith("_time.csv") and not n.startswith(".")]
+
+    def iterations(self, nameBase):
+        """Iterations of the images <nameBase><iter>.<ext>"""
+        return sorted(self.series.get(nameBase, []))
+
+    def maxIteration(self, nameBase):
+        iterations = self.series.get(nameBase)
+        if(not iterations):
+            return 0
+        return max(iterations)
+
+def scanDirectory(directory):
+    return [entry.name for entry in os.scandir(directory)]
+
+def loadCache(cacheFile, mtime):
+    """Return the cached (names, scanTime) or None if the cache is not valid"""
+    try:
+        with open(cacheFile, "r") as f:
+            content = json.load(f)
+        if(content["version"] != INDEX_VERSION or content["mtime"] != mtime):
+            return None
+        if(not content.get("complete", False) and content["scanTime"] - mtime * 1e-9 < RACY_TIME):
+            return None # Racy cache
+        return content["names"], content["scanTime"]
+    except (OSError, ValueError, KeyError, TypeError):
+        return None
+
+def saveCache(cacheFile, mtime, scanTime, names, complete=False):
+    try:
+        # Rewritten in place (no directory mtime change)
+        with open(cacheFile, "r+") as f:
+            f.truncate(0)
+            content = {"version": INDEX_VERSION, "mtime": mtime,
+                       "scanTime": scanTime, "names": names}
+            if(complete):
+                content["complete"] = True
+            json.dump(content, f)
+    except OSError:
+        logger.warning("Impossible to write the directory index: " + cacheFile)
+
+def saveIndex(directory, names):
+    """
+    Record the content of a directory written by a known writer
+    (the racy check is skipped: nothing else writes inside the directory)
+    :param names: all the file names of the directory
+    """
+    cacheFile = directory + os.path.sep + INDEX_NAME
+    if(not os.path.exists(cacheFile)):
+        open(cacheFile, "a").close()
+    mtime = os.stat(directory).st_mtime_ns
+    saveCache(cacheFile, mtime, time.time(), list(names), complete=True)
+    _indices.pop(os.path.abspath(directory), None)
+
+# Indices already loaded by this process
+_indices = {}
+
+def getIndex(directory, useCache=True):
+    """
+    Return the index of the directory (DirIndex)
+    :param directory: the result directory
+    :param useCache: use (and update) the index cached inside the directory
+    """
+    key = os.path.abspath(directory)
+    cacheFile = directory + os.path.sep + INDEX_NAME
+
+    # The cache file need to exist before the mtime is read
+    if(useCache and not os.path.exists(cacheFile)):
+        try:
+            open(cacheFile, "a").close()
+        except OSError:
+            useCache = False # Read only directory
+
+    mtime = os.stat(directory).st_mtime_ns
+    if(key in _indices and _indices[key].isValid(mtime)):
+        return _indices[key]
+
+    cached = None
+    if(useCache):
+        cached = loadCache(cacheFile, mtime)
+    if(cached is not None):
+        names, scanTime = cached
+    else:
+        scanTime = time.time()
+        names = scanDirectory(directory)
+        if(useCache):
+            saveCache(cacheFile, mtime, scanTime, names)
+
+    index = DirIndex(directory, mtime, names, scanTime)
+    _indices[key] = index
+    return index
@@ -4,15 +4,16 @@ import xml.etree.ElementTree as ET
 import os
 import math
 import logging
+import numpy
 
-# For plotting informations
-import matplotlib.pyplot as plt
-from matplotlib import cm
+# Colormaps for the false color images (no matplotlib needed)
+import colormaps
 
 # For read images
 import rgbe.io
 import rgbe.utils
 import rgbe.fast
+import rgbe.container
 try:
     import Image
     import ImageDraw
@@ -22,6 +23,8 @@ except ImportError:
 
 logger = logging.getLogger(__name__)
 
+VIRIDIS_LUT = rgbe.utils.lutFromColors(colormaps.colors["viridis"])
+
 
 def copyPixeltoPIL(w, h, p, im):
     clamp = lambda x : 255 if math.isnan(x) else int(x*255)
@@ -30,21 +33,19 @@ def copyPixeltoPIL(w, h, p, im):
 
 def saveNPImage(imgPath,pRef,output,scale=1.0):
      
-    (width,height),pixelsHDR = rgbe.io.read(imgPath)
+    (width,height),pixelsHDR = rgbe.container.read_array(imgPath)
      
     # --- Change data to compute norm
-    pRef = [lum(p) for p in pRef]
-    pixelsHDR = [lum(p) for p in pixelsHDR]
+    pRef = rgbe.utils.luminanceArray(pRef).reshape(height, width)
+    pixelsHDR = rgbe.utils.luminanceArray(pixelsHDR)
      
-    for i in range(len(pRef)):
-        pixelsHDR[i] = 0.0 if pRef[i]+pixelsHDR[i] == 0.0 else (2.0*(pixelsHDR[i] - pRef[i]))/(pixelsHDR[i]+pRef[i])
+    with numpy.errstate(divide='ignore', invalid='ignore'):
+        pixelsHDR = numpy.where(pRef+pixelsHDR == 0.0, 0.0, (2.0*(pixelsHDR - pRef))/(pixelsHDR+pRef))
 
-    logger.debug("NP Image: Min",min(pixelsHDR),"Max",max(pixelsHDR))
+    logger.debug("NP Image: Min %f Max %f", pixelsHDR.min(), pixelsHDR.max())
      
-    im = Image.new("RGB", (width,height))
-    pixConv = lambda x,v: (int(v*255),0,0) if x < 0.0 else (0,int(v*255),0) if x > 0.0 else (0,0,0)
-    buf = [pixConv(p,pow(min(abs(p)/scale,1.0),1/2.2)) for p in pixelsHDR]
-    im.putdata(buf)
+    # Negative in red, positive in green
+    im = Image.fromarray(rgbe.utils.toRGB8Array(rgbe.utils.signedColorArray(pixelsHDR, scale)), "RGB")
     im.save(output, optimize=True)
     im.close()
 
@@ -54,41 +55,32 @@ def saveNPImageRef(imgPath,imgRefPath,output,scale=1.0):
     we read the reference again from scratch
     """
 
-    (wRef,hRef),pRef = rgbe.io.read(imgRefPath)
+    (wRef,hRef),pRef = rgbe.container.read_array(imgRefPath)
     return saveNPImage(imgPath, pRef, output, scale)
 
-def saveFig(w,h,data,output,cmapData=None, minData=None, maxData=None):
-    
-    # --- Save image
-    fig = plt.figure(figsize=((w/100)+1, (h/100)+1), dpi=100)
-    cax = plt.figimage(data, vmin=minData, vmax=maxData, cmap=cmapData)
-    fig.savefig(output)#, bbox_inches=extent)
-    plt.close()
-    
-    # Load and resave image
-    im = Image.open(output)
-    (widthN, heightN) = im.size
-    logger.info("Detected size: ",widthN,heightN, "targeted", w, h)
-    im2 = im.crop(((widthN-w), 
-                  (heightN-h),
-                  w,h))
-    im.close()
-    im2.save(output)
-    
-    
+def falseColorImage(data, lut=VIRIDIS_LUT, minData=None, maxData=None):
+    """PIL image of the scalar field data [h, w] mapped through the color LUT
+    (by default, the min/max of the data are used)"""
+    data = numpy.asarray(data, dtype=numpy.float64)
+    if(minData is None):
+        minData = numpy.nanmin(data)
+    if(maxData is None):
+        maxData = numpy.nanmax(data)
+    return Image.fromarray(rgbe.utils.applyLUT(data, lut, minData, maxData), "RGB")
+
+def saveFig(w,h,data,output,lut=VIRIDIS_LUT, minData=None, maxData=None):
+    data = numpy.asarray(data, dtype=numpy.float64).reshape(h, w)
+    falseColorImage(data, lut, minData, maxData).save(output)
+
 def lum(p):
     return 0.21268*p[0] + 0.7152*p[1] + 0.0722*p[2]
 
 def convertImage(p, h, w, inver):
-    data = []
-    for x in range(h):
-        tmp = []
-        for y in range(w):
-            p1 = lum(p[x*w+y])
-            if inver > 0 and p1 > 0:
-                p1 = 1.0/p1
-            tmp.append(p1)
-        data.append(tmp)
+    "Luminance [h, w] of the pixels (inverted if inver > 0)"
+    data = rgbe.utils.luminanceArray(p).reshape(h, w)
+    if(inver > 0):
+        with numpy.errstate(divide='ignore'):
+            data = numpy.where(data > 0, 1.0 / data, data)
     return data    
 
 def readColor(t):
@@ -291,7 +283,7 @@ class ImageFalseColorOp(ImageOp):
         self.inverse = False
         self.pMax = -1
         self.pMin = -1
-        self.cmap = cm.get_cmap("viridis")
+        self.lut = VIRIDIS_LUT
         
     def readXML(self, n):
         ImageOp.readXML(self, n)
@@ -307,20 +299,14 @@ class ImageFalseColorOp(ImageOp):
         
     def loadIm(self):
         logger.debug("Complex load")
-        fig = plt.figure(figsize=((self.width/100.0), (self.height/100.0)), dpi=100)
         data = convertImage(self.pixelsHDR, self.height, 
                             self.width, self.inverse)
-        
-        if(self.inverse):
-            pRefLum = [0.0 if lum(p)==0 else 1.0/lum(p) for p in self.pixelsHDR]
-        else:
-            pRefLum = [lum(p) for p in self.pixelsHDR]
-        pRefLum.sort()
+        pRefLum = numpy.sort(data, axis=None)
         
         maxData = pRefLum[-1]
         minData = pRefLum[0]
 
-        logger.info("Find the min/max: ",str(minData),str(maxData))
+        logger.info("Find the min/max: %s %s", str(minData), str(maxData))
   
         
         if(self.pMax != -1):
@@ -333,18 +319,10 @@ class ImageFalseColorOp(ImageOp):
         if self.maxV != 10000.005454:
             maxData = self.maxV
             
-        logger.info("Used min/max: ",str(minData),str(maxData))
-        
-        # --- Save the figure
-        cax = plt.figimage(data, vmin=minData, vmax=maxData, cmap=self.cmap)
-        fig.savefig(wk + os.path.sep + self.output)#, bbox_inches=extent)
+        logger.info("Used min/max: %s %s", str(minData), str(maxData))
         
-        self.im = Image.open(wk + os.path.sep + self.output)
-        (widthN, heightN) = self.im.size
-        self.im = self.im.crop(((widthN-self.width), 
-                                (heightN-self.height),
-                                self.width,
-                                self.height))
+        # --- False color image (the image is saved by generate)
+        self.im = falseColorImage(data, self.lut, minData, maxData)
         
 class ImageFalseColorNBPathsOp(ImageFalseColorOp):
     def __init__(self):
@@ -407,7 +385,7 @@ class ImagePNDiffOp(ImageFalseColorOp):
     def readXML(self, n):
         ImageFalseColorOp.readXML(self, n)
         self.ref = n.attrib["ref"]
-        self.cmap = None
+        self.lut = None
     
     def loadHDR(self, wk):
         ImageFalseColorOp.loadHDR(self, wk)
@@ -0,0 +1,99 @@
+"""
+Build manifest of the HTML report generated by run_html.py
+
+The manifest is a JSON sidecar inside the output directory.
+For each generated artifact (images, js directory) it records what
+the artifact was built from: the operation, the exposure and the
+fingerprints (path, size, mtime) of the input images.
+An artifact is only rebuilt if this record changed or if it is missing.
+"""
+
+import os
+import json
+import hashlib
+import logging
+
+import rgbe.container
+
+logger = logging.getLogger(__name__)
+
+MANIFEST_NAME = ".html_manifest.json"
+MANIFEST_VERSION = 1
+
+def fingerprint(path):
+    """Identity of an input image or None if it does not exist
+    The image can also be inside an iteration dump container"""
+    try:
+        st = os.stat(path)
+    except OSError:
+        entry = rgbe.container.find_entry(path)
+        if(entry is None):
+            return None
+        return entry.identity()
+    return "|".join([os.path.abspath(path), str(st.st_size), str(st.st_mtime_ns)])
+
+def directoryFingerprint(directory):
+    """Hash of the identity of all the files inside a directory"""
+    h = hashlib.sha1()
+    for root, dirs, files in os.walk(directory):
+        dirs.sort()
+        for name in sorted(files):
+            path = os.path.join(root, name)
+            st = os.stat(path)
+            h.update("|".join([os.path.relpath(path, directory), str(st.st_size),
+                               str(st.st_mtime_ns)]).encode("utf-8"))
+    return h.hexdigest()
+
+class BuildManifest:
+    def __init__(self, filename):
+        self.filename = filename
+        self.directory = os.path.dirname(os.path.abspath(filename))
+        self.entries = {}
+        self.modified = False
+        self.load()
+
+    def load(self):
+        if(not os.path.exists(self.filename)):
+            return
+        try:
+            with open(self.filename, "r") as f:
+                content = json.load(f)
+            if(content["version"] != MANIFEST_VERSION):
+                logger.warning("Build manifest version mismatch, rebuild all: " + self.filename)
+                return
+            self.entries = content["artifacts"]
+        except (ValueError, KeyError, TypeError):
+            logger.warning("Build manifest corrupted, rebuild all: " + self.filename)
+            self.entries = {}
+
+    def save(self):
+        if(not self.modified):
+            return
+        # Write into a temporary file first to never leave a truncated manifest
+        tmpFile = self.filename + ".tmp"
+        with open(tmpFile, "w") as f:
+            json.dump({"version": MANIFEST_VERSION, "artifacts": self.entries}, f, indent=1, sort_keys=True)
+        os.replace(tmpFile, self.filename)
+        self.modified = False
+
+    def clear(self):
+        self.entries = {}
+        self.modified = True
+
+    def name(self, artifact):
+        return os.path.relpath(os.path.abspath(artifact), self.directory)
+
+    def isUpToDate(self, artifact, record):
+        """True if the artifact exists and was built from the same record
+        (a record with a missing input is never up to date)"""
+        if(None in record.get("inputs", []) or not os.path.exists(artifact)):
+            return False
+        return self.entries.get(self.name(artifact)) == record
+
+    def update(self, artifact, record):
+        self.entries[self.name(artifact)] = record
+        self.modified = True
+
+    def remove(self, artifact):
+        if(self.entries.pop(self.name(artifact), None) is not None):
+            self.modified = True
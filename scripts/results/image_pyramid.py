@@ -0,0 +1,75 @@
+"""
+Multi-resolution tiled pyramids of the report images (run_html.py -T)
+
+<image>.png -> <image>_tiles/<level>/<col>_<row>.png
+Level 0 is the full resolution, each level halves the previous one
+(2x2 box filter) until the whole image fits inside one tile.
+The tiles are read by the viewer data/js/tiled-compare.js.
+"""
+
+import os
+import shutil
+import numpy
+from concurrent.futures import ThreadPoolExecutor
+try:
+    import Image
+except ImportError:
+    from PIL import Image
+
+TILE_SIZE = 256
+
+def tilesDir(imagePath):
+    return os.path.splitext(imagePath)[0] + "_tiles"
+
+def nbLevels(width, height, tileSize=TILE_SIZE):
+    """Number of levels of the pyramid of an image"""
+    levels = 1
+    while(max(width, height) > tileSize):
+        width = (width + 1) // 2
+        height = (height + 1) // 2
+        levels += 1
+    return levels
+
+def downsample(pixels):
+    """Half resolution image (2x2 box filter, an odd last row/column is repeated)"""
+    p = pixels.astype(numpy.uint16)
+    if(p.shape[0] % 2 == 1):
+        p = numpy.concatenate([p, p[-1:]], axis=0)
+    if(p.shape[1] % 2 == 1):
+        p = numpy.concatenate([p, p[:, -1:]], axis=1)
+    p = p[0::2, 0::2] + p[1::2, 0::2] + p[0::2, 1::2] + p[1::2, 1::2]
+    return ((p + 2) // 4).astype(numpy.uint8)
+
+def levelTiles(pixels, tileSize=TILE_SIZE):
+    """(col, row, tile array) of all the tiles of a level"""
+    height, width = pixels.shape[:2]
+    for row in range((height + tileSize - 1) // tileSize):
+        for col in range((width + tileSize - 1) // tileSize):
+            yield col, row, pixels[row*tileSize:(row+1)*tileSize, col*tileSize:(col+1)*tileSize]
+
+def saveTile(path, tile):
+    Image.fromarray(numpy.ascontiguousarray(tile), "RGB").save(path)
+
+def buildPyramid(imagePath, tileSize=TILE_SIZE, nbThreads=1):
+    """
+    Write the tiled pyramid of an image (the previous tiles are removed)
+    :param nbThreads: number of tiles encoded at the same time
+    :return: the number of levels
+    """
+    pixels = numpy.asarray(Image.open(imagePath).convert("RGB"))
+    directory = tilesDir(imagePath)
+    if(os.path.exists(directory)):
+        shutil.rmtree(directory)
+
+    levels = nbLevels(pixels.shape[1], pixels.shape[0], tileSize)
+    with ThreadPoolExecutor(max_workers=max(1, nbThreads)) as pool:
+        tasks = []
+        for level in range(levels):
+            levelDir = directory + os.path.sep + str(level)
+            os.makedirs(levelDir)
+            for col, row, tile in levelTiles(pixels, tileSize):
+                tasks.append(pool.submit(saveTile, levelDir + os.path.sep + "%i_%i.png" % (col, row), tile))
+            pixels = downsample(pixels)
+        for task in tasks:
+            task.result() # Raise the encoding errors
+    return levels
@@ -1,18 +1,13 @@
 import optparse
-import glob
-import os
+import dir_index
+import time_index
 
 def nbIter(filename, timeLimit):
+    """Number of iterations to reach the time limit (0: all the iterations)"""
+    index = time_index.TimeIndex.fromCSV(filename)
     if(timeLimit == 0.0):
-        return len(open(filename, "r").readlines())
-    else:
-        lines = open(filename, "r").readlines()
-        times = [float(v.replace(",\n", "")) for v in lines]
-        cum, nb = 0, 0
-        while(cum < timeLimit and nb < len(times)):
-            cum += times[nb]
-            nb += 1
-        return nb
+        return len(index)
+    return index.iterationsToReach(timeLimit)
 
 if __name__=="__main__":
     parser = optparse.OptionParser()
@@ -22,10 +17,9 @@ if __name__=="__main__":
     (opts, args) = parser.parse_args()
 
     time = float(opts.time)
-    csvFiles = glob.glob(opts.input+os.path.sep+"*_time.csv")
+    csvFiles = dir_index.getIndex(opts.input).match("*_time.csv")
     for techCSV in csvFiles:
         if opts.name in techCSV:
-            f = open(techCSV, "r")
             print("======================")
             print("======================")
             print(techCSV)
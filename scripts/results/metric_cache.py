@@ -0,0 +1,132 @@
+"""
+Persistent cache of the image metrics computed by run_mse.py
+
+The cache is a JSON sidecar inside the output (res*) directory.
+An entry is keyed by the image identity (path, size, mtime),
+the reference content hash, the exposure multiplier and the percentage.
+The number of entries is bounded: the least recently used are evicted.
+"""
+
+import os
+import json
+import hashlib
+import collections
+import logging
+
+logger = logging.getLogger(__name__)
+
+CACHE_NAME = "metrics_cache.json"
+CACHE_VERSION = 1
+
+def fileHash(filename, blockSize=1 << 20):
+    """Content hash (sha1) of a file"""
+    h = hashlib.sha1()
+    with open(filename, "rb") as f:
+        block = f.read(blockSize)
+        while block:
+            h.update(block)
+            block = f.read(blockSize)
+    return h.hexdigest()
+
+class MetricCache:
+    def __init__(self, filename, maxEntries=200000, readOnly=False):
+        self.filename = filename
+        self.maxEntries = maxEntries
+        self.readOnly = readOnly # The new entries are only kept in memory
+        self.entries = collections.OrderedDict()
+        self.added = []
+        self.hits = 0
+        self.misses = 0
+        self.modified = False
+        self.load()
+
+    def load(self):
+        if(not os.path.exists(self.filename)):
+            return
+        try:
+            with open(self.filename, "r") as f:
+                content = json.load(f)
+            if(content["version"] != CACHE_VERSION):
+                logger.warning("Metric cache version mismatch, ignore it: " + self.filename)
+                return
+            for k, v in content["entries"]:
+                self.entries[k] = v
+        except (ValueError, KeyError, TypeError):
+            logger.warning("Metric cache corrupted, ignore it: " + self.filename)
+            self.entries.clear()
+
+    def save(self):
+        if(not self.modified or self.readOnly):
+            return
+        # Write into a temporary file first to never leave a truncated cache
+        tmpFile = self.filename + ".tmp"
+        with open(tmpFile, "w") as f:
+            json.dump({"version": CACHE_VERSION,
+                       "entries": list(self.entries.items())}, f)
+        os.replace(tmpFile, self.filename)
+        self.modified = False
+
+    @staticmethod
+    def key(image, refHash, mult, percentage, variant=""):
+        """Return the key of the image or None if the image does not exist
+        The image can also be a container entry (rgbe.container.Entry)
+        :param variant: computation giving other values (up to the rounding)"""
+        if(hasattr(image, "identity")):
+            identity = image.identity()
+        else:
+            try:
+                st = os.stat(image)
+            except OSError:
+                return None
+            identity = "|".join([os.path.abspath(image), str(st.st_size), str(st.st_mtime_ns)])
+        key = "|".join([identity, refHash, repr(float(mult)), repr(float(percentage))])
+        if(variant != ""):
+            key += "|" + variant
+        return key
+
+    def get(self, key):
+        """Return the cached metrics or None"""
+        if(key is None or key not in self.entries):
+            self.misses += 1
+            return None
+        self.hits += 1
+        self.entries.move_to_end(key)
+        return tuple(self.entries[key])
+
+    def put(self, key, metrics):
+        if(key is None):
+            return
+        self.entries[key] = list(metrics)
+        self.entries.move_to_end(key)
+        if(self.readOnly):
+            self.added.append((key, list(metrics)))
+        while(len(self.entries) > self.maxEntries):
+            self.entries.popitem(last=False)
+        self.modified = True
+
+    def popUpdates(self):
+        """Return and reset (new entries, hits, misses) of a read only cache
+        (used by the worker processes, see merge)"""
+        updates = (self.added, self.hits, self.misses)
+        self.added = []
+        self.hits = 0
+        self.misses = 0
+        return updates
+
+    def merge(self, updates):
+        """Add the updates of a read only cache (see popUpdates)"""
+        added, hits, misses = updates
+        for key, metrics in added:
+            self.put(key, metrics)
+        self.hits += hits
+        self.misses += misses
+
+    def hitRate(self):
+        lookups = self.hits + self.misses
+        if(lookups == 0):
+            return 0.0
+        return float(self.hits) / lookups
+
+    def report(self):
+        print("[INFO] Metric cache: %i hits / %i lookups (%.1f%%), %i entries" %
+              (self.hits, self.hits + self.misses, 100.0*self.hitRate(), len(self.entries)))
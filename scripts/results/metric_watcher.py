@@ -0,0 +1,393 @@
+"""
+Metrics computed while the techniques are rendered (render-while-scoring)
+
+The watcher follows the rendering directory (output of run_batch.py).
+The image of the iteration i is complete when <tech>_time.csv has i rows:
+the renderer writes the time of an iteration after its images. Each
+complete image is scored against the reference and its metrics are
+appended to the CSV files of run_mse.py (same names and content), so the
+curves are up to date when the renderings end. When the watcher stops,
+the images left (rendering killed during an iteration) are scored as
+run_mse.py does.
+
+The directory is followed with inotify (Linux, through ctypes) and polled
+when inotify is not available. It is only listed again when a time file
+is created (every DISCOVER_INTERVAL seconds when polled). The watcher
+runs with a low priority, so it only uses the cores left by the
+renderings. The scored images are added to the metric cache: run_mse.py
+does not compute them again.
+"""
+
+import os
+import sys
+import time
+import math
+import ctypes
+import ctypes.util
+import select
+import signal
+import struct
+import optparse
+import multiprocessing
+
+import msetools
+import metric_cache
+import dir_index
+import time_index
+import run_mse
+import rgbe.image
+
+# Events of the rendering directory waking up the watcher
+IN_MODIFY = 0x002
+IN_CLOSE_WRITE = 0x008
+IN_MOVED_TO = 0x080
+IN_CREATE = 0x100
+IN_DELETE = 0x200
+
+# struct inotify_event (followed by the name, padded with \0)
+INOTIFY_EVENT = struct.Struct("iIII")
+
+# Without inotify events, the techniques are searched again at this interval (sec)
+DISCOVER_INTERVAL = 5.0
+
+class Inotify:
+    """inotify watch of a directory
+    :raise OSError: if inotify is not available"""
+    def __init__(self, directory):
+        libc = ctypes.CDLL(ctypes.util.find_library("c") or "libc.so.6", use_errno=True)
+        if(not hasattr(libc, "inotify_init1")):
+            raise OSError("inotify is not available")
+        self.fd = libc.inotify_init1(os.O_NONBLOCK | os.O_CLOEXEC)
+        if(self.fd < 0):
+            raise OSError(ctypes.get_errno(), "inotify_init1 failed")
+        mask = IN_MODIFY | IN_CLOSE_WRITE | IN_MOVED_TO | IN_CREATE | IN_DELETE
+        if(libc.inotify_add_watch(self.fd, os.fsencode(directory), mask) < 0):
+            error = ctypes.get_errno()
+            os.close(self.fd)
+            raise OSError(error, "inotify_add_watch failed: " + directory)
+
+    def wait(self, timeout):
+        """Wait for changes (at most timeout seconds)
+        :return: events (mask, file name) (empty if nothing changed)"""
+        ready, _, _ = select.select([self.fd], [], [], timeout)
+        if(not ready):
+            return []
+        names = []
+        try:
+            while(True):
+                data = os.read(self.fd, 65536)
+                if(not data):
+                    break
+                offset = 0
+                while(offset + INOTIFY_EVENT.size <= len(data)):
+                    _, mask, _, length = INOTIFY_EVENT.unpack_from(data, offset)
+                    offset += INOTIFY_EVENT.size
+                    names.append((mask, os.fsdecode(data[offset:offset+length].rstrip(b"\0"))))
+                    offset += length
+        except BlockingIOError:
+            pass
+        return names
+
+    def close(self):
+        os.close(self.fd)
+
+class DirectoryWaiter:
+    """Wait for the changes of a directory (inotify, else polling)"""
+    def __init__(self, directory, pollInterval=1.0):
+        self.directory = directory
+        self.pollInterval = pollInterval
+        self.inotify = None
+        self.polling = False
+
+    def wait(self):
+        """:return: events (mask, file name), None if they are not known
+        (polling, or the files created before the watch started)"""
+        if(self.inotify is None and not self.polling and os.path.isdir(self.directory)):
+            try:
+                self.inotify = Inotify(self.directory)
+                return None
+            except OSError as e:
+                print("[WARN] No inotify (" + str(e) + "), the directory is polled")
+                self.polling = True
+        if(self.inotify is not None):
+            return self.inotify.wait(self.pollInterval)
+        time.sleep(self.pollInterval)
+        return None
+
+    def close(self):
+        if(self.inotify is not None):
+            self.inotify.close()
+            self.inotify = None
+
+class TimeRows:
+    """Number of complete rows of a file written by the renderer
+    (only the new content is read)"""
+    def __init__(self, filename):
+        self.filename = filename
+        self.offset = 0
+        self.rows = 0
+
+    def update(self):
+        """:return: False if the file was written again from the beginning"""
+        try:
+            size = os.path.getsize(self.filename)
+        except OSError:
+            size = 0
+        if(size < self.offset):
+            self.offset, self.rows = 0, 0
+            return False
+        if(size > self.offset):
+            with open(self.filename, "rb") as f:
+                f.seek(self.offset)
+                data = f.read(size - self.offset)
+            # The last line can be incomplete: read it again later
+            end = data.rfind(b"\n") + 1
+            self.rows += data.count(b"\n", 0, end)
+            self.offset += end
+        return True
+
+class OutputWatch:
+    """Metrics of the images of a (technique, prefix) pair"""
+    def __init__(self, inputDir, tech, prefix, outputCSV, step):
+        self.filename = inputDir + os.path.sep + run_mse.imagesBaseName(tech, prefix)
+        self.nameBase = run_mse.imagesBaseName(tech, prefix)
+        self.outputCSV = outputCSV
+        self.step = step
+        self.reset()
+
+    def reset(self):
+        """The technique is rendered again: the CSV files are rewritten"""
+        self.next = self.step
+        self.files = None
+
+    def image(self, iteration):
+        return self.filename + str(iteration) + ".hdr"
+
+    def ready(self, rows):
+        """Images not scored yet with rows iterations done"""
+        if(self.files is None and not os.path.exists(self.image(self.step))):
+            return [] # No image for this prefix (yet)
+        return [self.image(i) for i in range(self.next, rows + 1, self.step)]
+
+    def append(self, metrics):
+        if(self.files is None):
+            directory = os.path.dirname(self.outputCSV[0])
+            if(not os.path.exists(directory)):
+                os.makedirs(directory)
+            self.files = [open(output, "w") for output in self.outputCSV]
+        for j in range(len(self.files)):
+            self.files[j].write(str(metrics[j]) + ',\n')
+            self.files[j].flush()
+        self.next += self.step
+
+    def close(self):
+        if(self.files is not None):
+            for f in self.files:
+                f.close()
+
+class MetricWatcher:
+    def __init__(self, inputDir, outputDir, reference, rules, step=1, techniques=None,
+                 mult=1.0, percentage=1.0, window=1, cache=None):
+        """
+        :param rules: outputs of each technique (run_mse.loadRules)
+        :param techniques: techniques to follow (None: all the techniques of inputDir)
+        """
+        self.inputDir = inputDir
+        self.outputDir = outputDir
+        self.rules = rules
+        self.step = step
+        self.techniques = techniques
+        self.mult = mult
+        self.percentage = percentage
+        self.window = window
+        self.cache = cache
+        (self.w,self.h),self.pRef = rgbe.image.read_array(reference)
+        self.refHash = metric_cache.fileHash(reference) if cache is not None else None
+        self.times = {} # tech -> TimeRows
+        self.outputs = {} # tech -> [OutputWatch]
+        self.nbScored = 0
+        self.lastDiscover = None
+
+    def follow(self, tech):
+        outputName = run_mse.findName(self.rules, tech)
+        if(outputName == ""):
+            print("[WARN] No output mapping is given for the technique", tech)
+        self.times[tech] = TimeRows(self.inputDir + os.path.sep + tech + "_time.csv")
+        step = time_index.techniqueStep(tech, self.step)
+        self.outputs[tech] = [OutputWatch(self.inputDir, tech, prefix,
+                                          [self.outputDir + os.path.sep + run_mse.outputBaseName(tech, out) + name
+                                           for name in msetools.CSVNames], step)
+                              for prefix, out in (self.rules[outputName].items() if outputName else [])]
+
+    def needDiscover(self, changed):
+        """The techniques have to be searched again
+        :param changed: inotify events (mask, file name) (None if not known)"""
+        if(self.techniques is not None and len(self.times) == len(self.techniques)):
+            return False
+        if(self.lastDiscover is None):
+            return True
+        if(changed is None):
+            return time.time() - self.lastDiscover >= DISCOVER_INTERVAL
+        return any(mask & (IN_CREATE | IN_MOVED_TO) and name.endswith("_time.csv")
+                   for mask, name in changed)
+
+    def discover(self, index=None):
+        if(not os.path.isdir(self.inputDir)):
+            return
+        self.lastDiscover = time.time()
+        techniques = self.techniques
+        if(techniques is None):
+            # The renderer is writing inside the directory: no index cache
+            if(index is None):
+                index = dir_index.getIndex(self.inputDir, useCache=False)
+            techniques = index.techniques()
+        for tech in techniques:
+            if(tech not in self.times):
+                print("[INFO] Follow the technique:", tech)
+                self.follow(tech)
+
+    def score(self, output, images):
+        if(self.cache is not None):
+            stream = msetools.iterMSEAllCached(images, self.w, self.h, self.pRef, self.refHash, self.cache,
+                                               self.percentage, self.mult, self.window)
+        else:
+            stream = msetools.iterMSEAll(images, self.w, self.h, self.pRef, self.percentage, self.mult, self.window)
+        for image, metrics in stream:
+            print(str(image) + ": " + str(metrics))
+            output.append(metrics)
+            self.nbScored += 1
+
+    def update(self, final=False, changed=None):
+        """
+        Score the complete images
+        :param final: the renderings are over, all the images are complete
+        :param changed: inotify events (mask, file name) since the last
+                        update (None if not known)
+        :return: True if an image was scored
+        """
+        index = None
+        if(final and os.path.isdir(self.inputDir)):
+            # Scanned once for all the outputs
+            index = dir_index.getIndex(self.inputDir, useCache=False)
+        if(final or self.needDiscover(changed)):
+            self.discover(index)
+        nbScored = self.nbScored
+        for tech, rows in self.times.items():
+            if(not rows.update()):
+                print("[INFO] The technique", tech, "is rendered again")
+                for output in self.outputs[tech]:
+                    output.close()
+                    output.reset()
+            for output in self.outputs[tech]:
+                last = rows.rows
+                if(index is not None):
+                    last = max(last, index.maxIteration(output.nameBase))
+                images = output.ready(last)
+                if(len(images) != 0):
+                    self.score(output, images)
+        return self.nbScored != nbScored
+
+    def close(self):
+        for outputs in self.outputs.values():
+            for output in outputs:
+                output.close()
+        if(self.cache is not None):
+            self.cache.save()
+
+def processAlive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+# Set by the signal handlers: finish the work and stop
+_stop = []
+
+def requestStop(signum, frame):
+    _stop.append(signum)
+
+def main(argv=None, context=None):
+    """Follow a rendering directory until the rendering process ends or
+    until the watcher is stopped (SIGTERM or SIGINT)"""
+    parser = optparse.OptionParser()
+    parser.add_option('-i', '--input', help="rendering directory (followed)", default=".")
+    parser.add_option('-o','--output',help='Output directory')
+    parser.add_option('-r','--reference',help='Reference image')
+    parser.add_option('-s','--step', default=1,help='Images step. If only 1 image is written out of 10 computed, this argument should be 10.')
+    parser.add_option('-t','--technique', help='technique name (default: all the techniques rendered)', default=[], action="append")
+    parser.add_option('-A','--automatic', help='automatic technique search (default)', default=False, action="store_true")
+    parser.add_option('-c','--config',help='Configure file for mapping technique and outputs', default="rules.xml")
+    parser.add_option('-e','--exposure', help='image exposure', default="0")
+    parser.add_option('-p','--percentage', help='min percentage pixels', default="1.0")
+    parser.add_option('-w','--window', help='number of images scored at the same time', default="1")
+    parser.add_option('-N','--nocache', help='disable the metric cache', default=False, action="store_true")
+    parser.add_option('-k','--cachesize', help='maximum number of entries inside the metric cache', default="200000")
+    parser.add_option('-P','--pid', help='stop when this process (the rendering) ends', default=None)
+    parser.add_option('-n','--nice', help='priority decrease of the watcher', default="10")
+    parser.add_option('-T','--poll', help='polling interval (sec) without inotify', default="1.0")
+    (opts, args) = parser.parse_args(argv)
+
+    if(opts.reference is None or opts.output is None):
+        print("[ERROR] Need the reference (-r) and the output directory (-o)")
+        sys.exit(1)
+    if("," in opts.exposure or "," in opts.percentage):
+        print("[ERROR] Only one exposure and one percentage can be followed")
+        sys.exit(1)
+
+    # The renderings keep the priority
+    if(hasattr(os, "nice")):
+        os.nice(int(opts.nice))
+    signal.signal(signal.SIGTERM, requestStop)
+    signal.signal(signal.SIGINT, requestStop)
+
+    cache = None
+    if(not opts.nocache):
+        if(not os.path.exists(opts.output)):
+            os.makedirs(opts.output)
+        cache = metric_cache.MetricCache(opts.output+os.path.sep+metric_cache.CACHE_NAME, int(opts.cachesize))
+    watcher = MetricWatcher(opts.input, opts.output, opts.reference, run_mse.loadRules(opts.config),
+                            int(opts.step), opts.technique if len(opts.technique) != 0 else None,
+                            float(math.pow(2, float(opts.exposure))), float(opts.percentage),
+                            int(opts.window), cache)
+    waiter = DirectoryWaiter(opts.input, float(opts.poll))
+    pid = int(opts.pid) if opts.pid is not None else None
+    print("[INFO] Follow the directory:", opts.input)
+    changed = None
+    try:
+        while(True):
+            finished = len(_stop) != 0 or (pid is not None and not processAlive(pid))
+            scored = watcher.update(final=finished, changed=changed)
+            if(finished):
+                break
+            # Nothing new is known if the watcher did not wait
+            changed = [] if scored else waiter.wait()
+    finally:
+        waiter.close()
+        watcher.close()
+    print("[INFO] Watcher stopped,", watcher.nbScored, "images scored")
+    if(cache is not None):
+        cache.report()
+
+class Watching:
+    """Run the watcher in a background process during a with block
+    (it scores the images left when the block ends)"""
+    def __init__(self, argv):
+        self.argv = list(argv)
+        self.process = None
+
+    def __enter__(self):
+        self.process = multiprocessing.Process(target=main, args=(self.argv,))
+        self.process.start()
+        return self
+
+    def __exit__(self, excType, excValue, traceback):
+        if(self.process.is_alive()):
+            self.process.terminate()
+        self.process.join()
+        return False
+
+if __name__=="__main__":
+    main()
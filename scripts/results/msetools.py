@@ -1,9 +1,16 @@
 import optparse
+import os
+import collections
+from concurrent.futures import ThreadPoolExecutor
+import numpy
+import metric_cache
 
 # Import to read rgbe images
 import rgbe.io
 import rgbe.fast
 import rgbe.utils
+import rgbe.image
+import rgbe.container
 try:
     import Image
 except ImportError:
@@ -14,7 +21,7 @@ CSVNames = ["_mse.csv", "_rmse.csv", "_mseLog.csv", "_rmseLog.csv", "_tvi.csv",
 
 # === Constants
 def diffImageRef(currImage, pRef, mult, metricType, maskImage = "", outputImage = ""):
-    (w,h),pCur = rgbe.io.read(currImage)
+    (w,h),pCur = rgbe.image.read_array(currImage)
     
     # Load mask if necessary
     mask = None
@@ -34,7 +41,7 @@ def diffImageRef(currImage, pRef, mult, metricType, maskImage = "", outputImage
     return rmsevalue
 
 def diffImage(currImage, finalImage, mult, metricType=0, maskImage = "", outputImage = "", all=False):
-    (w,h),pRef = rgbe.io.read(finalImage)
+    (w,h),pRef = rgbe.image.read_array(finalImage)
     if(all):
         #FIXME: Make the error management
         metrics = rgbe.fast.rmse_all_images(w,h, [currImage], pRef, mult, None)
@@ -43,7 +50,179 @@ def diffImage(currImage, finalImage, mult, metricType=0, maskImage = "", outputI
     else:
         return diffImageRef(currImage, pRef, mult, metricType, maskImage, outputImage)
 
-def computeMSEAll(filename, nbImages, steps, finalImage, percentage = 1.0, outputs=[], mult=1,  maskImg = ''):
+def scoreImage(image, w, h, pRef, mult, percentage):
+    """Metrics of one image (path or rgbe.container.Entry)"""
+    if(isinstance(image, rgbe.container.Entry)):
+        path = image.native_path()
+        if(path is None):
+            # Compressed entry: decoded here and given as an array
+            try:
+                (wImg,hImg),p = image.read_array()
+            except IOError:
+                return (-1.0,)*len(CSVNames)
+            if((wImg,hImg) != (w,h)):
+                return (-1.0,)*len(CSVNames)
+            return rgbe.fast.rmse_image(w, h, p, pRef, mult, percentage)
+        image = path
+    return rgbe.fast.rmse_image(w, h, image, pRef, mult, percentage)
+
+def iterMSEAll(imagesHDR, w, h, pRef, percentage = 1.0, mult = 1, window = 0):
+    """
+    Generator over the metric computation: yield (image, metrics)
+    in the order of imagesHDR, as soon as the metrics are computed.
+    Only window images are decoded and scored at the same time
+    (bounded memory), imagesHDR can be any iterable (even a lazy one).
+    :param window: number of images in flight (0: number of cores)
+    """
+    if(window <= 0):
+        window = os.cpu_count() or 1
+
+    # The reference is converted once and used in place by rgbe.fast
+    # For the percentage metric, rgbe.fast also scales the images by mult
+    pRef = numpy.ascontiguousarray(pRef, dtype=numpy.float64)
+    if(percentage == 1.0 and mult != 1.0):
+        pRef = pRef * mult
+        mult = 1.0
+
+    pending = collections.deque()
+    with ThreadPoolExecutor(max_workers=window) as pool:
+        for image in imagesHDR:
+            pending.append((image, pool.submit(scoreImage, image, w, h, pRef, mult, percentage)))
+            if(len(pending) >= window):
+                image, future = pending.popleft()
+                yield image, future.result()
+        while(len(pending) != 0):
+            image, future = pending.popleft()
+            yield image, future.result()
+
+def iterMSEAllCached(imagesHDR, w, h, pRef, refHash, cache, percentage = 1.0, mult = 1, window = 0):
+    """
+    Same as iterMSEAll but the metrics found inside the cache
+    (metric_cache.MetricCache) are not computed again
+    :param refHash: content hash of the reference image
+    """
+    imagesHDR = list(imagesHDR)
+    keys = [cache.key(image, refHash, mult, percentage) for image in imagesHDR]
+    cached = [cache.get(k) for k in keys]
+
+    # Only the images not found inside the cache are scored
+    toCompute = (imagesHDR[i] for i in range(len(imagesHDR)) if cached[i] is None)
+    computed = iterMSEAll(toCompute, w, h, pRef, percentage, mult, window)
+    for i in range(len(imagesHDR)):
+        if(cached[i] is not None):
+            yield imagesHDR[i], cached[i]
+        else:
+            image, metricsImage = next(computed)
+            if(metricsImage[0] != -1):
+                cache.put(keys[i], metricsImage)
+            yield image, metricsImage
+
+def listImages(filename, nbImages, steps):
+    """Images <filename><i>.hdr. If the iteration dump container
+    of filename exists, its entries are used instead of the files"""
+    container = rgbe.container.find_container(filename)
+
+    imagesHDR = []
+    i = steps
+    while i <= nbImages:
+        if(container is not None and i in container):
+            imagesHDR.append(container.entry(i))
+        else:
+            imagesHDR.append(filename + str(i) + '.hdr')
+        i += steps
+    return imagesHDR
+
+def computeMSEMulti(filename, nbImages, steps, finalImage, mults, percentages, outputs, window = 0, ref = None,
+                    cache = None, refHash = None):
+    """
+    Compute the metrics for several exposures (mults) and percentages
+    in a single pass over the images (each image is read once).
+    outputs[idMult * len(percentages) + idPercentage] is the list
+    of the CSV files of this configuration.
+    The mults are applied as computeMSEAll does: only the reference
+    is scaled with all the pixels (percentage 1), both the image and the
+    reference otherwise.
+    :param ref: reference already decoded ((w,h), array) (optional)
+    :param cache: metric cache (one entry per configuration), an image is
+                  scored only if one of its configurations is not cached
+    :param refHash: content hash of finalImage for the cache (optional)
+    Return a float32 array [image, configuration, metric]
+    """
+    # Read reference image
+    if(ref is None):
+        ref = rgbe.image.read_array(finalImage)
+    (w,h),pRef = ref
+    pRef = numpy.ascontiguousarray(pRef, dtype=numpy.float64)
+    imagesHDR = listImages(filename, nbImages, steps)
+
+    # The keys use the identity of the container entries (before
+    # they are replaced by their paths). The percentage 1 values are the
+    # same as computeMSEAll ones, not the other percentages (the pixels
+    # errors are not summed in the same order)
+    configs = [(m, p) for m in mults for p in percentages]
+    keys = None
+    if(cache is not None):
+        if(refHash is None):
+            refHash = metric_cache.fileHash(finalImage)
+        keys = [[cache.key(image, refHash, m, p, "" if p >= 1.0 else "multi") for m, p in configs]
+                for image in imagesHDR]
+
+    for i in range(len(imagesHDR)):
+        if(isinstance(imagesHDR[i], rgbe.container.Entry)):
+            if(imagesHDR[i].native_path() is None):
+                raise Exception("Compressed containers are not handled with several configurations: "
+                                + imagesHDR[i].container.path)
+            imagesHDR[i] = imagesHDR[i].native_path()
+
+    files = [[open(output,'w') for output in outputsConfig] for outputsConfig in outputs]
+
+    # Images are scored by chunks: the partial results
+    # are written as soon as a chunk is done
+    if(window <= 0):
+        window = os.cpu_count() or 1
+    metrics = []
+    for start in range(0, len(imagesHDR), window):
+        chunk = imagesHDR[start:start+window]
+        metricsChunk = numpy.zeros((len(chunk), len(configs), len(CSVNames)), dtype=numpy.float32)
+        toCompute = []
+        for i in range(len(chunk)):
+            cached = [cache.get(k) for k in keys[start+i]] if keys is not None else [None]
+            if(any(c is None for c in cached)):
+                toCompute.append(i)
+            else:
+                metricsChunk[i] = cached
+        if(len(toCompute) != 0):
+            computed = numpy.asarray(rgbe.fast.rmse_all_images_multi(w, h, [chunk[i] for i in toCompute], pRef,
+                                                                     [float(m) for m in mults],
+                                                                     [float(p) for p in percentages]))
+            for k, i in enumerate(toCompute):
+                metricsChunk[i] = computed[k]
+                if(keys is not None and computed[k, 0, 0] != -1):
+                    for idConfig in range(len(configs)):
+                        cache.put(keys[start+i][idConfig], computed[k, idConfig].tolist())
+        for i in range(len(chunk)):
+            print(str(chunk[i]) + ": " + str(metricsChunk[i].tolist()))
+            for idConfig in range(len(files)):
+                for j in range(len(files[idConfig])):
+                    files[idConfig][j].write(str(float(metricsChunk[i, idConfig, j])) + ',\n')
+                    files[idConfig][j].flush()
+        metrics.append(metricsChunk)
+
+    for filesConfig in files:
+        for f in filesConfig:
+            f.close()
+    if(len(metrics) == 0):
+        return numpy.zeros((0, len(mults)*len(percentages), len(CSVNames)), dtype=numpy.float32)
+    return numpy.concatenate(metrics)
+
+def computeMSEAll(filename, nbImages, steps, finalImage, percentage = 1.0, outputs=[], mult=1,  maskImg = '', window = 0, cache = None,
+                  ref = None, refHash = None):
+    """
+    :param ref: reference already decoded ((w,h), array) (optional)
+    :param refHash: content hash of finalImage for the cache (optional)
+    The new cache entries are not written to disk: the caller saves the
+    cache once all its images are scored.
+    """
     # === Open all files
     # These files will be used to log 
     # All the metric values
@@ -56,30 +235,40 @@ def computeMSEAll(filename, nbImages, steps, finalImage, percentage = 1.0, outpu
         raise Exception("Masked image are not handled yet")
 
     # Read reference image
-    (w,h),pRef = rgbe.io.read(finalImage)
+    # (the array is given directly to rgbe.fast)
+    if(ref is None):
+        ref = rgbe.image.read_array(finalImage)
+    (w,h),pRef = ref
 
     # List all HDR images
-    imagesHDR = []
-    i = steps
-    while i <= nbImages:
-        imagesHDR.append(filename + str(i) + '.hdr')
-        i += steps
+    imagesHDR = listImages(filename, nbImages, steps)
 
     # Debug
     #print(imagesHDR)
     #print("\n")
 
     # Launch the computation
-    if(percentage == 1.0):
-        metrics = rgbe.fast.rmse_all_images(w,h, imagesHDR, pRef, mult, None)
+    # Each result is written down as soon as it is available
+    # so a crash keeps the partial results
+    # If a cache is given, only the images not cached are scored
+    if(cache is not None):
+        if(refHash is None):
+            refHash = metric_cache.fileHash(finalImage)
+        stream = iterMSEAllCached(imagesHDR, w, h, pRef, refHash,
+                                  cache, percentage, mult, window)
     else:
-        metrics = rgbe.fast.rmse_all_images_percentage(w,h, percentage, imagesHDR, pRef, mult)
+        stream = iterMSEAll(imagesHDR, w, h, pRef, percentage, mult, window)
+
+    metrics = []
+    for image, metricsImage in stream:
+        print(str(image) + ": " + str(metricsImage))
+        for j in range(len(files)):
+            files[j].write(str(metricsImage[j]) + ',\n')
+            files[j].flush()
+        metrics.append(metricsImage)
 
-    if(len(files) != 0):
-        # Write down all files
-        for k in range(len(metrics)):
-            for j in range(len(metrics[0])):
-                files[j].write(str(metrics[k][j]) + ',\n')
+    for f in files:
+        f.close()
     return metrics
         
 if __name__ == "__main__":
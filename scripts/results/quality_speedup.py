@@ -0,0 +1,183 @@
+"""
+Equal quality speedups between the techniques of a result directory
+
+The error of each image (<tech>_relMSE.csv, <tech>_rmse.csv, ...
+computed by run_mse.py, one entry every step iterations) is associated
+with its render time (<tech>_time.csv, see time_index). The error is made
+monotone (best error reached so far) and interpolated in log-log space,
+which gives the time needed by the technique to reach any error level.
+
+For an error level e, the speedup of a technique A over a technique B
+is time_B(e) / time_A(e): above 1, A reaches the quality e faster.
+The matrices (one per error level) are written as JSON and as CSV
+(one line per pair and level), see writeJSON/writeCSV and loadJSON.
+"""
+
+import os
+import json
+import math
+import optparse
+import logging
+import numpy
+
+import csv_utils
+import dir_index
+import time_index
+
+logger = logging.getLogger(__name__)
+
+class QualityCurve:
+    """Monotone error vs time interpolant of a technique"""
+    def __init__(self, name, times, errors):
+        times = numpy.asarray(times, dtype=numpy.float64)
+        errors = numpy.asarray(errors, dtype=numpy.float64)
+        size = min(len(times), len(errors))
+        times, errors = times[:size], errors[:size]
+        keep = (times > 0.0) & (errors > 0.0) & numpy.isfinite(times) & numpy.isfinite(errors)
+        order = numpy.argsort(times[keep], kind="stable")
+        self.name = name
+        self.times = times[keep][order]
+        # Best error reached so far (non increasing)
+        self.errors = numpy.minimum.accumulate(errors[keep][order]) if keep.any() else errors[keep]
+
+    def isValid(self):
+        return len(self.times) > 0
+
+    def timeToReach(self, levels):
+        """Time needed to reach each error level (nan if never reached)"""
+        levels = numpy.atleast_1d(numpy.asarray(levels, dtype=numpy.float64))
+        res = numpy.full(levels.shape, numpy.nan)
+        if(not self.isValid()):
+            return res
+        # First image with an error <= level
+        j = numpy.searchsorted(-self.errors, -levels, side="left")
+        reached = j < len(self.errors)
+        first = reached & (j == 0)
+        res[first] = self.times[0]
+
+        inside = reached & (j > 0)
+        j = j[inside]
+        logE0, logE1 = numpy.log(self.errors[j - 1]), numpy.log(self.errors[j])
+        logT0, logT1 = numpy.log(self.times[j - 1]), numpy.log(self.times[j])
+        alpha = (numpy.log(levels[inside]) - logE0) / (logE1 - logE0)
+        res[inside] = numpy.exp(logT0 + alpha * (logT1 - logT0))
+        return res
+
+def loadCurve(inputDir, technique, step=1, metric="relMSE", column=0):
+    """QualityCurve of a technique (the error k is the image of
+    the iteration (k+1)*step, with the GPT/GBDPT step override)"""
+    index = time_index.TimeIndex.forTechnique(inputDir, technique, step)
+    errors = csv_utils.readCSVNumber(inputDir + os.path.sep + technique + "_" + metric + ".csv", column)
+    nbImages = min(len(errors), index.nbImages())
+    times = [index.timeAt((k + 1) * index.step) for k in range(nbImages)]
+    return QualityCurve(technique, times, errors[:nbImages])
+
+def defaultLevels(curves, nbLevels=8):
+    """Error levels reached by all the techniques (log spaced between
+    the worst final error and the best initial error)"""
+    valid = [c for c in curves if c.isValid()]
+    if(len(valid) == 0):
+        return numpy.zeros(0)
+    low = max(c.errors[-1] for c in valid)
+    high = min(c.errors[0] for c in valid)
+    if(high <= low):
+        return numpy.array([low])
+    return numpy.geomspace(high, low, nbLevels)
+
+def speedupMatrix(curves, levels):
+    """
+    :return: (times [technique, level], speedups [level, A, B] = time_B / time_A)
+    """
+    times = numpy.array([c.timeToReach(levels) for c in curves]).reshape(len(curves), len(levels))
+    with numpy.errstate(divide="ignore", invalid="ignore"):
+        speedups = times.T[:, None, :] / times.T[:, :, None]
+    return times, speedups
+
+def meanSpeedups(speedups):
+    """Geometric mean over the levels of the speedups (nan levels ignored)"""
+    logs = numpy.log(speedups)
+    valid = numpy.isfinite(logs)
+    count = valid.sum(axis=0)
+    with numpy.errstate(invalid="ignore"):
+        return numpy.exp(numpy.where(valid, logs, 0.0).sum(axis=0) / count)
+
+def _json(values):
+    """nan -> null"""
+    if(isinstance(values, numpy.ndarray)):
+        values = values.tolist()
+    if(isinstance(values, list)):
+        return [_json(v) for v in values]
+    return None if math.isnan(values) else values
+
+def writeJSON(filename, metric, curves, levels, times, speedups):
+    content = {"metric": metric,
+               "techniques": [c.name for c in curves],
+               "levels": _json(numpy.asarray(levels)),
+               "times": _json(times),
+               "speedups": _json(speedups),
+               "meanSpeedups": _json(meanSpeedups(speedups))}
+    with open(filename, "w") as f:
+        json.dump(content, f, indent=1)
+
+def writeCSV(filename, curves, levels, times, speedups):
+    with open(filename, "w") as f:
+        f.write("#level,technique,other,time,otherTime,speedup\n")
+        for l, level in enumerate(levels):
+            for a, curveA in enumerate(curves):
+                for b, curveB in enumerate(curves):
+                    if(a == b):
+                        continue
+                    f.write("%g,%s,%s,%g,%g,%g\n" % (level, curveA.name, curveB.name,
+                                                     times[a][l], times[b][l], speedups[l][a][b]))
+
+def loadJSON(filename):
+    """Matrices written by writeJSON (null become nan arrays)"""
+    with open(filename, "r") as f:
+        content = json.load(f)
+    for key in ["levels", "times", "speedups", "meanSpeedups"]:
+        content[key] = numpy.array(content[key], dtype=numpy.float64)
+    return content
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    parser = optparse.OptionParser()
+    parser.add_option('-i','--input', help="result directory", default=".")
+    parser.add_option('-o','--output', help="output file base name (<output>.json and <output>.csv)", default="speedup")
+    parser.add_option('-m','--metric', help="error file (<tech>_<metric>.csv)", default="relMSE")
+    parser.add_option('-c','--column', help="column of the error file", default="0")
+    parser.add_option('-s','--step', default=1, help='Images step. If only 1 image is written out of 10 computed, this argument should be 10.')
+    parser.add_option('-t','--technique', help='technique name', default=[], action="append")
+    parser.add_option('-A','--automatic', help='all the techniques of the directory', default=False, action="store_true")
+    parser.add_option('-e','--level', help='target error level (default: log spaced levels)', default=[], action="append")
+    parser.add_option('-n','--nblevels', help='number of default levels', default="8")
+    (opts, args) = parser.parse_args()
+
+    techniques = list(opts.technique)
+    if(opts.automatic):
+        index = dir_index.getIndex(opts.input)
+        techniques += [t for t in index.techniques()
+                       if index.contains(t + "_" + opts.metric + ".csv") and t not in techniques]
+
+    curves = []
+    for tech in techniques:
+        curve = loadCurve(opts.input, tech, int(opts.step), opts.metric, int(opts.column))
+        if(curve.isValid()):
+            curves.append(curve)
+        else:
+            logger.warning("No error curve for the technique: " + tech)
+    if(len(curves) < 2):
+        logger.critical("Need at least two techniques, QUIT")
+        raise SystemExit(1)
+
+    if(len(opts.level) != 0):
+        levels = numpy.array([float(e) for e in opts.level])
+    else:
+        levels = defaultLevels(curves, int(opts.nblevels))
+    times, speedups = speedupMatrix(curves, levels)
+    writeJSON(opts.output + ".json", opts.metric, curves, levels, times, speedups)
+    writeCSV(opts.output + ".csv", curves, levels, times, speedups)
+
+    mean = meanSpeedups(speedups)
+    for a, curve in enumerate(curves):
+        logger.info("%s: %s", curve.name, " ".join("%.2f" % v for v in mean[a]))
+    logger.info("Written: %s.json %s.csv", opts.output, opts.output)
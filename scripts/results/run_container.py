@@ -0,0 +1,38 @@
+import optparse
+import os
+import re
+
+import rgbe.container
+
+def findNameBases(inputDir, techniques):
+    """
+    Find all the dumped images series (<TECH>_<prefix>_<iter>.hdr)
+    :param inputDir: the directory where there are the iterations
+    :param techniques: only the series of these techniques (all if empty)
+    :return: the series names (<TECH>_<prefix>_)
+    """
+    nameBases = set()
+    for entry in os.scandir(inputDir):
+        match = re.match(r"^(.*_)(\d+)\.hdr$", entry.name)
+        if(match is None):
+            continue
+        nameBase = match.group(1)
+        if(len(techniques) != 0 and not any(nameBase.startswith(t+"_") for t in techniques)):
+            continue
+        nameBases.add(nameBase)
+    return sorted(nameBases)
+
+if __name__=="__main__":
+    parser = optparse.OptionParser()
+    parser.add_option('-i', '--input', help="input directory", default=".")
+    parser.add_option('-t','--technique', help='technique name (all if not provided)', default=[], action="append")
+    parser.add_option('-z','--compress', help='compress the images (zlib)', default=False, action="store_true")
+    parser.add_option('-R','--remove', help='remove the images once they are inside the container', default=False, action="store_true")
+    (opts, args) = parser.parse_args()
+
+    for nameBase in findNameBases(opts.input, opts.technique):
+        path = opts.input + os.path.sep + nameBase
+        # <TECH>_<iter>.hdr: images of the technique without prefix
+        prefix = "" if os.path.exists(path + "time.csv") else None
+        nbAdded = rgbe.container.convert(path, opts.compress, opts.remove, prefix)
+        print("[INFO] "+rgbe.container.container_path(path, prefix)+": "+str(nbAdded)+" images added")
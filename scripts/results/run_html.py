@@ -7,28 +7,34 @@ import sys
 import datetime
 import logging
 import json
+import collections
+import numpy
+from concurrent.futures import ProcessPoolExecutor
 
-import matplotlib.pyplot as plt
+# Colormap of the error images (no matplotlib needed)
 import colormaps as cmaps
 
-plt.register_cmap(name='viridis', cmap=cmaps.viridis)
-plt.set_cmap(cmaps.viridis)
-
 # Python for reading XML files
 import xml.etree.ElementTree as ET
 
 # Other images !!!!
 import showResults
 import generateFigures
+import dir_index
+import html_manifest
+import curve_export
+import image_pyramid
 
 # To read the images
-import rgbe.io
 import rgbe.utils
+import rgbe.container
 try:
     import Image
 except ImportError:
     from PIL import Image
 
+VIRIDIS_LUT = rgbe.utils.lutFromColors(cmaps.colors["viridis"])
+
 ##########################################
 ##########################################
 ## HARD CODE HTML
@@ -51,10 +57,12 @@ htmlHead = """
 <meta http-equiv="Content-Language" content="English">
 
 <script type="text/javascript" src="./js/jquery.min.js"></script>
-<script type="text/javascript" src="./js/image-compare.js"></script>"""
+<script type="text/javascript" src="./js/image-compare.js"></script>
+<script type="text/javascript" src="./js/tiled-compare.js"></script>"""
 
 if(CHARTJS):
-    htmlHead += """<script type="text/javascript" src="./js/Chart.min.js"></script>"""
+    htmlHead += """<script type="text/javascript" src="./js/Chart.min.js"></script>
+<script type="text/javascript" src="./js/lazy-curves.js"></script>"""
 else:
     htmlHead += """<script src="./js/jquery.flot.js" type="text/javascript" language="javascript"></script>
 <script src="./js/jquery.flot.axislabels.js" type="text/javascript" language="javascript"></script>
@@ -81,6 +89,7 @@ htmlHead += """<script type="text/javascript" src="./js/Chart.min.js"></script>
 <script type="text/javascript">
     $(function () {
       $('.cross_compare').qcrosscompare();
+      $('.tiled_compare').qtiledcompare();
     });
     </script>
 <style type="text/css">
@@ -192,6 +201,17 @@ html4Way = """
     <img src="%%F4%%" alt="%%F4DESC%%" width="%%WIDTH%%" height="%%HEIGHT%%" style="display: none;">
 </div>
 """
+# Image pyramids (-T): only the visible tiles are loaded
+TILED_VIEW_WIDTH = 1024
+html4WayTiled = """
+<div class="tiled_compare" data-width="%%WIDTH%%" data-height="%%HEIGHT%%" data-levels="%%LEVELS%%" data-tile="%%TILE%%" style="width: %%VIEWWIDTH%%px; height: %%VIEWHEIGHT%%px; cursor: crosshair; overflow: hidden; position: relative;">
+    <canvas width="%%VIEWWIDTH%%" height="%%VIEWHEIGHT%%"></canvas>
+    <span data-tiles="%%F1%%" data-desc="%%F1DESC%%"></span>
+    <span data-tiles="%%F2%%" data-desc="%%F2DESC%%"></span>
+    <span data-tiles="%%F3%%" data-desc="%%F3DESC%%"></span>
+    <span data-tiles="%%F4%%" data-desc="%%F4DESC%%"></span>
+</div>
+"""
 htmlCaption = """
 <div class="caption"><b>%%TITLE%%</b>%%DESC%%</div>"""
 
@@ -199,25 +219,36 @@ htmlCaption = """
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
-def comparison4Way(techniques, imgAlias, output, w, h):
+def comparison4Way(techniques, imgAlias, output, w, h, tiled=False):
     """
     This method will fill the HTML pattern to generate meanfull GHMLT
     :param descripts: Array of description of the technqiues
     :param files: Array of the images files
     :param w: width of the images
     :param h: height of the images
+    :param tiled: use the image pyramids (tiled viewer)
     :return: the filled HTML code (str)
     """
-    rawHtml = html4Way
+    images = [t.images[imgAlias] for t in techniques[:4]]
+    if(tiled):
+        rawHtml = html4WayTiled
+        images = [image_pyramid.tilesDir(image) for image in images]
+        viewScale = min(1.0, float(TILED_VIEW_WIDTH) / w)
+        rawHtml = rawHtml.replace("%%VIEWWIDTH%%", str(int(round(w * viewScale))))
+        rawHtml = rawHtml.replace("%%VIEWHEIGHT%%", str(int(round(h * viewScale))))
+        rawHtml = rawHtml.replace("%%LEVELS%%", str(image_pyramid.nbLevels(w, h)))
+        rawHtml = rawHtml.replace("%%TILE%%", str(image_pyramid.TILE_SIZE))
+    else:
+        rawHtml = html4Way
     rawHtml = rawHtml.replace("%%WIDTH%%", str(w))
     rawHtml = rawHtml.replace("%%HEIGHT%%", str(h))
-    rawHtml = rawHtml.replace("%%F1%%", techniques[0].images[imgAlias].replace(output, "./"))
+    rawHtml = rawHtml.replace("%%F1%%", images[0].replace(output, "./"))
     rawHtml = rawHtml.replace("%%F1DESC%%", techniques[0].name)
-    rawHtml = rawHtml.replace("%%F2%%", techniques[1].images[imgAlias].replace(output, "./"))
+    rawHtml = rawHtml.replace("%%F2%%", images[1].replace(output, "./"))
     rawHtml = rawHtml.replace("%%F2DESC%%", techniques[1].name)
-    rawHtml = rawHtml.replace("%%F3%%", techniques[2].images[imgAlias].replace(output, "./"))
+    rawHtml = rawHtml.replace("%%F3%%", images[2].replace(output, "./"))
     rawHtml = rawHtml.replace("%%F3DESC%%", techniques[2].name)
-    rawHtml = rawHtml.replace("%%F4%%", techniques[3].images[imgAlias].replace(output, "./"))
+    rawHtml = rawHtml.replace("%%F4%%", images[3].replace(output, "./"))
     rawHtml = rawHtml.replace("%%F4DESC%%", techniques[3].name)
     return rawHtml
 
@@ -357,9 +388,7 @@ def readXMLComparisons(opts, file):
             rules.append((re.compile(r.attrib["pattern"]),
                           r.attrib["prefix"]))
 
-        import glob
-        allTech = glob.glob(opts.input+os.path.sep+"*_time.csv")
-        allTechName = [n.replace(opts.input+os.path.sep,"").replace("_time.csv", "") for n in allTech]
+        allTechName = dir_index.getIndex(opts.input).techniques()
         logger.info("List of all techniques: %s", str(allTechName))
 
         # Add reference
@@ -428,7 +457,7 @@ class SectionCurve:
             description = e.attrib["desc"]
         return SectionCurve(e.attrib["name"], description)
 
-    def HTMLcode(self, rep, entries, output, clampTime, step, techDict):
+    def HTMLcode(self, rep, entries, output, clampTime, step, techDict, maxPoints=0):
         # Create HTML code
         s = "<h2>"+self.title+"</h2>"
         if(self.description != ""):
@@ -436,7 +465,7 @@ class SectionCurve:
         
         # Generate JS
         for c in self.curves:
-            textJS = c.generateJS(rep, entries, clampTime, step, techDict)
+            textJS = c.generateJS(rep, entries, clampTime, step, techDict, output, maxPoints)
             
             # Write file
             file = open(output+os.path.sep+c.getName()+".js", "w")
@@ -490,7 +519,17 @@ class Curve:
             raise Exception("Problem to found the corresponding entry: " +  name)
         return idEntry
 
-    def generateJS(self, rep, entries, clampTime, step, techDict):
+    def seriesData(self, t, maxPoints=0):
+        """(x, y) of the technique curve, decimated to maxPoints (0: all the points)"""
+        if self.csv == "time":
+            x, y = t.constantSeriesX(self.log and not CHARTJS)
+        else:
+            x, y = t.x, t.y
+        return curve_export.decimate(x, y, maxPoints, self.log and CHARTJS)
+
+    def generateJS(self, rep, entries, clampTime, step, techDict, output, maxPoints=0):
+        """JS code of the curve. With Chart.js the data is written
+        in a separate file (output directory) loaded lazily"""
         # Create the list of techniques filenames
         listCSVFiles = []
         for e in entries:
@@ -525,15 +564,23 @@ class Curve:
                 else:
                     t.clampTime(math.log10(float(clampTime)))
 
+        # Decimate the curves
+        series = [self.seriesData(t, maxPoints) for t in techniques]
+
         # Generate the JS content
         if CHARTJS:
+            curve_export.writeCurveData(output+os.path.sep+self.getName()+curve_export.DATA_SUFFIX,
+                                        self.getName(), series)
             return self.generateJS_chart(entries, techniques)
         else:
-            return self.generateJS_flot(entries, techniques)
+            return self.generateJS_flot(entries, techniques, series)
 
     def generateJS_chart(self, entries, techniques):
-        totalText = "var ctx = document.getElementById('"+self.getName()+"').getContext('2d');\n"
-        totalText += "var chart"+self.getName()+" = new Chart.Scatter(ctx, {\n"
+        """Chart creation (when the data is loaded, see lazy-curves.js)"""
+        totalText = "var chart"+self.getName()+" = null;\n"
+        totalText += "lazyCurve('"+self.getName()+"', function(data) {\n"
+        totalText += "var ctx = document.getElementById('"+self.getName()+"').getContext('2d');\n"
+        totalText += "chart"+self.getName()+" = new Chart.Scatter(ctx, {\n"
         totalText += "  type: 'line', \n"
         totalText += "  data: {\n"
         totalText += "      datasets:["
@@ -553,22 +600,8 @@ class Curve:
             if(entries[idEntry].dashed):
                 totalText += '      borderDash: [5, 5],\n'
 
-            # Get the data
-            data = None
-            if self.csv == "time":
-                data = t.generateConstantDataX()
-            else:
-                data = t.generatePairData()
-
-            # add the data inside the JS
-            totalText += '      data:['
-            for iD in range(len(data)):
-                x, y = data[iD]
-                totalText += "\n"
-                totalText += "      {x: "+str(x)+", y: "+str(y)+"}"
-                if(iD != len(data)-1):
-                    totalText += ","
-            totalText += "]"
+            # The data comes from the lazy loaded file
+            totalText += '      data: curvePoints(data.x['+str(i)+'], data.y['+str(i)+'])'
             totalText += "}"
 
             if(i != len(techniques) - 1):
@@ -611,12 +644,15 @@ class Curve:
 
 
         # Close the end JS
-        totalText += '});'
+        totalText += '});\n});'
 
         # Function for show or hide all the curves
         totalText += """
         function """+self.getName()+"""Hide() {
     var ci = chart"""+self.getName()+""";
+	if(ci === null) {
+		return;
+	}
 	var nbEntries = ci.data.datasets.length;
 	for(var i = 0; i < nbEntries; i++) {
 		ci.data.datasets[i].hidden = true;
@@ -626,6 +662,9 @@ class Curve:
 
 function """+self.getName()+"""Show() {
     var ci = chart"""+self.getName()+""";
+	if(ci === null) {
+		return;
+	}
 	var nbEntries = ci.data.datasets.length;
 	for(var i = 0; i < nbEntries; i++) {
 		ci.data.datasets[i].hidden = false;
@@ -636,7 +675,7 @@ function """+self.getName()+"""Show() {
 
         return totalText
 
-    def generateJS_flot(self, entries, techniques):
+    def generateJS_flot(self, entries, techniques, series):
         # Generate JS file
         entryOrder = []
         totalText = '$(function() { $.plot("#'+self.getName()+'",['
@@ -651,13 +690,9 @@ function """+self.getName()+"""Show() {
             
             totalText += "{data: "
             
-            if self.csv == "time":
-                if self.log:
-                    totalText += str(t.generateConstantDataXLog())
-                else:
-                    totalText += str(t.generateConstantDataX())
-            else:
-                totalText += str(t.generatePairData())
+            x, y = series[i]
+            totalText += json.dumps([list(p) for p in zip(curve_export.compact(x), curve_export.compact(y))],
+                                    separators=(",", ":"))
             totalText += ', label: "' + entries[idEntry].name + '"'
             if(entries[idEntry].dashed):
                 totalText += ', dashes: { show: true }'
@@ -771,20 +806,39 @@ def readXMLCurves(file, techDict):
 
     return entries, sections
 
-def copyPixtoPil(pix, im):
-    pInt = [(int(c[0]*255),int(c[1]*255),int(c[2]*255)) for c in pix]
-    im.putdata(pInt)
+class ReferenceCache:
+    """
+    Decoded reference images of the run. Each reference is read
+    only once, then shared by all the techniques using it.
+    """
+    def __init__(self):
+        self.images = {}
+
+    def __contains__(self, path):
+        return path in self.images
+
+    def read(self, path):
+        """Return ((width, height), array) of the image (read only array)"""
+        if(path not in self.images):
+            (width,height),p = rgbe.container.read_array(path)
+            p.flags.writeable = False
+            self.images[path] = ((width,height),p)
+        return self.images[path]
 
 def readImage(opts, black_img,
               filenameHDR, filenameRefHDR,
-              filenameIMG, typeOp="tonemap", exposure=0.0):
+              filenameIMG, typeOp="tonemap", exposure=0.0, refCache=None):
     """Function responsible to read the image and to do the proper
     image operation. For now this function takes a lot of different parameters
-    for the different operation."""
+    for the different operation.
+    The references are taken from refCache (ReferenceCache) if provided."""
     #TODO: use kargs** for make the function more flexible
+    if(refCache is None):
+        refCache = ReferenceCache()
 
     # If there is no HDR, associate a black image
-    if(not os.path.exists(filenameHDR)):
+    # (the HDR can also be inside an iteration dump container)
+    if(not rgbe.container.exists(filenameHDR)):
         logger.critical("NO HDR FILE FOUND FOR: "+filenameHDR)
         return black_img
 
@@ -792,61 +846,115 @@ def readImage(opts, black_img,
         # Sometime, we do not want to generates the images...
         # So we may want skip it !
         if(typeOp == "tonemap"):
-            (width,height),p = rgbe.io.read(filenameHDR)
-            rgbe.utils.applyExposureGamma(p, exposure, 2.2)
+            if(filenameHDR in refCache):
+                (width,height),p = refCache.read(filenameHDR)
+            else:
+                (width,height),p = rgbe.container.read_array(filenameHDR)
+            p = rgbe.utils.exposureGammaArray(p, exposure, 2.2)
 
-            im = Image.new("RGB", (width,height))
-            copyPixtoPil(p, im)
+            im = Image.fromarray(rgbe.utils.toRGB8Array(p), "RGB")
             logger.info("Save "+filenameIMG)
             im.save(filenameIMG, optimize=True)
         elif(typeOp == "bias"):
             scaleNP = 1.0
             if(exposure != 0.0):
                 scaleNP = 1.0 / exposure
-            generateFigures.saveNPImageRef(filenameHDR,filenameRefHDR,
-                                           filenameIMG, scaleNP)
+            (wRef,hRef),pRef = refCache.read(filenameRefHDR)
+            generateFigures.saveNPImage(filenameHDR, pRef,
+                                        filenameIMG, scaleNP)
         elif(typeOp == "error"):
             ################ COMPUTE ERROR
-            (wRef,hRef),pRef = rgbe.io.read(filenameRefHDR)
-            (width,height),pixelsHDR = rgbe.io.read(filenameHDR)
+            (wRef,hRef),pRef = refCache.read(filenameRefHDR)
+            (width,height),pixelsHDR = rgbe.container.read_array(filenameHDR)
             if(exposure != 0.0):
-                rgbe.utils.applyExposureGamma(pRef, exposure, 1.0)
-                rgbe.utils.applyExposureGamma(pixelsHDR, exposure, 1.0)
+                pRef = rgbe.utils.exposureGammaArray(pRef, exposure, 1.0)
+                pixelsHDR = rgbe.utils.exposureGammaArray(pixelsHDR, exposure, 1.0)
             # --- Change data to compute norm
-            pRef = [generateFigures.lum(p) for p in pRef]
-            pixelsHDR = [generateFigures.lum(p) for p in pixelsHDR]
+            pRef = rgbe.utils.luminanceArray(pRef)
+            pixelsHDR = rgbe.utils.luminanceArray(pixelsHDR)
             # --- Compute relative error
-            for i in range(len(pRef)):
-                pixelsHDR[i] = 0.0 if pRef[i] == 0.0 else abs(pRef[i] - pixelsHDR[i])/pRef[i]
-            # --- Remake 3 channel
-            pixelsHDR = [(p,p,p) for p in pixelsHDR]
+            with numpy.errstate(divide='ignore', invalid='ignore'):
+                relative = numpy.where(pRef == 0.0, 0.0, numpy.abs(pRef - pixelsHDR)/pRef)
 
             ################ GENERATE IMAGE
-            fig = plt.figure(figsize=((width/100.0), (height/100.0)), dpi=100)
-            data = generateFigures.convertImage(pixelsHDR, height,
-                                width, False)
+            # Luminance of the gray (3 channels) relative error
+            data = rgbe.utils.luminanceArray(numpy.repeat(relative[..., None], 3, axis=-1))
 
             # HARD CODED FOR NOW
             minData = 0.0
             maxData = 0.1
 
-            # --- Save the figure
-            cax = plt.figimage(data, vmin=minData, vmax=maxData)
-            fig.savefig(filenameIMG)#, bbox_inches=extent)
-
-            im = Image.open(filenameIMG)
-            (widthN, heightN) = im.size
-            im = im.crop(((widthN-width),
-                          (heightN-height), width, height))
+            # --- Save the false color image (viridis)
+            im = Image.fromarray(rgbe.utils.applyLUT(data, VIRIDIS_LUT, minData, maxData), "RGB")
             im.save(filenameIMG)
         else:
             logger.critical("Unknown image type: %s. Cancel operation.", typeOp)
             return black_img
     return filenameIMG
 
-if __name__ == "__main__":
-    #tracker = SummaryTracker()
-    
+# One image to generate: tech.images[alias] = readImage(...)
+ImageJob = collections.namedtuple("ImageJob", ["tech", "alias", "filenameHDR", "filenameRefHDR",
+                                               "filenameIMG", "typeOp", "exposure"])
+
+# State of the worker processes (see initWorker)
+_worker = {}
+
+def generateImage(opts, black_img, job, refCache, nbThreads=1):
+    """readImage of the job, followed by its pyramid if requested (-T)
+    :param nbThreads: number of tiles encoded at the same time"""
+    image = readImage(opts, black_img, job.filenameHDR, job.filenameRefHDR,
+                      job.filenameIMG, job.typeOp, job.exposure, refCache)
+    if(opts.tiles and not opts.skip and image == job.filenameIMG):
+        levels = image_pyramid.buildPyramid(image, nbThreads=nbThreads)
+        logger.info("Save %s (%i levels)", image_pyramid.tilesDir(image), levels)
+    return image
+
+def initWorker(opts, black_img, refCache, nbThreads):
+    _worker["opts"] = opts
+    _worker["black"] = black_img
+    _worker["refCache"] = refCache
+    _worker["threads"] = nbThreads
+
+def generateImageWorker(job):
+    return generateImage(_worker["opts"], _worker["black"], job, _worker["refCache"], _worker["threads"])
+
+def jobRecord(job, tileSize=0):
+    """What the image of the job is built from (see html_manifest)
+    :param tileSize: tile size of the image pyramid (0: no pyramid)"""
+    inputs = [html_manifest.fingerprint(job.filenameHDR)]
+    if(job.typeOp != "tonemap"):
+        inputs.append(html_manifest.fingerprint(job.filenameRefHDR))
+    record = {"op": job.typeOp, "exposure": float(job.exposure), "inputs": inputs}
+    if(tileSize != 0):
+        record["tiles"] = tileSize
+    return record
+
+def generateImages(opts, black_img, jobs, refCache, nbJobs=1):
+    """
+    Generate the images of all the jobs
+    :param nbJobs: number of images generated at the same time (processes)
+    :return: the image of each job (same order as jobs)
+    """
+    nbJobs = min(nbJobs, len(jobs))
+    # The cores not used by the processes encode the tiles of the pyramids
+    nbThreads = max(1, (os.cpu_count() or 1) // max(1, nbJobs))
+    if(nbJobs <= 1):
+        return [generateImage(opts, black_img, job, refCache, nbThreads) for job in jobs]
+
+    # The references are decoded by the main process
+    # so the workers do not need to read them again
+    if(not opts.skip):
+        for job in jobs:
+            if(job.typeOp != "tonemap" and rgbe.container.exists(job.filenameRefHDR)):
+                refCache.read(job.filenameRefHDR)
+
+    with ProcessPoolExecutor(max_workers=nbJobs, initializer=initWorker,
+                             initargs=(opts, black_img, refCache, nbThreads)) as pool:
+        return list(pool.map(generateImageWorker, jobs))
+
+def main(argv=None, context=None):
+    """Generate the HTML report
+    :param context: pipeline context (the decoded reference is shared)"""
     # --- Read all params
     parser = optparse.OptionParser()
 
@@ -864,14 +972,18 @@ if __name__ == "__main__":
 
     # If we want to skip the image generation (usefull some time for HTML changes)
     parser.add_option('-S','--skip', help='skip image generation', default=False, action="store_true")
+    parser.add_option('-F','--force', help='rebuild all the images (ignore the build manifest)', default=False, action="store_true")
     parser.add_option('-s','--step', help='steps during the image generation', default=0)
+    parser.add_option('-J','--jobs', help='number of images generated at the same time (processes)', default="1")
+    parser.add_option('-T','--tiles', help='write tiled image pyramids and use the tiled viewer (large images)', default=False, action="store_true")
 
     # Options for curves and related stuff
     parser.add_option('-m','--metric', help='Show RMSE plots', default=False, action="store_true")
     parser.add_option('-C','--clampTime', help='Clamp time into curves', default="-1")
+    parser.add_option('-p','--points', help='maximum number of points per curve (0: all the points)', default="1000")
     copyHDR = True
     
-    (opts, args) = parser.parse_args()
+    (opts, args) = parser.parse_args(argv)
     exposure = int(opts.exposure)
     clampTime = int(opts.clampTime)
     step = int(opts.step) # Only usefull for curve generation
@@ -881,7 +993,10 @@ if __name__ == "__main__":
         sys.exit(3)
     
     refPath = opts.input + os.path.sep + "Ref.hdr"
-    (widthRef,heightRef),pRef = rgbe.io.read(refPath)
+    refCache = ReferenceCache()
+    if(context is not None):
+        refCache.images[refPath] = context.readImage(refPath)
+    (widthRef,heightRef),pRef = refCache.read(refPath)
     wTot,hTot = widthRef,heightRef
     
     if(opts.time == None):
@@ -902,18 +1017,27 @@ if __name__ == "__main__":
     if(not os.path.exists(opts.output)):
         os.makedirs(opts.output)
     
-    # In case of js directory redelete it
+    # Build manifest: only the outdated artifacts are generated again
+    manifest = html_manifest.BuildManifest(opts.output+os.path.sep+html_manifest.MANIFEST_NAME)
+    if(opts.force):
+        manifest.clear()
+
+    # In case of js directory changes redelete it
     # to be sure to always to be update
     pathJS = opts.output+"/js"
-    if(os.path.exists(pathJS)):
-        shutil.rmtree(pathJS)
-    shutil.copytree(opts.jsdir, pathJS)
+    recordJS = {"op": "copy", "inputs": [html_manifest.directoryFingerprint(opts.jsdir)]}
+    if(not manifest.isUpToDate(pathJS, recordJS)):
+        if(os.path.exists(pathJS)):
+            shutil.rmtree(pathJS)
+        shutil.copytree(opts.jsdir, pathJS)
+        manifest.update(pathJS, recordJS)
     
     # === Convert file name
     otherImages = [("dx", "Abs X gradient", exposure+3, "dxAbs"),
                    ("dy", "Abs Y gradient", exposure+3, "dyAbs")]
 
     black_image = opts.output+os.path.sep+"black.png"
+    jobs = []
     for t in techDict.keys():
         # Take the technique and generate all the file paths
         tech = techDict[t]
@@ -921,28 +1045,25 @@ if __name__ == "__main__":
         filenameRefHDR = opts.input+os.path.sep+tech.reference.filenameTime(str(opts.time))+".hdr"
         filenameHDR = opts.input+os.path.sep+filenameTime+".hdr"
 
-        tech.images["tonemap"] = readImage(opts, black_image,
-                                           filenameHDR, filenameRefHDR,
-                                           opts.output+os.path.sep+filenameTime+".png",
-                                           "tonemap", exposure)
+        jobs.append(ImageJob(t, "tonemap", filenameHDR, filenameRefHDR,
+                             opts.output+os.path.sep+filenameTime+".png",
+                             "tonemap", exposure))
         # Add error map (relMSE)
         if(tech.isRef()):
             tech.images["error"] = black_image
         else:
-            tech.images["error"] = readImage(opts, black_image,
-                                             filenameHDR, filenameRefHDR,
-                                             opts.output+os.path.sep+filenameTime+"_error.png",
-                                             "error", exposure)
+            jobs.append(ImageJob(t, "error", filenameHDR, filenameRefHDR,
+                                 opts.output+os.path.sep+filenameTime+"_error.png",
+                                 "error", exposure))
 
         # Add bias image
         if(tech.isRef()):
             # No bias image need to be computed here
             tech.images["bias"] = black_image
         else:
-            tech.images["bias"] = readImage(opts, black_image,
-                                        filenameHDR, filenameRefHDR,
-                                        opts.output+os.path.sep+filenameTime+"_bias.png",
-                                        "bias", exposure)
+            jobs.append(ImageJob(t, "bias", filenameHDR, filenameRefHDR,
+                                 opts.output+os.path.sep+filenameTime+"_bias.png",
+                                 "bias", exposure))
 
         # Generate other images
         for alias, desc, newExp, newPrefix  in otherImages:
@@ -953,11 +1074,31 @@ if __name__ == "__main__":
 
             # Generate new file names
             filename = tech.filename+"_"+newPrefix+"_"+str(opts.time)
-            tech.images[alias] = readImage(opts, black_image,
-                                           opts.input+os.path.sep+filename+".hdr",
-                                           filenameRefHDR,
-                                           opts.output+os.path.sep+filename+".png",
-                                           "tonemap", newExp)
+            jobs.append(ImageJob(t, alias, opts.input+os.path.sep+filename+".hdr",
+                                 filenameRefHDR,
+                                 opts.output+os.path.sep+filename+".png",
+                                 "tonemap", newExp))
+
+    # Generate all the outdated images
+    tileSize = image_pyramid.TILE_SIZE if opts.tiles else 0
+    records = [jobRecord(job, tileSize) for job in jobs]
+    outdated = []
+    for job, record in zip(jobs, records):
+        if(manifest.isUpToDate(job.filenameIMG, record) and
+           (not opts.tiles or os.path.exists(image_pyramid.tilesDir(job.filenameIMG)))):
+            techDict[job.tech].images[job.alias] = job.filenameIMG
+        else:
+            outdated.append((job, record))
+    logger.info("Images: %i outdated, %i up to date", len(outdated), len(jobs) - len(outdated))
+
+    images = generateImages(opts, black_image, [job for job, record in outdated], refCache, int(opts.jobs))
+    for (job, record), image in zip(outdated, images):
+        techDict[job.tech].images[job.alias] = image
+        if(image == job.filenameIMG and not opts.skip):
+            manifest.update(job.filenameIMG, record)
+        else:
+            manifest.remove(job.filenameIMG)
+    manifest.save()
 
     ################################################
     ################################################
@@ -987,21 +1128,21 @@ if __name__ == "__main__":
         # Tone mapped images
         row = HTMLRow()
         row.add(comparison4Way(c.techniques,"tonemap", opts.output,
-                               wTot, hTot), "Rendered images")
+                               wTot, hTot, opts.tiles), "Rendered images")
 
         # Error relMSE images
         # Bias images
         row.add(comparison4Way(c.techniques,"error", opts.output,
-                               wTot, hTot), "relative MSE (false color)")
+                               wTot, hTot, opts.tiles), "relative MSE (false color)")
 
         # Bias images
         row.add(comparison4Way(c.techniques,"bias", opts.output,
-                               wTot, hTot), "Bias (N/P false color)")
+                               wTot, hTot, opts.tiles), "Bias (N/P false color)")
 
         # Other images ...
         for imgSetup in otherImages:
             row.add(comparison4Way(c.techniques,imgSetup[0], opts.output,
-                                   wTot, hTot), imgSetup[1])
+                                   wTot, hTot, opts.tiles), imgSetup[1])
 
         htmlCode += row.generateHTML()
         
@@ -1018,7 +1159,8 @@ if __name__ == "__main__":
     # Generate all the curves sections (if we want to)
     if(opts.metric):
         for section in curvesSections:
-            htmlCode += section.HTMLcode(opts.input, curvesEntries, opts.output, clampTime, step, techDict)
+            htmlCode += section.HTMLcode(opts.input, curvesEntries, opts.output, clampTime, step, techDict,
+                                         int(opts.points))
     else:
         logger.warning("No curve generation requested... skip this part !")
             
@@ -1031,3 +1173,8 @@ if __name__ == "__main__":
     # Black img
     im = Image.new("RGB", (widthRef,heightRef))
     im.save(black_image)
+    if(opts.tiles):
+        image_pyramid.buildPyramid(black_image)
+
+if __name__ == "__main__":
+    main()
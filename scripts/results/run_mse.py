@@ -1,8 +1,17 @@
 import msetools
+import metric_cache
 import optparse
 import os
-import glob
 import math
+import collections
+import numpy
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import shared_memory
+import rgbe.container
+import rgbe.image
+import rgbe.fast
+import dir_index
+import time_index
 
 import xml.etree.ElementTree as ET
 def loadRules(configFile):
@@ -34,15 +43,12 @@ def findMaxIteration(filename, inputDir):
     :param inputDir: the input dir where there are the iteration
     :return:
     """
-    ls = os.listdir(inputDir)
-    outputFilesId = []
-    for curname in ls:
-        if(curname.find(filename) == 0):
-            intStr = curname[len(filename):-4]
-            try:
-                outputFilesId.append(int(intStr))
-            except ValueError:
-                pass # Nothing to do, just ignore
+    outputFilesId = dir_index.getIndex(inputDir).iterations(filename)
+
+    # Images inside the iteration dump container
+    container = rgbe.container.find_container(inputDir + os.path.sep + filename)
+    if(container is not None):
+        outputFilesId += container.iterations()
 
     if(len(outputFilesId) == 0):
         print("WARN: Empty rendering !!!!!!!!!!!!! "+filename)
@@ -50,13 +56,97 @@ def findMaxIteration(filename, inputDir):
 
     return max(outputFilesId)
 
+def imagesBaseName(tech, prefix):
+    """Base name of the images <tech>_<prefix>_<iteration>.hdr"""
+    if(prefix == ""):
+        return tech+"_"
+    return tech+"_"+prefix+"_"
+
+def outputBaseName(tech, out):
+    """Base name of the CSV files of a technique output"""
+    if(out == ""):
+        return tech
+    return tech+"_"+out
+
 def findName(outputs, tech):
     for name in outputs.keys():
         if(tech.find(name) == 0):
             return name
     return ""
-    
-if __name__=="__main__":
+
+# One (technique, prefix) pair to compute
+Job = collections.namedtuple("Job", ["tech", "filename", "nbImages", "steps", "outputCSV", "outputsConfig"])
+# Options shared by all the jobs
+Settings = collections.namedtuple("Settings", ["reference", "mults", "percentages", "mask", "window", "multiConfig"])
+
+def computeJob(job, settings, ref, refHash, cache):
+    """Compute all the metrics of a (technique, prefix) pair
+    :param ref: the decoded reference ((w,h), array)
+    """
+    print("[INFO] Compute All metric for: ", job.tech, "(ref: ", settings.reference, ")")
+    print("Dump info inside: "+str(job.outputCSV))
+    if(settings.multiConfig):
+        msetools.computeMSEMulti(job.filename, job.nbImages, job.steps, settings.reference, settings.mults,
+                                 settings.percentages, job.outputsConfig, settings.window, ref, cache, refHash)
+    else:
+        msetools.computeMSEAll(job.filename, job.nbImages, job.steps, settings.reference, settings.percentages[0],
+                               job.outputCSV, settings.mults[0], settings.mask, settings.window, cache, ref, refHash)
+
+# State of the worker processes (see initWorker)
+_worker = {}
+
+def initWorker(shmName, shape, size, settings, refHash, cacheFile, cacheSize, nbThreads):
+    # The reference is read from the shared memory (no copy)
+    shm = shared_memory.SharedMemory(name=shmName)
+    pRef = numpy.ndarray(shape, dtype=numpy.float64, buffer=shm.buf)
+    pRef.flags.writeable = False
+    _worker["shm"] = shm
+    _worker["ref"] = (size, pRef)
+    _worker["settings"] = settings
+    _worker["refHash"] = refHash
+
+    # The workers do not write the cache: the new entries are given back to the main process
+    _worker["cache"] = None
+    if(cacheFile is not None):
+        _worker["cache"] = metric_cache.MetricCache(cacheFile, cacheSize, readOnly=True)
+    rgbe.fast.set_num_threads(nbThreads)
+
+def computeJobWorker(job):
+    computeJob(job, _worker["settings"], _worker["ref"], _worker["refHash"], _worker["cache"])
+    if(_worker["cache"] is not None):
+        return _worker["cache"].popUpdates()
+    return None
+
+def computeJobsParallel(jobs, nbJobs, settings, ref, refHash, cache):
+    """Compute the jobs with nbJobs processes
+    The CSV files are the same as the sequential computation"""
+    (w,h),pRef = ref
+    pRef = numpy.ascontiguousarray(pRef, dtype=numpy.float64)
+
+    # The cores are split between the processes
+    nbThreads = max(1, (os.cpu_count() or 1) // nbJobs)
+    if(settings.window == 0):
+        settings = settings._replace(window=nbThreads)
+
+    shm = shared_memory.SharedMemory(create=True, size=pRef.nbytes)
+    try:
+        numpy.ndarray(pRef.shape, dtype=numpy.float64, buffer=shm.buf)[:] = pRef
+        cacheFile, cacheSize = None, 0
+        if(cache is not None):
+            cacheFile, cacheSize = cache.filename, cache.maxEntries
+        with ProcessPoolExecutor(max_workers=nbJobs, initializer=initWorker,
+                                 initargs=(shm.name, pRef.shape, (w,h), settings, refHash,
+                                           cacheFile, cacheSize, nbThreads)) as pool:
+            for updates in pool.map(computeJobWorker, jobs):
+                if(updates is not None):
+                    cache.merge(updates)
+    finally:
+        shm.close()
+        shm.unlink()
+
+def main(argv=None, context=None):
+    """Compute the error curves of the techniques
+    :param context: pipeline context (the decoded reference is shared)"""
     parser = optparse.OptionParser()
 
     # Options in/out
@@ -73,24 +163,32 @@ if __name__=="__main__":
     parser.add_option('-c','--config',help='Configure file for mapping technique and outputs', default="rules.xml")
 
     # Other informations to correctly compute MSE
-    parser.add_option('-e','--exposure', help='image exposure', default="0")
+    # Several exposures/percentages can be given (comma separated): the images are then
+    # read only once and the other configurations are written in suffixed CSV files
+    parser.add_option('-e','--exposure', help='image exposure (comma separated list)', default="0")
     parser.add_option('-m','--mask', help='image exposure', default="")
-    parser.add_option('-p','--percentage', help='min percentage pixels', default="1.0")
+    parser.add_option('-p','--percentage', help='min percentage pixels (comma separated list)', default="1.0")
+    parser.add_option('-w','--window', help='number of images scored at the same time (0: number of cores)', default="0")
+    parser.add_option('-j','--jobs', help='number of (technique, prefix) pairs computed at the same time (processes)', default="1")
 
-    (opts, args) = parser.parse_args()
+    # Metric cache (stored inside the output directory)
+    parser.add_option('-N','--nocache', help='disable the metric cache', default=False, action="store_true")
+    parser.add_option('-k','--cachesize', help='maximum number of entries inside the metric cache', default="200000")
+
+    (opts, args) = parser.parse_args(argv)
     steps = int(opts.step)
     finalImage = opts.reference
-    mult = float(math.pow(2, float(opts.exposure)))
-    percentage = float(opts.percentage)
-    print("Computed with exp: ",mult)
+    exposures = opts.exposure.split(",")
+    percentages = opts.percentage.split(",")
+    mults = [float(math.pow(2, float(e))) for e in exposures]
+    multiConfig = len(mults) * len(percentages) > 1
+    print("Computed with exp: ",mults)
 
     # Automatic detection of the techniques
     if(opts.automatic):
         outputCommand = ""
         print("==== Automatic detection ... ")
-        csvFiles = glob.glob(opts.input+os.path.sep+"*_time.csv")
-        for techCSV in csvFiles:
-            techFiltered = os.path.basename(techCSV).replace("_time.csv","")
+        for techFiltered in dir_index.getIndex(opts.input).techniques():
             print(techFiltered)
             outputCommand += "-t " + techFiltered + " "
             opts.technique.append(techFiltered)
@@ -101,6 +199,17 @@ if __name__=="__main__":
     # Load technique output config
     outputs = loadRules(opts.config)
 
+    # Metric cache: only the images that changed are scored again
+    # (one entry per exposure and percentage)
+    if(not os.path.exists(opts.output)):
+        os.makedirs(opts.output)
+    cache = None
+    if(not opts.nocache):
+        cache = metric_cache.MetricCache(opts.output+os.path.sep+metric_cache.CACHE_NAME,
+                                         int(opts.cachesize))
+
+    # List all (technique, prefix) pairs to compute
+    jobs = []
     for tech in opts.technique:
         print("----------------------")
         print(tech)
@@ -115,9 +224,7 @@ if __name__=="__main__":
         # For all the output we need to analyse
         for prefix in outputs[outputName].keys():
             # --- Construct the filename
-            filename = tech+"_"+prefix+"_"
-            if(prefix == ""):
-                filename = tech+"_"
+            filename = imagesBaseName(tech, prefix)
 
             # --- count how many image for the particular prefix
             nbImages = findMaxIteration(filename, opts.input)
@@ -129,21 +236,54 @@ if __name__=="__main__":
 
             # --- create the output files
             outputCSV = []
-            outputBase = tech+"_"+outputs[outputName][prefix]
-            if(outputs[outputName][prefix] == ""):
-                outputBase = tech
+            outputBase = outputBaseName(tech, outputs[outputName][prefix])
 
             for name in msetools.CSVNames:
                 outputCSV.append(opts.output+os.path.sep+outputBase+name)
 
-            stepsLocal = steps
-            if(tech == "GBDPT_L1" or tech == "GBDPT_L2" or
-               tech == "GPT_L1" or tech == "GPT_L2"):
-                stepsLocal = 1
+            # The first configuration uses the usual CSV names
+            outputsConfig = []
+            for e in exposures:
+                for p in percentages:
+                    suffix = "_p" + p + "_e" + e
+                    if(len(outputsConfig) == 0):
+                        outputsConfig.append(outputCSV)
+                    else:
+                        outputsConfig.append([opts.output+os.path.sep+outputBase+suffix+name
+                                              for name in msetools.CSVNames])
 
-            # Find nb images
-            print("[INFO] Compute All metric for: ", tech, "(ref: ", opts.reference, ")")
-            print("Dump info inside: "+str(outputCSV))
+            stepsLocal = time_index.techniqueStep(tech, steps)
             filename =  opts.input + os.path.sep + filename
-            msetools.computeMSEAll(filename, nbImages, stepsLocal, opts.reference, percentage, outputCSV, mult, opts.mask)
-    
+            jobs.append(Job(tech, filename, nbImages, stepsLocal, outputCSV, outputsConfig))
+
+    if(multiConfig and opts.mask != ""):
+        raise Exception("Masked image are not handled yet")
+
+    # The reference is decoded (and hashed) only once
+    settings = Settings(opts.reference, mults, [float(p) for p in percentages], opts.mask,
+                        int(opts.window), multiConfig)
+    if(context is not None):
+        ref = context.readImage(opts.reference)
+    else:
+        ref = rgbe.image.read_array(opts.reference)
+    refHash = None
+    if(cache is not None):
+        refHash = context.fileHash(opts.reference) if context is not None else metric_cache.fileHash(opts.reference)
+
+    nbJobs = min(int(opts.jobs), len(jobs))
+    try:
+        if(nbJobs <= 1):
+            for job in jobs:
+                computeJob(job, settings, ref, refHash, cache)
+        else:
+            computeJobsParallel(jobs, nbJobs, settings, ref, refHash, cache)
+    finally:
+        # Written once for all the (technique, prefix) pairs
+        if(cache is not None):
+            cache.save()
+
+    if(cache is not None):
+        cache.report()
+
+if __name__=="__main__":
+    main()
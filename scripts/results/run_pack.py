@@ -1,13 +1,16 @@
 import os
 import shutil
-import glob
 import math
 import optparse
 import sys
+import json
+from concurrent.futures import ThreadPoolExecutor
 
 # === Custom import
 # For read csv easily
-import csv_utils
+import dir_index
+import time_index
+import rgbe.container
 
 
 def copyFile(src, dest):
@@ -19,56 +22,159 @@ def copyFile(src, dest):
         print("[INFO] Copy",src,"->",dest)
         shutil.copy(src, dest)
 
+def copyImage(src, dest):
+    """Same as copyFile but the source image can be
+    inside an iteration dump container"""
+    if(not os.path.exists(src)):
+        entry = rgbe.container.find_entry(src)
+        if(entry is not None):
+            print("[INFO] Extract",str(entry),"->",dest)
+            entry.extract(dest)
+            return
+    copyFile(src, dest)
+
+# Linux ioctl cloning the extents of a file (btrfs, xfs, ...)
+FICLONE = 0x40049409
+
+def reflinkFile(src, dest):
+    """Copy on write clone of src, False if not supported"""
+    try:
+        import fcntl
+    except ImportError:
+        return False
+    try:
+        with open(src, "rb") as fSrc, open(dest, "wb") as fDest:
+            fcntl.ioctl(fDest.fileno(), FICLONE, fSrc.fileno())
+        return True
+    except OSError:
+        if(os.path.exists(dest)):
+            os.remove(dest)
+        return False
+
+def linkFile(src, dest):
+    """Hardlink, reflink or symlink (in this order) src to dest
+    :return: the link type, None if src and dest are not on the same filesystem
+             or if no link can be created"""
+    if(os.stat(src).st_dev != os.stat(os.path.dirname(os.path.abspath(dest))).st_dev):
+        return None
+    try:
+        os.link(src, dest)
+        return "hardlink"
+    except OSError:
+        pass
+    if(reflinkFile(src, dest)):
+        return "reflink"
+    try:
+        os.symlink(os.path.abspath(src), dest)
+        return "symlink"
+    except OSError:
+        return None
+
+def packFile(src, dest, link=False):
+    """Same as copyImage but src is linked to dest if possible (link)
+    :return: how the file was packed (None if src does not exist)"""
+    if(not os.path.exists(src)):
+        if(rgbe.container.find_entry(src) is None):
+            print("[WARN] Impossible to find "+ src)
+            return None
+        copyImage(src, dest)
+        return "extract"
+    if(os.path.lexists(dest)):
+        if(os.path.exists(dest) and os.path.samefile(src, dest)):
+            return "same"
+        os.remove(dest)
+    if(link):
+        mode = linkFile(src, dest)
+        if(mode is not None):
+            print("[INFO] Link ("+mode+")",src,"->",dest)
+            return mode
+    copyFile(src, dest)
+    return "copy"
+
+class Packer:
+    """
+    Files to pack inside the output directory: the files are only
+    packed by run(), all at the same time if several jobs are used.
+    With link, the files are linked instead of copied when the input and
+    the output directories are on the same filesystem.
+    """
+    def __init__(self, link=False, nbJobs=1):
+        self.link = link
+        self.nbJobs = max(1, nbJobs)
+        self.tasks = []
+        self.destinations = set()
+        self.records = []
+
+    def add(self, src, dest, live=False):
+        """
+        :param live: the file can still be appended by the renderer
+                     (time and log files): it is always copied
+        """
+        # The same file can be requested twice (ex. -n pass with the default name)
+        if(dest in self.destinations):
+            return
+        self.destinations.add(dest)
+        self.tasks.append((src, dest, self.link and not live))
+
+    def run(self):
+        """Pack all the files, return the records of the packed files"""
+        def pack(task):
+            return packFile(*task)
+        if(self.nbJobs == 1):
+            modes = [pack(task) for task in self.tasks]
+        else:
+            with ThreadPoolExecutor(max_workers=self.nbJobs) as pool:
+                modes = list(pool.map(pack, self.tasks))
+        for (src, dest, link), mode in zip(self.tasks, modes):
+            if(mode is not None):
+                self.records.append({"name": os.path.basename(dest),
+                                     "source": os.path.abspath(src), "mode": mode})
+        self.tasks = []
+        self.destinations = set()
+        return self.records
+
+PACK_MANIFEST = ".pack_manifest.json"
+
+def writePackManifest(output, content):
+    """Write the manifest of the packed directory and record its
+    content for dir_index (run_mse.py/run_html.py do not scan it again)"""
+    manifestFile = output+os.path.sep+PACK_MANIFEST
+    with open(manifestFile, "w") as f:
+        json.dump(content, f, indent=1)
+    dir_index.saveIndex(output, [entry.name for entry in os.scandir(output)])
+    print("[INFO] Pack manifest:", manifestFile)
+
 def extractImageTime(timeSec, technique, step, inputDir):
     """Return the image name for this technique
     with the time selected images
     """
     # === Open time .csv
-    # And read the times
-    timeCSVFile = inputDir+os.path.sep+technique+"_time.csv"
-    times = csv_utils.extractCSVNumber(timeCSVFile)
-    if(len(times) < step):
+    # The cumulated times are indexed once (see time_index)
+    index = time_index.TimeIndex.fromCSV(inputDir+os.path.sep+technique+"_time.csv", step)
+    if(index.nbImages() == 0):
         print("No enought iteration done by the technique")
         print("Or no time file")
         return []
-
-    # === Compute cumul times
-    # Indeed inside the CSV file,
-    # there is only time per iteration
-    cumulTimes = []
-    currentTime = 0
-    for t in times:
-        currentTime += t
-        cumulTimes.append(currentTime)
     
     # === Find split for each times
     timesSplit = []
     for tsec in timeSec:
-        # For each time split we want
-        # we do a linear seach inside the timing to get the closest image
+        # For each time split we want the closest image
         # which have the time upper that the time limits
-        found = False
-        lastID = step
-        for i in range(step-1,len(cumulTimes),step):
-            if(tsec < cumulTimes[i]):
-                timesSplit.append(i+1)
-                print("[INFO] Time diff for ", tsec, "is equal to", cumulTimes[i] - tsec)
-                found = True
-                break # pass next
-            lastID = i
+        iteration, found = index.imageAt(tsec)
         # It can happens that in some case, it is not possible
         # to find a image that is upper the time limit
         # In this case, we take the last one
         if(not found):
-            print("[WARN] Force find !",  technique, "(", lastID, ")")
-            timesSplit.append(lastID+1)
-            print("[INFO] Time diff for ", tsec, "is equal to", cumulTimes[lastID] - tsec)
+            print("[WARN] Force find !",  technique, "(", iteration-1, ")")
+        timesSplit.append(iteration)
+        print("[INFO] Time diff for ", tsec, "is equal to", index.timeAt(iteration) - tsec)
             
     # Now, we know each iteration that correspond to the time split
     # Here just
     return timesSplit
 
-def extractAndCopyImageTime(output, timeSec, tech, step, inputDir, names):
+def extractAndCopyImageTime(output, timeSec, tech, step, inputDir, names, container=False, packer=None):
     """
     This technique
     :param output: output dir informations
@@ -77,30 +183,62 @@ def extractAndCopyImageTime(output, timeSec, tech, step, inputDir, names):
     :param step: image step use for all the techniques
     :param inputDir: where the images are
     :param names: the additional name of all the images
-    :return:
+    :param container: pack the images inside one container per name (keyed by time)
+    :param packer: Packer receiving the images (copied at once if None)
+    :return: the iteration of each time split
     """
 
     # Get all the iteration related to the technique
     iterations = extractImageTime(timeSec, tech, step, inputDir)
     if(len(iterations) == 0):
         print("WARN: Somethings goes wrong for technique: "+tech+", SKIP IT")
-        return # Do nothing !
+        return [] # Do nothing !
 
     print(tech, " iterations: ", str(iterations))
 
     # for all the name, make a copy of it
     # in the same time, replace the iteration number
     # by the time split value
-    for j in range(len(timeSec)):
-        for name in names:
-            nameBase = tech+"_"+name+"_"
-            if(name == ""):
-                # This is a special case, in this case, change the nameBase by removing double __
-                nameBase = nameBase.replace("__", "_")
-            copyFile(inputDir+os.path.sep+nameBase+str(iterations[j])+".hdr",
-                     output+os.path.sep+nameBase+str(timeSec[j])+".hdr")
+    for name in names:
+        nameBase = tech+"_"+name+"_"
+        if(name == ""):
+            # This is a special case, in this case, change the nameBase by removing double __
+            nameBase = nameBase.replace("__", "_")
+
+        if(container):
+            packContainer(output+os.path.sep+nameBase, name, timeSec,
+                          [inputDir+os.path.sep+nameBase+str(i)+".hdr" for i in iterations])
+            continue
+
+        for j in range(len(timeSec)):
+            src = inputDir+os.path.sep+nameBase+str(iterations[j])+".hdr"
+            dest = output+os.path.sep+nameBase+str(timeSec[j])+".hdr"
+            if(packer is None):
+                copyImage(src, dest)
+            else:
+                packer.add(src, dest)
+    return iterations
+
+def packContainer(nameBase, prefix, keys, images):
+    """Write the images inside a new container
+    (the iteration number of each image is given by keys)"""
+    images = [(k, src) for k, src in zip(keys, images) if rgbe.container.exists(src)]
+    if(len(images) == 0):
+        print("[WARN] Impossible to find images for "+ nameBase)
+        return
+
+    path = rgbe.container.container_path(nameBase, prefix)
+    for f in [path, path + rgbe.container.INDEX_EXT]:
+        if(os.path.exists(f)):
+            os.remove(f)
+    print("[INFO] Pack",len(images),"images ->",path)
+    with rgbe.container.ContainerWriter(path) as writer:
+        for k, src in images:
+            writer.append(k, rgbe.container.read_bytes(src))
                     
-if __name__=="__main__":
+def main(argv=None, context=None):
+    """Pack the results of a rendering directory
+    :return: the packed iterations of each technique"""
     parser = optparse.OptionParser()
 
     # Input/Output directories
@@ -116,8 +254,11 @@ if __name__=="__main__":
     # Option to tell which name file we want to pack
     parser.add_option('-n','--name', help='files names (pass, gX, etc.)', default=["pass"], action="append") # Options for computing the reference and all other values
     parser.add_option('-r','--reference',help='Reference image')
+    parser.add_option('-k','--container', help='pack the images inside iteration dump containers', default=False, action="store_true")
+    parser.add_option('-l','--link', help='link the files (hardlink, reflink or symlink) instead of copying them if possible', default=False, action="store_true")
+    parser.add_option('-J','--jobs', help='number of files copied at the same time', default="1")
 
-    (opts, args) = parser.parse_args()
+    (opts, args) = parser.parse_args(argv)
 
     # Read all the input provided by the user
     step = int(opts.step)
@@ -127,9 +268,7 @@ if __name__=="__main__":
     if(opts.automatic):
         outputCommand = ""
         print("==== Automatic detection ... ")
-        csvFiles = glob.glob(opts.input+os.path.sep+"*_time.csv")
-        for techCSV in csvFiles:
-            techFiltered = os.path.basename(techCSV).replace("_time.csv","")
+        for techFiltered in dir_index.getIndex(opts.input).techniques():
             print(techFiltered)
             outputCommand += "-t " + techFiltered + " "
             opts.technique.append(techFiltered)
@@ -142,16 +281,17 @@ if __name__=="__main__":
         
     # --- Copy all into res directory
     # Timing informations and log files (if it's exist)
+    packer = Packer(opts.link, int(opts.jobs))
     for tech in opts.technique:
          TimeFile = tech+"_time.csv"
-         copyFile(opts.input + os.path.sep +TimeFile, opts.output+os.path.sep+TimeFile)
+         packer.add(opts.input + os.path.sep +TimeFile, opts.output+os.path.sep+TimeFile, live=True)
          OutFile = tech + ".out"
-         copyFile(opts.input + os.path.sep +OutFile, opts.output+os.path.sep+OutFile)
+         packer.add(opts.input + os.path.sep +OutFile, opts.output+os.path.sep+OutFile, live=True)
 
     # === Copy the ref also
     if(opts.reference):
         #copyFile(opts.input + os.path.sep +reference, opts.output+os.path.sep+"ref.hdr")
-        copyFile(opts.reference, opts.output+os.path.sep+"Ref.hdr")
+        packer.add(opts.reference, opts.output+os.path.sep+"Ref.hdr")
     
     # === Extract step images (time)
     # --- Convert time
@@ -169,12 +309,23 @@ if __name__=="__main__":
     # --- Extract image steps with techniques
     # HACK: empty prefix becomes the double quote on Windows, so work around by adding a real empty string here
     opts.name += ['']
+    iterations = {}
     for tech in opts.technique:
-        stepsLocal = step
-        if(tech == "GBDPT_L1" or tech == "GBDPT_L2" or
-           tech == "GPT_L1" or tech == "GPT_L2"):
+        stepsLocal = time_index.techniqueStep(tech, step)
+        if(stepsLocal != step):
             print("[WARN] Change the step")
-            stepsLocal = 1
 
-        extractAndCopyImageTime(opts.output, timeSec, tech, stepsLocal, opts.input, opts.name)
+        iterations[tech] = extractAndCopyImageTime(opts.output, timeSec, tech, stepsLocal, opts.input,
+                                                   opts.name, opts.container, packer)
 
+    files = packer.run()
+    writePackManifest(opts.output, {"input": os.path.abspath(opts.input),
+                                    "times": timeSec,
+                                    "step": step,
+                                    "names": opts.name,
+                                    "iterations": iterations,
+                                    "files": files})
+    return iterations
+
+if __name__=="__main__":
+    main()
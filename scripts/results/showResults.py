@@ -1,10 +1,19 @@
-from pylab import *
-import matplotlib.pyplot as plt
+try:
+    from pylab import *
+    import matplotlib.pyplot as plt
+except ImportError:
+    # matplotlib is only needed to plot the curves (run_html.py does not)
+    from numpy import polyfit, poly1d
+    plt = None
 import optparse
+import json
+import numpy
 import csv_utils
 import os
-import glob
 import logging
+import dir_index
+import time_index
+import curve_export
 
 logger = logging.getLogger(__name__)
 
@@ -39,50 +48,51 @@ class Technique(csv_utils.Technique):
         return len(self.y) > 0
     
     def generatePairData(self):
-        temp = []
-        for i in range(len(self.x)):
-            temp.append([self.x[i], self.y[i]])
-        return temp
+        return numpy.column_stack((self.x, self.y)).tolist()
     
     def clampTime(self, value):
-        if self.x[-1] < value:
+        """Keep the points before the time value (x is sorted)"""
+        if len(self.x) == 0 or self.x[-1] < value:
             return
         
-        i = 0
-        while self.x[i] < value:
-            i += 1
+        i = int(numpy.searchsorted(self.x, value, side="left"))
         logger.debug(str(i))
         self.x = self.x[:i]
         self.y = self.y[:i]
+
+    def clampX(self, value):
+        """Keep the points with x <= value (x is sorted)"""
+        i = int(numpy.searchsorted(self.x, value, side="right"))
+        self.x = self.x[:i]
+        self.y = self.y[:i]
         
+    def constantSeriesX(self, log=False):
+        """(x, y) arrays of the time of each entry: x is the entry
+        index (log10 of the cumulated time if log) and y the time"""
+        y = numpy.diff(self.x, prepend=0.0)
+        if log:
+            with numpy.errstate(divide='ignore'):
+                return numpy.log10(self.x), y
+        return numpy.arange(len(self.x)), y
+
     def generateConstantDataX(self):
-        temp = []
-        prev = 0
-        for i in range(len(self.x)):
-            temp.append([i, self.x[i] - prev])
-            prev = self.x[i]
-        return temp
+        x, y = self.constantSeriesX()
+        return [list(p) for p in zip(x.tolist(), y.tolist())]
     
     def generateConstantDataXLog(self):
-        temp = []
-        prev = 0
-        for i in range(len(self.x)):
-            temp.append([math.log10(self.x[i]), self.x[i] - prev])
-            prev = self.x[i]
-        return temp
+        x, y = self.constantSeriesX(True)
+        return [list(p) for p in zip(x.tolist(), y.tolist())]
     
-    def jsEntry(self):
-        temp = []
-        for i in range(len(self.x)):
-            temp.append([self.x[i], self.y[i]])
-        return "{data: " + str(temp) + ', label: "' + self.name + '"}'
+    def jsEntry(self, maxPoints=0):
+        """Flot entry (the curve is decimated to maxPoints, 0: all the points)"""
+        x, y = curve_export.decimate(self.x, self.y, maxPoints)
+        temp = [list(p) for p in zip(curve_export.compact(x), curve_export.compact(y))]
+        return "{data: " + json.dumps(temp, separators=(",", ":")) + ', label: "' + self.name + '"}'
 
 def getTechniqueNames(rep):
     list = []
     logger.info("==== Automatic detection ... ")
-    csvFiles = glob.glob(rep+os.path.sep+"*_time.csv")
-    for techCSV in csvFiles:
-        techFiltered = os.path.basename(techCSV).replace("_time.csv","")
+    for techFiltered in dir_index.getIndex(rep).techniques():
         logger.debug(techFiltered)
         list.append(techFiltered)
     return list
@@ -103,10 +113,7 @@ def readAllTechniques(list, rep, step, uselog=False, basex="_time.csv", basey="_
             timename = splitLine[1]
         logger.info("[READ ALL]: "+str(name)+" time="+str(timename))
 
-        stepsLocal = step
-        if(timename == "GBDPT_L1" or timename == "GBDPT_L2" or
-           timename == "GPT_L1" or timename == "GPT_L2"):
-            stepsLocal = 1
+        stepsLocal = time_index.techniqueStep(timename, step)
 
         color = colors[colorIndex]
         colorIndex += 1
@@ -139,12 +146,12 @@ def readAllTechniques(list, rep, step, uselog=False, basex="_time.csv", basey="_
             logger.warn("Technique invalid: "+name)
     return techniques
 
-def createJSScript(placeName, techniques, colorDict = None):
+def createJSScript(placeName, techniques, colorDict = None, maxPoints = 0):
     totalText = '$(function() { $.plot("'+placeName+'",['
     # === fill the data section
     for i in range(len(techniques)):
-        if techniques[i].name in colorDict:
-            totalText += techniques[i].jsEntry()
+        if colorDict is None or techniques[i].name in colorDict:
+            totalText += techniques[i].jsEntry(maxPoints)
             if((i+1) != len(techniques)):
                 totalText += ",\n"
     totalText += "]" 
@@ -181,6 +188,7 @@ if __name__=="__main__":
     parser.add_option('-F','--fittingClamp', default="0.1")
     parser.add_option('-m','--maxpass', default=-1)
     parser.add_option('-J','--javascript', default="")
+    parser.add_option('-p','--points', help='maximum number of points per curve in the javascript (0: all the points)', default="0")
     
     (options, args) = parser.parse_args()
     options.maxpass = int(options.maxpass)
@@ -196,7 +204,7 @@ if __name__=="__main__":
     techniques = readAllTechniques(options.input, options.rep, step, options.log, "_time.csv", options.basey)
     
     if(options.javascript != ""):
-        text = createJSScript(options.javascript, techniques)
+        text = createJSScript(options.javascript, techniques, maxPoints=int(options.points))
         logger.info(text)
         
     fig = plt.figure()
@@ -204,26 +212,17 @@ if __name__=="__main__":
 
     if(options.timeNormalisation):
         for tech in techniques:
-            for i in range(len(tech.x)):
-                tech.x[i] = i
+            tech.x = numpy.arange(len(tech.x))
     
     if options.normalize:
         
         # === Search min X
-        minX = techniques[0].x[-1]
-        for tech in techniques:
-            minX = min(tech.x[-1], minX)
+        minX = min(tech.x[-1] for tech in techniques)
         logger.info("[INFO] Min x axis found: "+str(minX))
         
         # === Cut down the DATA
         for tech in techniques:
-            newX = []
-            for x in tech.x:
-                if x > minX:
-                    break
-                newX.append(x)
-            tech.x = newX
-            tech.y = tech.y[0:len(tech.x)]
+            tech.clampX(minX)
 
     
     ax.set_ylabel(options.yname)
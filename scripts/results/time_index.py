@@ -0,0 +1,83 @@
+"""
+Time index of a technique (<tech>_time.csv: render time of each iteration)
+
+The cumulated times are computed once per file and all the
+lookups are binary searches. The iterations are numbered from 1
+(the image <tech>_pass_<i>.hdr is written after the iteration i).
+"""
+
+import os
+import numpy
+
+import csv_utils
+
+# These techniques write an image at each iteration, whatever the image step
+FULL_STEP_TECHNIQUES = ("GBDPT_L1", "GBDPT_L2", "GPT_L1", "GPT_L2")
+
+def techniqueStep(technique, step):
+    """Image step of a technique (GPT/GBDPT override the requested step)"""
+    if(technique in FULL_STEP_TECHNIQUES):
+        return 1
+    return step
+
+class TimeIndex:
+    def __init__(self, times, step=1):
+        """
+        :param times: render time of each iteration
+        :param step: an image is written every step iterations
+        """
+        self.cumulTimes = numpy.cumsum(numpy.asarray(times, dtype=numpy.float64))
+        self.step = max(1, int(step))
+
+    @staticmethod
+    def fromCSV(filename, step=1):
+        return TimeIndex(csv_utils.readCSVNumber(filename), step)
+
+    @staticmethod
+    def forTechnique(inputDir, technique, step=1):
+        """Index of inputDir/<technique>_time.csv (with the step override)"""
+        return TimeIndex.fromCSV(inputDir + os.path.sep + technique + "_time.csv",
+                                 techniqueStep(technique, step))
+
+    def __len__(self):
+        """Number of iterations"""
+        return len(self.cumulTimes)
+
+    def nbImages(self):
+        return len(self.cumulTimes) // self.step
+
+    def timeAt(self, iteration):
+        """Cumulated time at the end of the iteration (0 for the iteration 0)"""
+        if(iteration <= 0):
+            return 0.0
+        return float(self.cumulTimes[iteration - 1])
+
+    def iterationAt(self, t):
+        """Iteration running at the time t (None if the rendering ended before)"""
+        i = int(numpy.searchsorted(self.cumulTimes, t, side="right")) + 1
+        return i if i <= len(self.cumulTimes) else None
+
+    def iterationsWithin(self, budget):
+        """Number of iterations finished within the time budget"""
+        return int(numpy.searchsorted(self.cumulTimes, budget, side="right"))
+
+    def iterationsToReach(self, t):
+        """Number of iterations needed for the cumulated time to reach t
+        (all the iterations if it is never reached)"""
+        if(t <= 0.0):
+            return 0
+        return min(int(numpy.searchsorted(self.cumulTimes, t, side="left")) + 1, len(self.cumulTimes))
+
+    def imageAt(self, t):
+        """
+        First image written after the time t
+        :return: (iteration, found), the last image is returned with
+                 found=False if no image was written after t (None if no image)
+        """
+        imageTimes = self.cumulTimes[self.step - 1::self.step]
+        if(len(imageTimes) == 0):
+            return None, False
+        k = int(numpy.searchsorted(imageTimes, t, side="right"))
+        if(k < len(imageTimes)):
+            return (k + 1) * self.step, True
+        return len(imageTimes) * self.step, False
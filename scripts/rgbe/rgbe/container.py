@@ -0,0 +1,323 @@
+"""
+Iteration dump container: all the images dumped by a technique for a
+given prefix (<TECH>_<prefix>_<iter>.hdr) inside one append-only file.
+
+The container of the images without prefix (<TECH>_<iter>.hdr) is
+<TECH>_.hdrc: it does not collide with the container of the prefix of a
+shorter technique name (<TECH>_<prefix>.hdrc).
+
+Layout of <TECH>_<prefix>.hdrc (little endian):
+  header: "HDRC", version (uint32), container id (uint64)
+  entries: "ITER", iteration (int32), codec (uint32), size (uint64)
+           followed by the image file content (.hdr/.pfm), zlib
+           compressed if codec is CODEC_ZLIB
+The index (<container>.idx) is an append-only list of
+(iteration, entry offset) records. If it is missing or not complete,
+the entries are found by scanning the entry headers.
+
+The not compressed entries are read by rgbe.io directly
+("<container>@<offset>" paths), the compressed ones with rgbe.io.read_bytes.
+"""
+
+import os
+import re
+import struct
+import zlib
+import numpy
+
+import rgbe.io
+import rgbe.image
+
+CONTAINER_EXT = ".hdrc"
+INDEX_EXT = ".idx"
+VERSION = 1
+
+CODEC_STORED = 0
+CODEC_ZLIB = 1
+
+HEADER = struct.Struct("<4sIQ")
+ENTRY = struct.Struct("<4siIQ")
+RECORD = struct.Struct("<iQ")
+
+def container_path(nameBase, prefix=None):
+    """Container of the images <nameBase><iter>.hdr
+    nameBase: <TECH>_<prefix>_, or <TECH>_ if prefix is "" (no prefix)"""
+    if prefix == "":
+        return nameBase + CONTAINER_EXT
+    if nameBase.endswith("_"):
+        nameBase = nameBase[:-1]
+    return nameBase + CONTAINER_EXT
+
+class Entry(object):
+    "One image inside a container"
+    def __init__(self, container, iteration, offset, codec, size):
+        self.container = container
+        self.iteration = iteration
+        self.offset = offset # Offset of the entry header
+        self.codec = codec
+        self.size = size
+
+    def data_offset(self):
+        return self.offset + ENTRY.size
+
+    def native_path(self):
+        "Path readable by rgbe.io/rgbe.fast (None for compressed entries)"
+        if self.codec != CODEC_STORED:
+            return None
+        return self.container.path + "@" + str(self.data_offset())
+
+    def identity(self):
+        "Unique identifier of the entry content (entries are never rewritten)"
+        return "|".join([os.path.abspath(self.container.path) + "#" + str(self.iteration),
+                         str(self.container.uid), str(self.offset), str(self.size)])
+
+    def read_bytes(self):
+        "Image file content"
+        with open(self.container.path, "rb") as f:
+            f.seek(self.data_offset())
+            data = f.read(self.size)
+        if self.codec == CODEC_ZLIB:
+            data = zlib.decompress(data)
+        return data
+
+    def read_array(self):
+        "Same as rgbe.image.read_array"
+        path = self.native_path()
+        if path is not None:
+            return rgbe.image.read_array(path)
+        (width,height),buf = rgbe.io.read_bytes(self.read_bytes())
+        if buf is None:
+            raise IOError("Impossible to read the image: " + str(self))
+        return (width,height),numpy.asarray(buf)
+
+    def extract(self, dest):
+        "Write the entry as a regular image file"
+        with open(dest, "wb") as f:
+            f.write(self.read_bytes())
+
+    def __str__(self):
+        return self.container.path + "#" + str(self.iteration)
+
+class Container(object):
+    "Read access to a container (iteration -> entry)"
+    def __init__(self, path):
+        self.path = path
+        self.uid = 0
+        self.entries = {}
+        self.end = HEADER.size # End of the last valid entry
+        self.load()
+
+    def load(self):
+        with open(self.path, "rb") as f:
+            header = f.read(HEADER.size)
+            if len(header) != HEADER.size:
+                raise IOError("Not a valid container: " + self.path)
+            magic, version, self.uid = HEADER.unpack(header)
+            if magic != b"HDRC" or version != VERSION:
+                raise IOError("Not a valid container: " + self.path)
+            fileSize = os.fstat(f.fileno()).st_size
+            self.load_index(f, fileSize)
+            self.scan(f, fileSize)
+
+    def load_index(self, f, fileSize):
+        "Use the index records as long as they match an entry header"
+        indexPath = self.path + INDEX_EXT
+        if not os.path.exists(indexPath):
+            return
+        with open(indexPath, "rb") as fIndex:
+            records = fIndex.read()
+        for i in range(len(records) // RECORD.size):
+            iteration, offset = RECORD.unpack_from(records, i * RECORD.size)
+            entry = self.read_entry(f, offset, fileSize)
+            if entry is None or entry.iteration != iteration:
+                return
+            self.add(entry)
+
+    def scan(self, f, fileSize):
+        "Read the entry headers not indexed (crash during the dump, no index)"
+        entry = self.read_entry(f, self.end, fileSize)
+        while entry is not None:
+            self.add(entry)
+            entry = self.read_entry(f, self.end, fileSize)
+
+    def read_entry(self, f, offset, fileSize):
+        if offset + ENTRY.size > fileSize:
+            return None
+        f.seek(offset)
+        magic, iteration, codec, size = ENTRY.unpack(f.read(ENTRY.size))
+        if magic != b"ITER" or offset + ENTRY.size + size > fileSize:
+            return None # Not complete or not valid
+        return Entry(self, iteration, offset, codec, size)
+
+    def add(self, entry):
+        # If an iteration is dumped several times, the last one is used
+        self.entries[entry.iteration] = entry
+        self.end = max(self.end, entry.data_offset() + entry.size)
+
+    def iterations(self):
+        return sorted(self.entries.keys())
+
+    def __contains__(self, iteration):
+        return iteration in self.entries
+
+    def __len__(self):
+        return len(self.entries)
+
+    def entry(self, iteration):
+        return self.entries[iteration]
+
+    def read_array(self, iteration):
+        return self.entries[iteration].read_array()
+
+class ContainerWriter(object):
+    "Append images to a container (created if it does not exist)"
+    def __init__(self, path, compress=False):
+        self.path = path
+        self.compress = compress
+        if os.path.exists(path):
+            # Drop the end of the file if the last entry is not complete
+            container = Container(path)
+            self.file = open(path, "r+b")
+            self.file.truncate(container.end)
+            self.file.seek(container.end)
+            records = b"".join(RECORD.pack(e.iteration, e.offset)
+                               for e in sorted(container.entries.values(), key=lambda e: e.offset))
+            with open(path + INDEX_EXT, "wb") as fIndex:
+                fIndex.write(records)
+        else:
+            self.file = open(path, "wb")
+            self.file.write(HEADER.pack(b"HDRC", VERSION, struct.unpack("<Q", os.urandom(8))[0]))
+            with open(path + INDEX_EXT, "wb"):
+                pass
+        self.index = open(path + INDEX_EXT, "ab")
+
+    def append(self, iteration, data):
+        "Append an image file content (bytes)"
+        codec = CODEC_STORED
+        if self.compress:
+            codec = CODEC_ZLIB
+            data = zlib.compress(data)
+        offset = self.file.tell()
+        self.file.write(ENTRY.pack(b"ITER", iteration, codec, len(data)))
+        self.file.write(data)
+        self.file.flush()
+        # The index is written after the entry: a record always refers to a complete entry
+        self.index.write(RECORD.pack(iteration, offset))
+        self.index.flush()
+
+    def append_file(self, iteration, path):
+        with open(path, "rb") as f:
+            self.append(iteration, f.read())
+
+    def close(self):
+        self.file.close()
+        self.index.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+# Containers already read: path -> ((size, mtime), Container)
+_containers = {}
+
+def open_container(path):
+    """Container at path or None if it does not exist. The container
+    is read again only if the file changed since the last call"""
+    path = os.path.abspath(path)
+    try:
+        st = os.stat(path)
+    except OSError:
+        _containers.pop(path, None)
+        return None
+    key = (st.st_size, st.st_mtime_ns)
+    cached = _containers.get(path)
+    if cached is None or cached[0] != key:
+        cached = (key, Container(path))
+        _containers[path] = cached
+    return cached[1]
+
+def find_container(nameBase):
+    """Container of the images <nameBase><iter>.hdr (with or without
+    prefix) or None if there is no such container"""
+    for prefix in [None, ""]:
+        container = open_container(container_path(nameBase, prefix))
+        if container is not None:
+            return container
+    return None
+
+def find_entry(path):
+    """Return the container entry of a dumped image path (<nameBase><iter>.hdr)
+    or None if there is no such entry"""
+    match = re.match(r"^(.*_)(\d+)\.hdr$", path)
+    if match is None:
+        return None
+    container = find_container(match.group(1))
+    if container is None:
+        return None
+    iteration = int(match.group(2))
+    if iteration not in container:
+        return None
+    return container.entry(iteration)
+
+def exists(path):
+    "True if the image exists as a file or inside a container"
+    return os.path.exists(path) or find_entry(path) is not None
+
+def read_bytes(path):
+    "Image file content, the image can be inside a container"
+    if not os.path.exists(path):
+        entry = find_entry(path)
+        if entry is not None:
+            return entry.read_bytes()
+    with open(path, "rb") as f:
+        return f.read()
+
+def read_array(path):
+    "Same as rgbe.image.read_array but the image can be inside a container"
+    if not os.path.exists(path):
+        entry = find_entry(path)
+        if entry is not None:
+            return entry.read_array()
+    return rgbe.image.read_array(path)
+
+def read(path):
+    "Same as rgbe.io.read but the image can be inside a container"
+    if not os.path.exists(path):
+        entry = find_entry(path)
+        if entry is not None:
+            (width,height),p = entry.read_array()
+            return (width,height),rgbe.image.PixelList(p).tolist()
+    return rgbe.io.read(path)
+
+def convert(nameBase, compress=False, remove=False, prefix=None):
+    """Append all the images <nameBase><iter>.hdr to the container
+    (prefix: "" for the images without prefix, see container_path).
+    The images already inside the container are skipped.
+    Return the number of images added"""
+    directory = os.path.dirname(nameBase) or "."
+    baseName = os.path.basename(nameBase)
+    images = []
+    for entry in os.scandir(directory):
+        if entry.name.startswith(baseName) and entry.name.endswith(".hdr"):
+            intStr = entry.name[len(baseName):-4]
+            if intStr.isdigit():
+                images.append((int(intStr), entry.path))
+    images.sort()
+
+    path = container_path(nameBase, prefix)
+    done = set()
+    if os.path.exists(path):
+        done = set(Container(path).iterations())
+
+    nbAdded = 0
+    with ContainerWriter(path, compress) as writer:
+        for iteration, image in images:
+            if iteration not in done:
+                writer.append_file(iteration, image)
+                nbAdded += 1
+    if remove:
+        for iteration, image in images:
+            os.remove(image)
+    return nbAdded
@@ -0,0 +1,53 @@
+"""
+Array based access to the RADIANCE/PFM images.
+The arrays wrap the decoder buffer (no copy): float32 [height, width, 3]
+"""
+
+import numpy
+import rgbe.io
+
+def read_array(path):
+    "Read an image and return ((width, height), float32 [height, width, 3] array)"
+    (width,height),buf = rgbe.io.read_buffer(path)
+    if buf is None:
+        raise IOError("Impossible to read the image: " + path)
+    return (width,height),numpy.asarray(buf)
+
+def read_list(path):
+    "Same as rgbe.io.read but the pixels are a PixelList view over the array"
+    (width,height),p = read_array(path)
+    return (width,height),PixelList(p)
+
+class PixelList(object):
+    """Compatibility view: behaves like the list of (r,g,b) tuples
+    returned by rgbe.io.read, but the storage is the image array"""
+    def __init__(self, array):
+        self.array = array
+        self.flat = array.reshape(-1, 3)
+
+    def __len__(self):
+        return len(self.flat)
+
+    def __getitem__(self, i):
+        if isinstance(i, slice):
+            return [tuple(p) for p in self.flat[i].tolist()]
+        r,g,b = self.flat[i].tolist()
+        return (r,g,b)
+
+    def __setitem__(self, i, pixel):
+        self.flat[i] = pixel
+
+    def __iter__(self):
+        for p in self.flat.tolist():
+            yield tuple(p)
+
+    def tolist(self):
+        "Convert to the list of tuples (rgbe.io.read format)"
+        return [tuple(p) for p in self.flat.tolist()]
+
+def asarray(pixels, width, height):
+    """Return a float32 [height, width, 3] array from a list of tuples,
+    a PixelList or an array (no copy for the two last)"""
+    if isinstance(pixels, PixelList):
+        return pixels.array
+    return numpy.asarray(pixels, dtype=numpy.float32).reshape(height, width, 3)
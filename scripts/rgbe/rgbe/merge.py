@@ -1,19 +1,19 @@
 import rgbe.io
+import rgbe.image
+import numpy
 import os
 
 def merge(path, w, h, blockSize, outFilename, ext = "hdr"):
 
     # Read all images
-    pix = [0.0]*(w*h)
+    pix = numpy.zeros((h, w, 3), dtype=numpy.float32)
     for x in range(0,w,blockSize):
         for y in range(0,h,blockSize):
             localFile = path + str(x) + "_" + str(y) + "." + ext
             if(os.path.exists(localFile)):
                 # Read and copy all pixels
-                (wLocal,hLocal), pLocal = rgbe.io.read(localFile)
-                for xLoc in range(x,x+wLocal):
-                    for yLoc in range(y,y+hLocal):
-                        pix[yLoc*w + xLoc] = pLocal[(yLoc-y)*wLocal + (xLoc-x)]
+                (wLocal,hLocal), pLocal = rgbe.image.read_array(localFile)
+                pix[y:y+hLocal, x:x+wLocal] = pLocal
             else:
                 print("[WARN] (%i,%i) is missing" % (x,y))
                 
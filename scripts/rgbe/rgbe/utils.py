@@ -1,4 +1,6 @@
 import math
+import itertools
+import numpy
 
 #####
 ##### Norm class
@@ -10,6 +12,10 @@ class EmptyNorm(object):
     def diff(self, c):
         return 1
 
+    def diffArray(self, d):
+        "Norm of all the differences d [..., 3]"
+        return numpy.array([self.diff(c) for c in d.reshape(-1, 3).tolist()]).reshape(d.shape[:-1])
+
 class RMSENorm(EmptyNorm):
     def __init__(self):
         EmptyNorm.__init__(self)
@@ -21,6 +27,11 @@ class RMSENorm(EmptyNorm):
         self.rmse += diff * diff
         return distance
 
+    def diffArray(self, d):
+        distance = rmseNormArray(d)
+        self.rmse += float(numpy.sum(distance * distance))
+        return distance
+
 ####
 #### Color
 ####
@@ -32,6 +43,10 @@ class EmptyFakeColor(object):
     def getColor(self, v):
         "Color coded error function"
         pass
+
+    def getColorArray(self, v):
+        "Colors [..., 3] of all the values v"
+        return numpy.array([self.getColor(x) for x in v.reshape(-1).tolist()]).reshape(v.shape + (3,))
     
 class FakeRedColor(EmptyFakeColor):
     def __init__(self,min=0.0,max=1.0):
@@ -66,38 +81,125 @@ class FakeRedColor(EmptyFakeColor):
         
         return (r, g, b)
 
+    def getColorArray(self, v):
+        return falseColorArray(v, self.min, self.max)
+
+####
+#### Array kernels
+####
+# The frames are numpy arrays [..., 3] (for example rgbe.image.read_array)
+# and all the pixels are processed at once
+
+def asFrame(pixels):
+    "float64 array [..., 3] from a list of (r,g,b), a PixelList or an array"
+    if hasattr(pixels, "array"): # rgbe.image.PixelList
+        pixels = pixels.array
+    if isinstance(pixels, list) and len(pixels) != 0 and isinstance(pixels[0], tuple):
+        # Faster than numpy.asarray on a list of tuples
+        flat = numpy.fromiter(itertools.chain.from_iterable(pixels), dtype=numpy.float64, count=3*len(pixels))
+        return flat.reshape(-1, 3)
+    return numpy.asarray(pixels, dtype=numpy.float64)
+
+def exposureGammaArray(frame, exposure = 1.0, gamma = 2.2):
+    return numpy.power(asFrame(frame) * math.pow(2, exposure), 1.0/gamma)
+
+def toRGB8Array(frame):
+    "Truncate to 8 bits (same as int(c*255) clamped by PIL), NaN become 0"
+    v = numpy.trunc(asFrame(frame) * 255)
+    return numpy.nan_to_num(numpy.clip(v, 0, 255)).astype(numpy.uint8)
+
+def luminanceArray(frame):
+    frame = asFrame(frame)
+    return 0.21268*frame[..., 0] + 0.7152*frame[..., 1] + 0.0722*frame[..., 2]
+
+def diffArray(frame1, frame2):
+    frame1 = asFrame(frame1)
+    frame2 = asFrame(frame2)
+    if(frame1.shape != frame2.shape):
+        raise Exception("Size mismatch")
+    return frame1 - frame2
+
+def rmseNormArray(d):
+    return numpy.sqrt(d[..., 0]*d[..., 0] + d[..., 1]*d[..., 1] + d[..., 2]*d[..., 2])
+
+def falseColorArray(v, min = 0.0, max = 1.0):
+    "Same color ramp as FakeRedColor (blue -> cyan -> green -> yellow -> red)"
+    v = numpy.clip(numpy.asarray(v, dtype=numpy.float64), min, max)
+    dv = max - min
+    c1 = v < (min + 0.25 * dv)
+    c2 = ~c1 & (v < (min + 0.5 * dv))
+    c3 = ~c1 & ~c2 & (v < (min + 0.75 * dv))
+    c4 = ~c1 & ~c2 & ~c3
+    colors = numpy.ones(v.shape + (3,))
+    colors[..., 0] = numpy.where(c1 | c2, 0.0, numpy.where(c3, 4 * (v - min - 0.5 * dv) / dv, 1.0))
+    colors[..., 1] = numpy.where(c1, 4 * (v - min) / dv, numpy.where(c4, 1 + 4 * (min + 0.75 * dv - v) / dv, 1.0))
+    colors[..., 2] = numpy.where(c2, 1 + 4 * (min + 0.25 * dv - v) / dv, numpy.where(c3 | c4, 0.0, 1.0))
+    return colors
+
+def signedColorArray(v, scale = 1.0):
+    "Negative values in red, positive in green (gamma 2.2 on |v|/scale)"
+    v = numpy.asarray(v, dtype=numpy.float64)
+    intensity = numpy.power(numpy.minimum(numpy.abs(v) / scale, 1.0), 1/2.2)
+    colors = numpy.zeros(v.shape + (3,))
+    colors[..., 0] = numpy.where(v < 0.0, intensity, 0.0)
+    colors[..., 1] = numpy.where(v > 0.0, intensity, 0.0)
+    return colors
+
+####
+#### Color LUT
+####
+# Scalar fields are mapped to colors through a 256 entries LUT
+# (same binning as the matplotlib colormaps, without any figure)
+
+LUT_SIZE = 256
+
+def lutFromColors(colors):
+    "uint8 LUT [N, 3] from a list of (r,g,b) floats in [0, 1] (ex. colormaps.py data)"
+    return numpy.trunc(numpy.clip(numpy.asarray(colors, dtype=numpy.float64), 0.0, 1.0) * 255).astype(numpy.uint8)
+
+def falseColorLUT(size = LUT_SIZE):
+    "LUT of the false color ramp (FakeRedColor, falseColor in imageerrors.h)"
+    return lutFromColors(falseColorArray((numpy.arange(size) + 0.5) / size, 0.0, 1.0))
+
+# Color of the NaN values (the "bad" color of the matplotlib figures)
+NAN_COLOR = (255, 255, 255)
+
+def applyLUT(data, lut, vmin = 0.0, vmax = 1.0, nanColor = NAN_COLOR):
+    """Colors (uint8 [..., 3]) of a scalar field: [vmin, vmax] is split into
+    len(lut) bins, the values outside are clamped, NaN take nanColor"""
+    data = numpy.asarray(data, dtype=numpy.float64)
+    size = len(lut)
+    with numpy.errstate(divide='ignore', invalid='ignore'):
+        t = (data - vmin) * (float(size) / (vmax - vmin))
+    t = numpy.nan_to_num(t, nan=0.0, posinf=size - 1, neginf=0.0)
+    colors = lut[numpy.clip(t, 0, size - 1).astype(numpy.intp)]
+    colors[numpy.isnan(data)] = nanColor
+    return colors
+
+def toTuples(frame):
+    "Convert back to the list of (r,g,b) format"
+    return list(zip(*frame.reshape(-1, 3).T.tolist()))
+
 ####
 #### Compatibility functions
 ####
 
 def copyPixeltoPIL(width, height, pixels, im):
-#     for x in range(width):
-#         for y in range(height):
-#             c = pixels[y*width+x]
-#             pixelExp = (int(c[0]*255),
-#                         int(c[1]*255),
-#                         int(c[2]*255))
-#             im[x,y] = pixelExp
-    pInt = [(int(c[0]*255),int(c[1]*255),int(c[2]*255)) for c in pixels]
-    im.putdata(pInt)
+    im.frombytes(toRGB8Array(pixels).reshape(height, width, 3).tobytes())
 
 ####
 #### Image manipulation methods
 ####
 
 def applyExposureGamma(pixels, exposure = 1.0, gamma = 2.2):
-#     def expo(p,exp,invG):
-#         return (math.pow(p[0]*exp,invG),
-#                 math.pow(p[1]*exp,invG),
-#                 math.pow(p[2]*exp,invG))
-    exp = math.pow(2, exposure)
-    invG = 1.0/gamma
-#     return map((lambda x: expo(x,exp,invG)), pixels)
-    for i in range(len(pixels)):
-        p = pixels[i]
-        pixels[i] = (math.pow(p[0]*exp,invG),
-                     math.pow(p[1]*exp,invG), 
-                     math.pow(p[2]*exp,invG))
+    "In place (list of (r,g,b), PixelList or array)"
+    res = exposureGammaArray(pixels, exposure, gamma)
+    if hasattr(pixels, "array"):
+        pixels.array[...] = res
+    elif isinstance(pixels, numpy.ndarray):
+        pixels[...] = res
+    else:
+        pixels[:] = toTuples(res)
 
 ####
 #### Compute methods
@@ -106,41 +208,22 @@ def applyExposureGamma(pixels, exposure = 1.0, gamma = 2.2):
 def diff(p1, p2):
     if(len(p1) != len(p2)):
         raise Exception("Size mismatch")
-    
-    res = [0]*len(p1)
-    
-    for i in range(len(p1)):
-        pixel = p1[i]
-        pixelRef = p2[i]
-        
-        Rdiff = pixel[0] - pixelRef[0]
-        Gdiff = pixel[1] - pixelRef[1]
-        Bdiff = pixel[2] - pixelRef[2]
-        
-        res[i] = (Rdiff, Gdiff, Bdiff)
-        
-    return res
+    if isinstance(p1, list) and isinstance(p2, list):
+        # Nothing to vectorize: the conversion would cost more than the subtraction
+        return [(a[0]-b[0], a[1]-b[1], a[2]-b[2]) for a, b in zip(p1, p2)]
+    return toTuples(diffArray(p1, p2))
 
-def computeNorm(p1, p2, norm):
-    d = diff(p1,p2)
-    
+def computeNormArray(p1, p2, norm):
     if(not isinstance(norm, EmptyNorm)):
         raise Exception("Need define Norm as EmptyNormHerit")
-    
-    n = [0]*len(d)
-    for i in range(len(d)):
-        n[i] = norm.diff(d[i])
-    
-    return n
+    if(len(p1) != len(p2)):
+        raise Exception("Size mismatch")
+    return norm.diffArray(diffArray(p1, p2)).reshape(-1)
+
+def computeNorm(p1, p2, norm):
+    return computeNormArray(p1, p2, norm).tolist()
 
 def computeNormFakeColor(p1, p2, norm, fakeColor):
-    n = computeNorm(p1, p2, norm)
-    
     if(not isinstance(fakeColor, EmptyFakeColor)):
         raise Exception("Need define fakeColor as EmptyNormHerit")
-    
-    for i in range(len(n)):
-        n[i] = fakeColor.getColor(n[i])
-    
-    return n
-
+    return toTuples(fakeColor.getColorArray(computeNormArray(p1, p2, norm)))
@@ -2,6 +2,7 @@
 #include <stdio.h>
 #include <math.h>
 #include <vector>
+#include <algorithm>
 #include <iostream>
 #include <omp.h>
 
@@ -12,16 +13,78 @@
 #include "imageerrors.h"
 #include "format/format.h"
 
-double* convertListIntoArray(PyObject *imgHDR, int nbPixels, float mult) {
-  double * data = new double[3 * nbPixels];
-  for (int i = 0; i < nbPixels; ++i) {
-    for (int j = 0; j < 3; ++j) {
-      data[i * 3 + j] = (double) PyFloat_AsDouble(
-          PyTuple_GetItem(PyList_GetItem(imgHDR, i), j)) * mult;
+///////////////////////////////////////////////////////////////////////////////
+///////////////////////////////////////////////////////////////////////////////
+// Threading
+///////////////////////////////////////////////////////////////////////////////
+///////////////////////////////////////////////////////////////////////////////
+// - The python images (list or buffer) are converted with the GIL held.
+//   The GIL is released during the image decoding and the metric
+//   computation, so several python threads can call these functions
+//   concurrently (and overlap with other python work).
+// - The buffers given as input must not be modified by another thread
+//   during the call (float64 buffers are used in place).
+// - Each call uses an OpenMP team for rmse_all_images*. When several
+//   python threads score concurrently, use set_num_threads() to share
+//   the cores between the calls (0: OpenMP default).
+
+static int g_numThreads = 0;
+
+static void rgbe_set_num_threads(int nbThreads) {
+  g_numThreads = nbThreads > 0 ? nbThreads : 0;
+}
+
+static int rgbe_get_num_threads() {
+  return g_numThreads > 0 ? g_numThreads : omp_get_max_threads();
+}
+
+// Image given by python (list of (r,g,b) tuples or float32/float64 buffer)
+// as an array of doubles multiplied by mult.
+// A float64 buffer is used directly (no copy) when mult is 1, so the same
+// reference can be given to several calls without any conversion.
+class InputImage {
+public:
+  InputImage(PyObject *img, int nbPixels, float mult) :
+      owned(NULL), ptr(NULL), hasView(false) {
+    if (mult == 1.f && PyImage_getBuffer(img, 3 * (Py_ssize_t) nbPixels, &view)) {
+      if (view.itemsize == sizeof(double)) {
+        ptr = (const double*) view.buf;
+        hasView = true;
+        return;
+      }
+      PyBuffer_Release(&view);
+    }
+
+    owned = new double[3 * nbPixels];
+    if (!PyImage_fill(img, nbPixels, mult, owned)) {
+      delete[] owned;
+      boost::python::throw_error_already_set();
     }
+    ptr = owned;
+  }
+
+  ~InputImage() {
+    if (hasView) {
+      PyBuffer_Release(&view);
+    }
+    if (owned) {
+      delete[] owned;
+    }
+  }
+
+  const double* data() const {
+    return ptr;
   }
-  return data;
-}
+
+private:
+  InputImage(const InputImage&);
+  InputImage& operator=(const InputImage&);
+
+  double* owned;
+  const double* ptr;
+  Py_buffer view;
+  bool hasView;
+};
 
 unsigned char* convertListIntoArrayMask(PyObject *imgMask, int nbPixels) {
   unsigned char* data = new unsigned char[nbPixels];
@@ -54,8 +117,8 @@ static PyObject * rgbe_rmse(int width, int height, PyObject *imgHDR1,
 #endif
 
   // Read all images
-  double * imgHDR1Data = convertListIntoArray(imgHDR1, width * height, mult);
-  double * imgHDR2Data = convertListIntoArray(imgHDR2, width * height, mult);
+  InputImage imgHDR1Data(imgHDR1, width * height, mult);
+  InputImage imgHDR2Data(imgHDR2, width * height, mult);
   unsigned char * imgMaskData = 0;
   if (imgMask != 0 && imgMask != Py_None) {
     imgMaskData = convertListIntoArrayMask(imgMask, width * height);
@@ -63,8 +126,11 @@ static PyObject * rgbe_rmse(int width, int height, PyObject *imgHDR1,
 
   // Compute the difference and fill diff image
   unsigned char * imgDiffData = new unsigned char[width * height * 3];
-  float error = metric(imgHDR1Data, imgHDR2Data, imgMaskData, imgDiffData,
+  float error;
+  Py_BEGIN_ALLOW_THREADS
+  error = metric(imgHDR1Data.data(), imgHDR2Data.data(), imgMaskData, imgDiffData,
       width, height, (EErrorMetric) typeMetric);
+  Py_END_ALLOW_THREADS
 
   // We write back the difference image to a python object
   // And pack the results
@@ -79,8 +145,6 @@ static PyObject * rgbe_rmse(int width, int height, PyObject *imgHDR1,
 
   // Free memory
   delete[] imgDiffData;
-  delete[] imgHDR1Data;
-  delete[] imgHDR2Data;
   if (imgMaskData)
     delete[] imgMaskData;
 
@@ -95,27 +159,27 @@ static PyObject * rgbe_rmse_all(int width, int height, PyObject *imgHDR1,
 #endif
 
   // Read all images
-  double * imgHDR1Data = convertListIntoArray(imgHDR1, width * height, mult);
-  double * imgHDR2Data = convertListIntoArray(imgHDR2, width * height, mult);
+  InputImage imgHDR1Data(imgHDR1, width * height, mult);
+  InputImage imgHDR2Data(imgHDR2, width * height, mult);
   unsigned char * imgMaskData = 0;
   if (imgMask != 0 && imgMask != Py_None) {
     imgMaskData = convertListIntoArrayMask(imgMask, width * height);
   }
 
   float errors[6];
+  Py_BEGIN_ALLOW_THREADS
   for (int idError = 0; idError < 6; idError++) {
     // We compute the RMSE
-    float error = metric(imgHDR1Data, imgHDR2Data, imgMaskData, NULL, width,
+    float error = metric(imgHDR1Data.data(), imgHDR2Data.data(), imgMaskData, NULL, width,
         height, (EErrorMetric) idError);
     errors[idError] = error;
   }
+  Py_END_ALLOW_THREADS
 
   PyObject * resultsPy = Py_BuildValue("ffffff", errors[0], errors[1],
       errors[2], errors[3], errors[4], errors[5]);
 
   // Free memory
-  delete[] imgHDR1Data;
-  delete[] imgHDR2Data;
   if (imgMaskData)
     delete[] imgMaskData;
 
@@ -123,67 +187,150 @@ static PyObject * rgbe_rmse_all(int width, int height, PyObject *imgHDR1,
   return resultsPy;
 }
 
-static PyObject * rgbe_rmse_all_images(int width, int height,
-    PyObject *imagesPath, PyObject *imgHDR2, float mult = 1.f,
-    PyObject *imgMask = NULL) {
+///////////////////////////////////////////////////////////////////////////////
+///////////////////////////////////////////////////////////////////////////////
+// Image metric kernels (called without the GIL)
+///////////////////////////////////////////////////////////////////////////////
+///////////////////////////////////////////////////////////////////////////////
 
-  // Read all images passed
+const int NBMETRIC = 7;
+
+// If there is an error on the image reading
+static void invalidMetrics(float * metrics) {
+  for (int idError = 0; idError < NBMETRIC; idError++) {
+    metrics[idError] = -1.f; // Invalid number
+  }
+}
+
+// Compute all the metrics between the image and the reference
+static void imageMetrics(const double * imageHDRDouble, int width, int height,
+    const double * imgHDRRef, const unsigned char * imgMaskData,
+    float * metrics) {
+  for (int idError = 0; idError < NBMETRIC; idError++) {
+    // We compute the RMSE
+    metrics[idError] = metric(imageHDRDouble, imgHDRRef, imgMaskData, NULL,
+        width, height, (EErrorMetric) idError);
+  }
+}
+
+// Same as imageMetrics but only the percentage of pixels
+// with the lowest error is taken into account
+static void imageMetricsPercentage(const double * imageHDRDouble, int width,
+    int height, const double * imgHDRRef, float percentage, float * metrics) {
+  std::vector<float> pixelErrors(width * height, 0.0f);
+  for (int idError = 0; idError < NBMETRIC; idError++) {
+    // Compute error pixel wise
+    for (int p = 0; p < width * height; ++p) {
+      pixelErrors[p] = metricPix(imageHDRDouble, imgHDRRef, p, (EErrorMetric) idError);
+    }
+
+    // Sort the metric vector
+    // and compute the metric for the percentage of selected pixels
+    std::sort(pixelErrors.begin(), pixelErrors.end());
+    float error = 0.f;
+    for (int p = 0; p < width * height * percentage; ++p) {
+      error += pixelErrors[p];
+    }
+    metrics[idError] = errorNorm(error, width * height * percentage, (EErrorMetric) idError);
+  }
+}
+
+// Same as above for an image file (path)
+// metrics: NBMETRIC values (-1 if the image can not be read)
+static void imageMetrics(const std::string& path, int width, int height,
+    const double * imgHDRRef, const unsigned char * imgMaskData,
+    float * metrics) {
+  // Open the image
+  Format* f = loadImage(path);
+  if (f != NULL && f->getWidth() == width && f->getHeight() == height) {
+    double * imageHDRDouble = f->toDouble();
+    imageMetrics(imageHDRDouble, width, height, imgHDRRef, imgMaskData, metrics);
+    delete[] imageHDRDouble;
+  } else {
+    invalidMetrics(metrics);
+  }
+  delete f;
+}
+
+// Note that the image is multiplied by mult
+static void imageMetricsPercentage(const std::string& path, int width,
+    int height, const double * imgHDRRef, float mult, float percentage,
+    float * metrics) {
+  // Open the image
+  Format* f = loadImage(path);
+  if (f != NULL && f->getWidth() == width && f->getHeight() == height) {
+    double * imageHDRDouble = f->toDouble(mult);
+    imageMetricsPercentage(imageHDRDouble, width, height, imgHDRRef, percentage, metrics);
+    delete[] imageHDRDouble;
+  } else {
+    invalidMetrics(metrics);
+  }
+  delete f;
+}
+
+static PyObject * packMetrics(const float * metrics) {
+  return Py_BuildValue("fffffff", metrics[0], metrics[1], metrics[2],
+      metrics[3], metrics[4], metrics[5], metrics[6]);
+}
+
+static void printMetrics(const std::string& path, const float * metrics) {
+  std::cout << path << ": ( " << metrics[0] << "; " << metrics[1]
+      << "; " << metrics[2] << "; " << metrics[3] << "; "
+      << metrics[4] << "; " << metrics[5] << "; " << metrics[6] << ")\n";
+}
+
+static std::vector<std::string> readPaths(PyObject *imagesPath) {
   std::vector<std::string> images;
   int nbImages = PyList_Size(imagesPath);
   for (int i = 0; i < nbImages; i++) {
     images.push_back(
         boost::python::extract<std::string>(PyList_GetItem(imagesPath, i)));
   }
+  return images;
+}
+
+///////////////////////////////////////////////////////////////////////////////
+///////////////////////////////////////////////////////////////////////////////
+// Metrics over images files
+///////////////////////////////////////////////////////////////////////////////
+///////////////////////////////////////////////////////////////////////////////
+
+static PyObject * rgbe_rmse_all_images(int width, int height,
+    PyObject *imagesPath, PyObject *imgHDR2, float mult = 1.f,
+    PyObject *imgMask = NULL) {
+
+  // Read all images passed
+  std::vector<std::string> images = readPaths(imagesPath);
 
   // Read the reference image and mask
-  double * imgHDRRef = convertListIntoArray(imgHDR2, width * height, mult);
+  InputImage imgRef(imgHDR2, width * height, mult);
+  const double * imgHDRRef = imgRef.data();
   unsigned char * imgMaskData = 0;
   if (imgMask != 0 && imgMask != Py_None) {
     imgMaskData = convertListIntoArrayMask(imgMask, width * height);
   }
 
-  const int NBMETRIC = 7;
-
   // Launch the computation
-  std::vector<std::vector<float> > metrics(images.size());
+  std::vector<float> metrics(images.size() * NBMETRIC);
+  int nbThreads = rgbe_get_num_threads();
 
-#pragma omp parallel for
+  Py_BEGIN_ALLOW_THREADS
+#pragma omp parallel for num_threads(nbThreads)
   for (int i = 0; i < (int) images.size(); i++) {
-    // Open the image
-    Format* f = loadImage(images[i]);
-    if (f != NULL && f->getWidth() == width && f->getHeight() == height) {
-      double * imageHDRDouble = f->toDouble();
-      // Else, compute the metric
-      for (int idError = 0; idError < NBMETRIC; idError++) {
-        // We compute the RMSE
-        float error = metric(imageHDRDouble, imgHDRRef, imgMaskData, NULL,
-            width, height, (EErrorMetric) idError);
-        metrics[i].push_back(error);
-      }
-      delete[] imageHDRDouble;
-    } else {
-      // If there is an error on the image reading
-      for (int i = 0; i < NBMETRIC; i++) {
-        metrics[i].push_back(-1.f); // Invalid number
-      }
-    }
-
-    delete f;
-    std::cout << images[i] << ": ( " << metrics[i][0] << "; " << metrics[i][1]
-        << "; " << metrics[i][2] << "; " << metrics[i][3] << "; "
-        << metrics[i][4] << "; " << metrics[i][5] << "; " << metrics[i][6] << ")\n";
+    imageMetrics(images[i], width, height, imgHDRRef, imgMaskData,
+        &metrics[i * NBMETRIC]);
+    printMetrics(images[i], &metrics[i * NBMETRIC]);
   }
+  Py_END_ALLOW_THREADS
 
   // Free memory
-  delete[] imgHDRRef;
   if (imgMaskData)
     delete[] imgMaskData;
 
   // Construct the python results
   PyObject * resPy = PyList_New(images.size());
   for(int i = 0; i < images.size(); i++) {
-    PyList_SetItem(resPy, i, Py_BuildValue("fffffff", metrics[i][0], metrics[i][1],
-        metrics[i][2], metrics[i][3], metrics[i][4], metrics[i][5],metrics[i][6]));
+    PyList_SetItem(resPy, i, packMetrics(&metrics[i * NBMETRIC]));
   }
 
   return resPy;
@@ -193,80 +340,219 @@ static PyObject * rgbe_rmse_all_images_percentage(int width, int height, float p
                                        PyObject *imagesPath, PyObject *imgHDR2, float mult = 1.f) {
 
   // Read all images passed
-  std::vector<std::string> images;
-  int nbImages = PyList_Size(imagesPath);
-  for (int i = 0; i < nbImages; i++) {
-    images.push_back(
-      boost::python::extract<std::string>(PyList_GetItem(imagesPath, i)));
-  }
+  std::vector<std::string> images = readPaths(imagesPath);
 
   if(percentage > 1.f || percentage <= 0.f) {
     std::cerr << "Invalid percentage: " << percentage << "\n";
     return 0;
   }
 
-  // Read the reference image and mask
-  double * imgHDRRef = convertListIntoArray(imgHDR2, width * height, mult);
-  unsigned char * imgMaskData = 0; // No mask for now
-
-  const int NBMETRIC = 7;
+  // Read the reference image
+  InputImage imgRef(imgHDR2, width * height, mult);
+  const double * imgHDRRef = imgRef.data();
 
   // Launch the computation
-  std::vector<std::vector<float> > metrics(images.size());
+  std::vector<float> metrics(images.size() * NBMETRIC);
+  int nbThreads = rgbe_get_num_threads();
 
-#pragma omp parallel for
+  Py_BEGIN_ALLOW_THREADS
+#pragma omp parallel for num_threads(nbThreads)
   for (int i = 0; i < (int) images.size(); i++) {
-    // Open the image
+    imageMetricsPercentage(images[i], width, height, imgHDRRef, mult,
+        percentage, &metrics[i * NBMETRIC]);
+    printMetrics(images[i], &metrics[i * NBMETRIC]);
+  }
+  Py_END_ALLOW_THREADS
+
+  // Construct the python results
+  PyObject * resPy = PyList_New(images.size());
+  for(int i = 0; i < images.size(); i++) {
+    PyList_SetItem(resPy, i, packMetrics(&metrics[i * NBMETRIC]));
+  }
+
+  return resPy;
+}
+
+/// Metrics for several percentages and exposures in a single pass
+// Each image is read once. For each exposure (mult) and each percentage,
+// the metrics are computed over the percentage of pixels with the lowest
+// error. The selection is done with nth_element (no full sort): the
+// percentages are processed in decreasing order, each selection working
+// on the pixels selected by the previous one.
+// The mults are applied as the single configuration functions do:
+// for a percentage of 1, only the reference is scaled (as
+// rmse_all_images), otherwise both the image and the reference are
+// scaled (as rmse_all_images_percentage)
+// Returns a FloatBuffer [nbImages, nbMults * nbPercentages, NBMETRIC]
+// where the configuration index is idMult * nbPercentages + idPercentage
+// (-1 if the image can not be read)
+static PyObject * rgbe_rmse_all_images_multi(int width, int height,
+    PyObject *imagesPath, PyObject *imgHDR2, PyObject *multsPy,
+    PyObject *percentagesPy) {
+
+  std::vector<std::string> images = readPaths(imagesPath);
+  std::vector<float> mults, percentages;
+  for (int i = 0; i < PyList_Size(multsPy); i++) {
+    mults.push_back(boost::python::extract<float>(PyList_GetItem(multsPy, i)));
+  }
+  for (int i = 0; i < PyList_Size(percentagesPy); i++) {
+    percentages.push_back(
+        boost::python::extract<float>(PyList_GetItem(percentagesPy, i)));
+    if(percentages.back() > 1.f || percentages.back() <= 0.f) {
+      PyErr_SetString(PyExc_ValueError, "Invalid percentage");
+      boost::python::throw_error_already_set();
+    }
+  }
+  if (mults.empty() || percentages.empty()) {
+    PyErr_SetString(PyExc_ValueError, "Need at least one mult and one percentage");
+    boost::python::throw_error_already_set();
+  }
+
+  // Percentages processed by decreasing order
+  std::vector<int> order(percentages.size());
+  for (int i = 0; i < (int) order.size(); i++) {
+    order[i] = i;
+  }
+  std::sort(order.begin(), order.end(),
+      [&percentages](int a, int b) { return percentages[a] > percentages[b]; });
+
+  // Reference scaled by all the mults
+  const int nbPixels = width * height;
+  const int nbConfigs = mults.size() * percentages.size();
+  InputImage imgRef(imgHDR2, nbPixels, 1.f);
+  std::vector<std::vector<double> > refs(mults.size(), std::vector<double>(nbPixels * 3));
+  for (int m = 0; m < (int) mults.size(); m++) {
+    for (int i = 0; i < nbPixels * 3; i++) {
+      refs[m][i] = imgRef.data()[i] * mults[m];
+    }
+  }
+
+  // Configurations with all the pixels and with a selection of pixels
+  bool hasAllPixels = false, hasSelection = false;
+  for (int k = 0; k < (int) percentages.size(); k++) {
+    if (percentages[k] >= 1.f) {
+      hasAllPixels = true;
+    } else {
+      hasSelection = true;
+    }
+  }
+
+  float* metrics = (float*) malloc(sizeof(float) * images.size() * nbConfigs * NBMETRIC);
+  int nbThreads = rgbe_get_num_threads();
+
+  Py_BEGIN_ALLOW_THREADS
+#pragma omp parallel for num_threads(nbThreads)
+  for (int i = 0; i < (int) images.size(); i++) {
+    float* metricsImage = &metrics[i * nbConfigs * NBMETRIC];
     Format* f = loadImage(images[i]);
-    if (f != NULL && f->getWidth() == width && f->getHeight() == height) {
-      double * imageHDRDouble = f->toDouble(mult);
-      // Else, compute the metric
+    if (f == NULL || f->getWidth() != width || f->getHeight() != height) {
+      for (int k = 0; k < nbConfigs * NBMETRIC; k++) {
+        metricsImage[k] = -1.f; // Invalid number
+      }
+      delete f;
+      continue;
+    }
+
+    std::vector<float> pixelErrors(nbPixels);
+    double * imageNotScaled = hasAllPixels ? f->toDouble() : NULL;
+    for (int m = 0; m < (int) mults.size(); m++) {
+      double * imageHDRDouble = hasSelection ? f->toDouble(mults[m]) : NULL;
       for (int idError = 0; idError < NBMETRIC; idError++) {
-        // Compute error pixel wise
-        std::vector<float> pixelErrors(f->getWidth()*f->getHeight(), 0.0f);
-        for (int i = 0; i < width * height; ++i) {
-          pixelErrors[i] = metricPix(imageHDRDouble, imgHDRRef, i, (EErrorMetric) idError);
+        if (hasAllPixels) {
+          // Same computation (and summation order) as rmse_all_images
+          float error = metric(imageNotScaled, &refs[m][0], NULL, NULL,
+              width, height, (EErrorMetric) idError);
+          for (int k = 0; k < (int) percentages.size(); k++) {
+            if (percentages[k] >= 1.f) {
+              int config = m * percentages.size() + k;
+              metricsImage[config * NBMETRIC + idError] = error;
+            }
+          }
+        }
+        if (!hasSelection) {
+          continue;
         }
 
-        // Sort the metric vector
-        // and compute the metric for the percentage of selected pixels
-        std::sort(pixelErrors.begin(), pixelErrors.end());
-        float error = 0.f;
-        for (int i = 0; i < width * height * percentage; ++i) {
-          error += pixelErrors[i];
+        // Compute error pixel wise
+        for (int p = 0; p < nbPixels; ++p) {
+          pixelErrors[p] = metricPix(imageHDRDouble, &refs[m][0], p, (EErrorMetric) idError);
         }
-        error = errorNorm(error, width * height * percentage, (EErrorMetric) idError);
 
-        // We compute the RMSE
-        metrics[i].push_back(error);
+        int limit = nbPixels;
+        for (int o = 0; o < (int) order.size(); o++) {
+          if (percentages[order[o]] >= 1.f) {
+            continue; // Computed above
+          }
+          float bound = nbPixels * percentages[order[o]];
+          int nbSelected = std::min((int) ceilf(bound), nbPixels);
+          if (nbSelected < limit) {
+            std::nth_element(pixelErrors.begin(), pixelErrors.begin() + nbSelected,
+                pixelErrors.begin() + limit);
+            limit = nbSelected;
+          }
+
+          // nth_element does not order the selected pixels:
+          // accumulate in double to be independent of the order
+          double error = 0.0;
+          for (int p = 0; p < nbSelected; ++p) {
+            error += pixelErrors[p];
+          }
+          int config = m * percentages.size() + order[o];
+          metricsImage[config * NBMETRIC + idError] =
+              errorNorm(error, bound, (EErrorMetric) idError);
+        }
       }
       delete[] imageHDRDouble;
-    } else {
-      // If there is an error on the image reading
-      for (int i = 0; i < NBMETRIC; i++) {
-        metrics[i].push_back(-1.f); // Invalid number
-      }
     }
-
+    delete[] imageNotScaled;
     delete f;
-    std::cout << images[i] << ": ( " << metrics[i][0] << "; " << metrics[i][1]
-              << "; " << metrics[i][2] << "; " << metrics[i][3] << "; "
-              << metrics[i][4] << "; " << metrics[i][5] << "; " << metrics[i][6] << ")\n";
   }
+  Py_END_ALLOW_THREADS
 
-  // Free memory
-  delete[] imgHDRRef;
-  if (imgMaskData)
-    delete[] imgMaskData;
+  return FloatBuffer_new(metrics, images.size(), nbConfigs, NBMETRIC);
+}
 
-  // Construct the python results
-  PyObject * resPy = PyList_New(images.size());
-  for(int i = 0; i < images.size(); i++) {
-    PyList_SetItem(resPy, i, Py_BuildValue("fffffff", metrics[i][0], metrics[i][1],
-                                           metrics[i][2], metrics[i][3], metrics[i][4], metrics[i][5],metrics[i][6]));
+/// Metrics for a single image (streaming usage)
+// The image is a path or an image array (see PyImage_fill)
+// Same as rmse_all_images (percentage == 1) or
+// rmse_all_images_percentage, without any output on stdout.
+// Nothing is parallelized here: the parallelism comes from the caller
+// (python threads, the GIL is released)
+static PyObject * rgbe_rmse_image(int width, int height,
+    PyObject *image, PyObject *imgHDR2, float mult = 1.f,
+    float percentage = 1.f) {
+  if(percentage > 1.f || percentage <= 0.f) {
+    PyErr_SetString(PyExc_ValueError, "Invalid percentage");
+    boost::python::throw_error_already_set();
   }
 
-  return resPy;
+  InputImage imgRef(imgHDR2, width * height, mult);
+  float metrics[NBMETRIC];
+
+  if (PyUnicode_Check(image)) {
+    std::string path = boost::python::extract<std::string>(image);
+    Py_BEGIN_ALLOW_THREADS
+    if (percentage == 1.f) {
+      imageMetrics(path, width, height, imgRef.data(), NULL, metrics);
+    } else {
+      imageMetricsPercentage(path, width, height, imgRef.data(), mult,
+          percentage, metrics);
+    }
+    Py_END_ALLOW_THREADS
+  } else {
+    // Same scaling as the image files
+    InputImage img(image, width * height, percentage == 1.f ? 1.f : mult);
+    Py_BEGIN_ALLOW_THREADS
+    if (percentage == 1.f) {
+      imageMetrics(img.data(), width, height, imgRef.data(), NULL, metrics);
+    } else {
+      imageMetricsPercentage(img.data(), width, height, imgRef.data(),
+          percentage, metrics);
+    }
+    Py_END_ALLOW_THREADS
+  }
+
+  return packMetrics(metrics);
 }
 
 BOOST_PYTHON_MODULE(fast)
@@ -274,8 +560,22 @@ BOOST_PYTHON_MODULE(fast)
   using namespace boost::python;
 
   // Read methods
-  boost::python::def("rmse", rgbe_rmse);
-  boost::python::def("rmse_all", rgbe_rmse_all);
-  boost::python::def("rmse_all_images", rgbe_rmse_all_images);
-  boost::python::def("rmse_all_images_percentage", rgbe_rmse_all_images_percentage);
+  // (the GIL is released during the computations, see "Threading")
+  boost::python::def("rmse", rgbe_rmse,
+      "rmse(width, height, img1, img2, mult, typeMetric, mask) -> (error, diffImage)");
+  boost::python::def("rmse_all", rgbe_rmse_all,
+      "rmse_all(width, height, img1, img2, mult, mask) -> 6 metrics");
+  boost::python::def("rmse_all_images", rgbe_rmse_all_images,
+      "rmse_all_images(width, height, paths, ref, mult, mask) -> [7 metrics per image]");
+  boost::python::def("rmse_all_images_percentage", rgbe_rmse_all_images_percentage,
+      "rmse_all_images_percentage(width, height, percentage, paths, ref, mult) -> [7 metrics per image]");
+  boost::python::def("rmse_all_images_multi", rgbe_rmse_all_images_multi,
+      "rmse_all_images_multi(width, height, paths, ref, mults, percentages) -> FloatBuffer [image, mult*percentage, 7 metrics]");
+  boost::python::def("rmse_image", rgbe_rmse_image,
+      "rmse_image(width, height, path or image, ref, mult, percentage) -> 7 metrics (-1 if unreadable)");
+
+  // Threading
+  boost::python::def("set_num_threads", rgbe_set_num_threads,
+      "Number of OpenMP threads used by each call (0: OpenMP default)");
+  boost::python::def("get_num_threads", rgbe_get_num_threads);
 }
@@ -0,0 +1,165 @@
+#pragma once
+
+#include <Python.h>
+#include <stdlib.h>
+
+///////////////////////////////////////////////////////////////////////////////
+///////////////////////////////////////////////////////////////////////////////
+// FloatBuffer: float32 3D array exposed through the buffer protocol
+///////////////////////////////////////////////////////////////////////////////
+///////////////////////////////////////////////////////////////////////////////
+// The object takes the ownership of a malloc'ed float array
+// (for example the decoder data) and exposes it without any copy.
+// In Python: numpy.asarray(buffer) -> float32 [dim0, dim1, dim2]
+
+typedef struct {
+  PyObject_HEAD
+  float* data;
+  Py_ssize_t shape[3];
+  Py_ssize_t strides[3];
+} FloatBufferObject;
+
+static void FloatBuffer_dealloc(FloatBufferObject* self) {
+  if (self->data) {
+    free(self->data);
+  }
+  Py_TYPE(self)->tp_free((PyObject*) self);
+}
+
+static int FloatBuffer_getbuffer(FloatBufferObject* self, Py_buffer* view,
+                                 int flags) {
+  view->obj = (PyObject*) self;
+  Py_INCREF(self);
+  view->buf = self->data;
+  view->len = self->shape[0] * self->shape[1] * self->shape[2] * sizeof(float);
+  view->readonly = 0;
+  view->itemsize = sizeof(float);
+  view->format = (flags & PyBUF_FORMAT) ? (char*) "f" : NULL;
+  view->ndim = 3;
+  view->shape = (flags & PyBUF_ND) ? self->shape : NULL;
+  view->strides = ((flags & PyBUF_STRIDES) == PyBUF_STRIDES) ? self->strides : NULL;
+  view->suboffsets = NULL;
+  view->internal = NULL;
+  return 0;
+}
+
+static PyBufferProcs FloatBuffer_as_buffer = {
+  (getbufferproc) FloatBuffer_getbuffer,
+  NULL
+};
+
+static PyTypeObject FloatBufferType = {
+  PyVarObject_HEAD_INIT(NULL, 0)
+};
+
+bool FloatBuffer_ready() {
+  if (FloatBufferType.tp_name == NULL) {
+    FloatBufferType.tp_name = "rgbe.FloatBuffer";
+    FloatBufferType.tp_basicsize = sizeof(FloatBufferObject);
+    FloatBufferType.tp_dealloc = (destructor) FloatBuffer_dealloc;
+    FloatBufferType.tp_as_buffer = &FloatBuffer_as_buffer;
+    FloatBufferType.tp_flags = Py_TPFLAGS_DEFAULT;
+    FloatBufferType.tp_doc = "float32 array (buffer protocol)";
+  }
+  return PyType_Ready(&FloatBufferType) == 0;
+}
+
+// Wrap data (the ownership is transferred to the python object)
+// If data is NULL, None is returned
+PyObject* FloatBuffer_new(float* data, int dim0, int dim1, int dim2) {
+  if (data == NULL) {
+    Py_RETURN_NONE;
+  }
+  if (!FloatBuffer_ready()) {
+    free(data);
+    return NULL;
+  }
+
+  FloatBufferObject* self = PyObject_New(FloatBufferObject, &FloatBufferType);
+  if (self == NULL) {
+    free(data);
+    return NULL;
+  }
+  self->data = data;
+  self->shape[0] = dim0;
+  self->shape[1] = dim1;
+  self->shape[2] = dim2;
+  self->strides[2] = sizeof(float);
+  self->strides[1] = dim2 * sizeof(float);
+  self->strides[0] = dim1 * dim2 * sizeof(float);
+  return (PyObject*) self;
+}
+
+///////////////////////////////////////////////////////////////////////////////
+///////////////////////////////////////////////////////////////////////////////
+// Images given by python
+///////////////////////////////////////////////////////////////////////////////
+///////////////////////////////////////////////////////////////////////////////
+// An image can be a list of (r,g,b) tuples (rgbe.io.read format) or
+// any C contiguous float32/float64 buffer with 3*nbPixels values
+// (numpy array, memoryview, FloatBuffer, ...)
+
+// Get the buffer of obj. Return false (without python error) if
+// obj does not provide a float32/float64 buffer of nbValues elements
+bool PyImage_getBuffer(PyObject* obj, Py_ssize_t nbValues, Py_buffer* view) {
+  if (!PyObject_CheckBuffer(obj)) {
+    return false;
+  }
+  if (PyObject_GetBuffer(obj, view, PyBUF_C_CONTIGUOUS | PyBUF_FORMAT) != 0) {
+    PyErr_Clear();
+    return false;
+  }
+
+  // Skip byte order character (native only)
+  const char* format = view->format ? view->format : "B";
+  if (format[0] == '@' || format[0] == '=') {
+    format++;
+  }
+  bool valid = (strcmp(format, "f") == 0 && view->itemsize == sizeof(float))
+      || (strcmp(format, "d") == 0 && view->itemsize == sizeof(double));
+  if (!valid || view->len != nbValues * view->itemsize) {
+    PyBuffer_Release(view);
+    return false;
+  }
+  return true;
+}
+
+// Copy the image inside out (3*nbPixels values) multiplied by mult
+// Return false (with a python error) if the image is not valid
+template <typename T>
+bool PyImage_fill(PyObject* obj, int nbPixels, float mult, T* out) {
+  Py_buffer view;
+  if (PyImage_getBuffer(obj, 3 * (Py_ssize_t) nbPixels, &view)) {
+    if (view.itemsize == sizeof(float)) {
+      const float* values = (const float*) view.buf;
+      for (int i = 0; i < nbPixels * 3; i++) {
+        out[i] = ((T) values[i]) * mult;
+      }
+    } else {
+      const double* values = (const double*) view.buf;
+      for (int i = 0; i < nbPixels * 3; i++) {
+        out[i] = ((T) values[i]) * mult;
+      }
+    }
+    PyBuffer_Release(&view);
+    return true;
+  }
+
+  // Fallback: list of tuples
+  if (!PyList_Check(obj) || PyList_Size(obj) != nbPixels) {
+    PyErr_SetString(PyExc_ValueError,
+        "image must be a list of (r,g,b) tuples or a float32/float64 buffer of width*height*3 values");
+    return false;
+  }
+  for (int i = 0; i < nbPixels; i++) {
+    PyObject* pixel = PyList_GetItem(obj, i);
+    if (!PyTuple_Check(pixel) || PyTuple_Size(pixel) < 3) {
+      PyErr_SetString(PyExc_ValueError, "pixels must be (r,g,b) tuples");
+      return false;
+    }
+    for (int j = 0; j < 3; j++) {
+      out[i * 3 + j] = (T) (PyFloat_AsDouble(PyTuple_GetItem(pixel, j)) * mult);
+    }
+  }
+  return !PyErr_Occurred();
+}
@@ -1,6 +1,10 @@
 #pragma once
 
 #include <Python.h>
+#include <stdio.h>
+#include <ctype.h>
+
+#include "buffer.h"
 
 #define EXT_UNKNOW  -1
 #define EXT_RGBE  0
@@ -64,6 +68,9 @@ public:
 
   virtual void write(const std::string& path) = 0;
   virtual void read(const std::string& path) = 0;
+  // Read the image at the current position of the stream
+  // (width and height are 0 if the header is not valid)
+  virtual void readStream(FILE* f) = 0;
 
   int getWidth() const {
     return width;
@@ -92,6 +99,21 @@ public:
     return resultsPy;
   }
 
+  // returns ((width, height), FloatBuffer)
+  // The decoded data is given to the buffer (no copy)
+  PyObject* packBuffer() {
+    PyObject* pixels = FloatBuffer_new(data, height, width, 3);
+    data = NULL; // Owned by the buffer object now
+    if (pixels == NULL) {
+      return NULL;
+    }
+
+    PyObject* resultsPy = Py_BuildValue("((i,i),O)", width, height, pixels);
+    Py_DECREF(pixels);
+
+    return resultsPy;
+  }
+
   double* toDouble(float mult=1.f) const {
     double * v = new double[width*height*3];
     for(int i = 0; i < width*height*3; i++) {
@@ -104,7 +126,95 @@ public:
 #include "rgbe.h"
 #include "pfm.h"
 
+///////////////////////////////////////////////////////////////////////////////
+///////////////////////////////////////////////////////////////////////////////
+// Images inside streams
+///////////////////////////////////////////////////////////////////////////////
+///////////////////////////////////////////////////////////////////////////////
+// The images stored inside an iteration dump container (see rgbe/container.py)
+// are addressed by "<container>.hdrc@<offset>", where offset is the position
+// of the (not compressed) image file inside the container
+
+#ifdef _WIN32
+#define helper_fseek _fseeki64
+#else
+#define helper_fseek fseeko
+#endif
+
+bool helper_split_container(const std::string& path, std::string& container,
+    long long& offset) {
+  size_t pos = path.rfind('@');
+  if (pos == std::string::npos || pos + 1 == path.size() || pos < 5) {
+    return false;
+  }
+  for (size_t i = pos + 1; i < path.size(); i++) {
+    if (!isdigit(path[i])) {
+      return false;
+    }
+  }
+
+  std::string ext = path.substr(pos - 5, 5);
+  for (size_t i = 0; i < ext.size(); i++) {
+    ext[i] = toupper(ext[i]);
+  }
+  if (ext != ".HDRC") {
+    return false;
+  }
+
+  container = path.substr(0, pos);
+  offset = atoll(path.c_str() + pos + 1);
+  return true;
+}
+
+// The format is detected with the magic number (PFM: "PF", otherwise RGBE)
+Format* loadImageStream(FILE* f) {
+  int c0 = fgetc(f);
+  int c1 = fgetc(f);
+  if (c0 == EOF || c1 == EOF || fseek(f, -2, SEEK_CUR) != 0) {
+    return NULL;
+  }
+
+  Format* img = NULL;
+  if (c0 == 'P' && c1 == 'F') {
+    img = new FormatPFM(0, 0, NULL);
+  } else {
+    img = new FormatRGBE(0, 0, NULL);
+  }
+  img->readStream(f);
+  return img;
+}
+
+// Stream over an image file loaded in memory
+FILE* helper_open_memory(const char* data, size_t size) {
+#ifdef _WIN32
+  FILE* f = tmpfile();
+  if (f != NULL) {
+    fwrite(data, 1, size, f);
+    rewind(f);
+  }
+  return f;
+#else
+  return fmemopen((void*) data, size, "rb");
+#endif
+}
+
 Format* loadImage(const std::string& path) {
+  std::string container;
+  long long offset = 0;
+  if (helper_split_container(path, container, offset)) {
+    FILE* f = fopen(container.c_str(), "rb");
+    if (f == NULL) {
+      printf("ERROR: Unenable to open file: %s\n", container.c_str());
+      return NULL;
+    }
+    Format* img = NULL;
+    if (helper_fseek(f, offset, SEEK_SET) == 0) {
+      img = loadImageStream(f);
+    }
+    fclose(f);
+    return img;
+  }
+
   int ext = helper_get_ext(path.c_str());
   if (ext == EXT_UNKNOW) {
     printf("ERROR: Unkown extension, QUIT: %s\n", path.c_str());
@@ -39,16 +39,24 @@ public:
       return; // FIXME
     }
 
+    readStream(f);
+
+    fclose(f);
+  }
+
+  // Read the image at the current position of f
+  virtual void readStream(FILE* f) {
     if(!data) {
       free(data);
     }
 
-    PFM_ReadHeader(f, &width, &height);
+    if (PFM_ReadHeader(f, &width, &height) != RGBE_RETURN_SUCCESS) {
+      width = height = 0;
+      return;
+    }
     data = (float *) malloc(sizeof(float) * 3 * width * height);
     PFM_ReadPixels(f, data, width, height);
     PFM_FlipVertically(data, width, height);
-
-    fclose(f);
   }
 };
 
@@ -68,15 +68,23 @@ public:
       return; // FIXME
     }
 
+    readStream(f);
+
+    fclose(f);
+  }
+
+  // Read the image at the current position of f
+  virtual void readStream(FILE* f) {
     if(!data) {
       free(data);
     }
 
-    RGBE_ReadHeader(f, &width, &height, NULL);
+    if (RGBE_ReadHeader(f, &width, &height, NULL) != RGBE_RETURN_SUCCESS) {
+      width = height = 0;
+      return;
+    }
     data = (float *) malloc(sizeof(float) * 3 * width * height);
     RGBE_ReadPixels_RLE(f, data, width, height);
-
-    fclose(f);
   }
 };
 
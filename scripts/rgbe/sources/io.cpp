@@ -20,18 +20,42 @@
 ///////////////////////////////////////////////////////////////////////////////
 ///////////////////////////////////////////////////////////////////////////////
 
+// Image can be a list of (r,g,b) tuples or a float32/float64 buffer
+// (see PyImage_fill)
 float* convertImage(int width, int height, PyObject *imagePy) {
   float* image = (float *) malloc(sizeof(float) * 3 *width*height);
-  for (unsigned int i = 0; i < width*height; i++) {
-    for (unsigned int j = 0; j < 3; j++) {
-      // XXX Protect the reading
-      image[i * 3 + j] = (float) PyFloat_AsDouble(
-          PyTuple_GetItem(PyList_GetItem(imagePy, i), j));
-    }
+  if (!PyImage_fill(imagePy, width * height, 1.f, image)) {
+    free(image);
+    boost::python::throw_error_already_set();
   }
   return image;
 }
 
+// The image decoding/encoding is done without the GIL
+// so python threads can read/write images concurrently
+template <typename F>
+F* decodeImage(const std::string& path) {
+  F* f = NULL;
+  Py_BEGIN_ALLOW_THREADS
+  f = new F(path);
+  Py_END_ALLOW_THREADS
+  return f;
+}
+
+Format* decodeImage(const std::string& path) {
+  Format* f = NULL;
+  Py_BEGIN_ALLOW_THREADS
+  f = loadImage(path);
+  Py_END_ALLOW_THREADS
+  return f;
+}
+
+void encodeImage(Format& f, const std::string& path) {
+  Py_BEGIN_ALLOW_THREADS
+  f.write(path);
+  Py_END_ALLOW_THREADS
+}
+
 ///////////////////////////////////////////////////////////////////////////////
 ///////////////////////////////////////////////////////////////////////////////
 // Write Techniques
@@ -43,7 +67,7 @@ static PyObject *
 rgbe_write_hdr(const std::string& path, int width, int height, PyObject *imagePy) {
   float* image = convertImage(width, height, imagePy);
   FormatRGBE f(width, height, image);
-  f.write(path);
+  encodeImage(f, path);
 
   return Py_BuildValue("b", 0);
 }
@@ -53,7 +77,7 @@ static PyObject *
 rgbe_write_pfm(const std::string& path, int width, int height, PyObject *imagePy) {
   float* image = convertImage(width, height, imagePy);
   FormatPFM f(width, height, image);
-  f.write(path);
+  encodeImage(f, path);
 
   return Py_BuildValue("b", 0);
 }
@@ -89,15 +113,19 @@ rgbe_write(const std::string& path, int width, int height, PyObject *imagePy) {
 /// read HDR files
 static PyObject *
 rgbe_read_hdr(const std::string& path) {
-  FormatRGBE f(path);
-  return f.pack();
+  Format* f = decodeImage<FormatRGBE>(path);
+  PyObject* resultsPy = f->pack();
+  delete f;
+  return resultsPy;
 }
 
 /// read HDR files
 static PyObject *
 rgbe_read_pfm(const std::string& path) {
-  FormatPFM f(path);
-  return f.pack();
+  Format* f = decodeImage<FormatPFM>(path);
+  PyObject* resultsPy = f->pack();
+  delete f;
+  return resultsPy;
 }
 
 /// read HDR files
@@ -120,9 +148,52 @@ rgbe_read(const std::string& path) {
   }
 }
 
+/// read HDR files without building the pixel list
+// returns ((width, height), FloatBuffer) where the buffer
+// wraps the decoded data (float32 [height, width, 3])
+static PyObject *
+rgbe_read_buffer(const std::string& path) {
+  Format* f = decodeImage(path);
+  if (f == NULL) {
+    return Py_BuildValue("((i,i),O)", 0, 0, Py_None);
+  }
+
+  PyObject* resultsPy = f->packBuffer();
+  delete f;
+  return resultsPy;
+}
+
+/// Read an image file loaded in memory (bytes)
+// returns ((width, height), FloatBuffer) or ((0,0), None)
+static PyObject *
+rgbe_read_bytes(PyObject *dataPy) {
+  char* data = NULL;
+  Py_ssize_t size = 0;
+  if (PyBytes_AsStringAndSize(dataPy, &data, &size) != 0) {
+    boost::python::throw_error_already_set();
+  }
+
+  // The bytes object is immutable and kept alive by the caller
+  Format* f = NULL;
+  Py_BEGIN_ALLOW_THREADS
+  FILE* stream = helper_open_memory(data, size);
+  if (stream != NULL) {
+    f = loadImageStream(stream);
+    fclose(stream);
+  }
+  Py_END_ALLOW_THREADS
+  if (f == NULL) {
+    return Py_BuildValue("((i,i),O)", 0, 0, Py_None);
+  }
+
+  PyObject* resultsPy = f->packBuffer();
+  delete f;
+  return resultsPy;
+}
+
 static PyObject *
 rgbe_read_tonemap(const std::string& path, float gamma = 2.2f, float exposure = 0.0f) {
-  Format* f = loadImage(path);
+  Format* f = decodeImage(path);
   // Header reading
   if (f == NULL) {
     return Py_BuildValue("(i,i)", 0, 0);
@@ -142,6 +213,7 @@ rgbe_read_tonemap(const std::string& path, float gamma = 2.2f, float exposure =
 
   PyObject* resultsPy = Py_BuildValue("((i,i),O)", f->getWidth(), f->getHeight(), pixels);
   Py_DECREF(pixels);
+  delete f;
 
   return resultsPy;
 }
@@ -154,6 +226,8 @@ BOOST_PYTHON_MODULE(io)
   boost::python::def("read", rgbe_read);
   boost::python::def("read_pfm", rgbe_read_pfm);
   boost::python::def("read_hdr", rgbe_read_hdr);
+  boost::python::def("read_buffer", rgbe_read_buffer);
+  boost::python::def("read_bytes", rgbe_read_bytes);
 
   // Special read methods
   boost::python::def("read_tonemap", rgbe_read_tonemap);
@@ -0,0 +1,50 @@
+"""
+Benchmark: score several techniques concurrently from python threads.
+rgbe.fast releases the GIL during the decoding and the metric computation,
+so the time per technique should stay constant (linear speedup) until
+the number of threads reaches the number of cores.
+
+usage: python3 bench_threads.py [-n nbTechniques] [-k imagesPerTechnique]
+"""
+
+import optparse
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import rgbe.fast
+import rgbe.image
+
+def scoreTechnique(w, h, images, pRef):
+    return rgbe.fast.rmse_all_images(w, h, images, pRef, 1.0, None)
+
+def bench(w, h, techniques, pRef, nbThreads):
+    start = time.time()
+    with ThreadPoolExecutor(max_workers=nbThreads) as pool:
+        results = list(pool.map(lambda images: scoreTechnique(w, h, images, pRef), techniques))
+    return time.time() - start, results
+
+if __name__=="__main__":
+    parser = optparse.OptionParser()
+    parser.add_option('-n','--techniques', help='number of techniques', default="8")
+    parser.add_option('-k','--images', help='number of images per technique', default="16")
+    parser.add_option('-r','--reference', help='reference image', default="test.hdr")
+    (opts, args) = parser.parse_args()
+
+    (w,h),pRef = rgbe.image.read_array(opts.reference)
+    pRef = pRef.astype("float64") # Used in place by rgbe.fast
+    images = ["img1.hdr", "img2.hdr"]
+    techniques = [[images[i % len(images)] for i in range(int(opts.images))]
+                  for t in range(int(opts.techniques))]
+
+    # One OpenMP thread per call: the parallelism comes from python threads
+    rgbe.fast.set_num_threads(1)
+
+    timeRef, resultsRef = bench(w, h, techniques, pRef, 1)
+    print("[INFO] 1 thread: %.3f sec" % timeRef)
+    nbThreads = 2
+    while nbThreads <= len(techniques):
+        t, results = bench(w, h, techniques, pRef, nbThreads)
+        if results != resultsRef:
+            print("[ERROR] Different results with", nbThreads, "threads")
+        print("[INFO] %i threads: %.3f sec (speedup: %.2f)" % (nbThreads, t, timeRef / t))
+        nbThreads *= 2
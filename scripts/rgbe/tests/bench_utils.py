@@ -0,0 +1,54 @@
+"""
+Benchmark: per-frame time of the rgbe.utils kernels at 1080p.
+The array kernels process the whole frame at once, the list functions
+(applyExposureGamma, computeNormFakeColor, ...) are wrappers over them
+and include the list <-> array conversions.
+
+usage: python3 bench_utils.py [-W width] [-H height] [-r repeats]
+"""
+
+import optparse
+import time
+import numpy
+
+import rgbe.utils
+try:
+    import Image
+except ImportError:
+    from PIL import Image
+
+def bench(name, f, repeats):
+    start = time.time()
+    for r in range(repeats):
+        f()
+    print("[INFO] %-28s %8.1f ms/frame" % (name, 1000.0 * (time.time() - start) / repeats))
+
+if __name__=="__main__":
+    parser = optparse.OptionParser()
+    parser.add_option('-W','--width', help='frame width', default="1920")
+    parser.add_option('-H','--height', help='frame height', default="1080")
+    parser.add_option('-r','--repeats', help='number of repetitions', default="5")
+    (opts, args) = parser.parse_args()
+
+    w, h, repeats = int(opts.width), int(opts.height), int(opts.repeats)
+    frame = numpy.random.rand(h, w, 3).astype(numpy.float32) * 2.0
+    frameRef = numpy.random.rand(h, w, 3).astype(numpy.float32) * 2.0
+    pixels = rgbe.utils.toTuples(frame)
+    pixelsRef = rgbe.utils.toTuples(frameRef)
+    im = Image.new("RGB", (w, h))
+
+    print("[INFO] Frame: %ix%i" % (w, h))
+    # Array kernels
+    bench("exposureGammaArray", lambda: rgbe.utils.exposureGammaArray(frame, 1.0, 2.2), repeats)
+    bench("toRGB8Array", lambda: rgbe.utils.toRGB8Array(frame), repeats)
+    bench("luminanceArray", lambda: rgbe.utils.luminanceArray(frame), repeats)
+    bench("falseColorArray", lambda: rgbe.utils.falseColorArray(
+        rgbe.utils.rmseNormArray(rgbe.utils.diffArray(frame, frameRef)), 0.0, 1.0), repeats)
+    bench("signedColorArray", lambda: rgbe.utils.signedColorArray(
+        rgbe.utils.luminanceArray(frame) - rgbe.utils.luminanceArray(frameRef), 1.0), repeats)
+
+    # Compatibility wrappers (list of tuples)
+    bench("applyExposureGamma (list)", lambda: rgbe.utils.applyExposureGamma(list(pixels), 1.0, 2.2), repeats)
+    bench("computeNormFakeColor (list)", lambda: rgbe.utils.computeNormFakeColor(
+        pixels, pixelsRef, rgbe.utils.RMSENorm(), rgbe.utils.FakeRedColor()), repeats)
+    bench("copyPixeltoPIL (list)", lambda: rgbe.utils.copyPixeltoPIL(w, h, pixels, im), repeats)
@@ -4,9 +4,13 @@ This implementation its inspired by
 """
 
 import math
+import os
+import numpy
 import rgbe.io
 import rgbe.utils
 import rgbe.fast
+import rgbe.image
+import rgbe.container
 try:
     import Image
 except ImportError:
@@ -69,10 +73,79 @@ def test_rmse_all_images(images, ref):
     metrics = rgbe.fast.rmse_all_images(widthRef, heightRef, images, pRef, 1.0, None)
     print(metrics)
 
+def test_read_array(path):
+    (width,height),p = rgbe.io.read(path)
+    (widthA,heightA),pA = rgbe.image.read_array(path)
+    print("[DEBUG] Array image ",widthA,"x",heightA,pA.dtype,pA.shape)
+    assert (width,height) == (widthA,heightA)
+    assert pA.shape == (height, width, 3)
+    assert rgbe.image.PixelList(pA).tolist() == p
+
+def test_rmse_all_images_multi(images, ref):
+    (width,height),pRef = rgbe.image.read_array(ref)
+    pRef = pRef.astype("float64")
+    metrics = numpy.asarray(rgbe.fast.rmse_all_images_multi(width, height, images, pRef,
+                                                            [1.0, 2.0], [1.0, 0.999, 0.9]))
+    print("[DEBUG] Multi metrics ",metrics.shape)
+    assert metrics.shape == (len(images), 6, 7)
+    # Same values (up to the summation order) than the single configuration
+    for idConfig, percentage, mult in [(5, 0.9, 2.0), (4, 0.999, 2.0), (1, 0.999, 1.0)]:
+        metricsRef = numpy.array(rgbe.fast.rmse_all_images_percentage(width, height, percentage, images,
+                                                                      pRef.copy(), mult))
+        assert numpy.allclose(metrics[:,idConfig,:], metricsRef, rtol=1e-3)
+    # With all the pixels, the same computation as rmse_all_images
+    # (only the reference is scaled)
+    for idConfig, mult in [(0, 1.0), (3, 2.0)]:
+        metricsRef = numpy.array(rgbe.fast.rmse_all_images(width, height, images, pRef.copy(), mult, None))
+        assert numpy.array_equal(metrics[:,idConfig,:].astype(numpy.float64), metricsRef)
+
+def test_container(images, compress):
+    path = "test_dump" + rgbe.container.CONTAINER_EXT
+    with rgbe.container.ContainerWriter(path, compress) as writer:
+        for i in range(len(images)):
+            writer.append_file(i+1, images[i])
+    container = rgbe.container.Container(path)
+    assert container.iterations() == list(range(1, len(images)+1))
+    for i in range(len(images)):
+        (width,height),p = container.read_array(i+1)
+        assert numpy.array_equal(p, rgbe.image.read_array(images[i])[1])
+    os.remove(path)
+    os.remove(path + rgbe.container.INDEX_EXT)
+
+def test_false_color_lut():
+    lut = rgbe.utils.falseColorLUT()
+    assert lut.shape == (rgbe.utils.LUT_SIZE, 3)
+    # Same as the scalar false color ramp, up to the LUT binning
+    v = numpy.linspace(-0.5, 1.5, 1001)
+    colors = rgbe.utils.applyLUT(v, lut, 0.0, 1.0).astype(int)
+    expected = numpy.array([[int(c*255) for c in rgbe.utils.FakeRedColor().getColor(x)] for x in v])
+    assert numpy.abs(colors - expected).max() <= 4
+    # NaN pixels (broken rendering) do not look like the minimum value
+    assert (rgbe.utils.applyLUT([float("nan")], lut) == rgbe.utils.NAN_COLOR).all()
+
+def test_parse_csv_incomplete():
+    # The last line of a time file still written by the renderer is ignored
+    import sys, tempfile
+    sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "..", "results"))
+    import csv_utils
+    for end in ["3", "3."]:
+        with tempfile.NamedTemporaryFile("w", suffix=".csv", delete=False) as f:
+            f.write("1.0,\n2.0,\n" + end)
+        try:
+            assert csv_utils.parseCSV(f.name).tolist() == [[1.0], [2.0]]
+        finally:
+            os.remove(f.name)
+
 if __name__=="__main__":
     tonemap("test.hdr", "test.jpg", 8, 2.2)
     tonemap_fast("test.hdr", "test_fast.jpg", 8, 2.2)
     scale("test.hdr", "test_256.hdr", 1.0)
     diffHDR("compare.hdr", "ref.hdr", "diff.png", 1)
     test_rmse_all_images(["img1.hdr","img2.hdr"], "test.hdr")
+    test_read_array("test.hdr")
+    test_rmse_all_images_multi(["img1.hdr","img2.hdr"], "test.hdr")
+    test_container(["img1.hdr","img2.hdr"], False)
+    test_container(["img1.hdr","img2.hdr"], True)
+    test_false_color_lut()
+    test_parse_csv_incomplete()
     
\ No newline at end of file
@@ -2,7 +2,7 @@ import optparse
 import os
 import sys
 
-PYTHON_NAME="python3"
+import pipeline
 
 # --- Read all params
 parser = optparse.OptionParser()
@@ -21,6 +21,9 @@ parser.add_option('-v','--variation', help='xml variation if required', default=
 
 # Running/Rendering Options
 parser.add_option('-j','--jobs', help="number of threads", default="1")
+parser.add_option('-J','--parallel', help="number of renderings at the same time (local mode)", default="1")
+parser.add_option('-F','--force', help="render again the techniques already complete", default=False, action="store_true")
+parser.add_option('-E','--extend', help="extra time (in sec) for the partial techniques rendered again", default="0")
 
 # Packing Options
 parser.add_option('-r','--reference', help="reference image", default="")
@@ -31,14 +34,18 @@ parser.add_option('-g','--xmlgen', help="enable scene generation (XML)", default
 parser.add_option('-c','--compute', help="enable scene running mts (Rendering)", default=False, action="store_true")
 parser.add_option('-p','--pack', help="enable pack results (Pack, MSE)", default=False, action="store_true")
 parser.add_option('-P','--packhtml', help="enable pack results (HTML)", default=False, action="store_true")
+parser.add_option('-L','--link', help="link the packed images instead of copying them (same filesystem)", default=False, action="store_true")
 parser.add_option('-R','--avoidMETRIC', help="disable metric computation", default=False, action="store_true")
 parser.add_option('-H','--hackMETRIC', help="enable hack metric", default=False, action="store_true")
 parser.add_option('-C','--cluster', help="enable cluster running mode", default=False, action="store_true")
+parser.add_option('-b','--backend', help="cluster backend or configuration (see run_batch.py)", default="mcgills")
+parser.add_option('-W','--watch', help="compute the metrics while the images are rendered (with -c -p)", default=False, action="store_true")
 
 parser.add_option('-e','--exposure', help="exposure value", default="0")
 parser.add_option('-O','--htmlsuffix', help="html suffix", default="0")
 
 parser.add_option('-G','--generator', help="python file for generating XML", default="scene/generatorGVPM.py")
+parser.add_option('-x','--rerun', help="run all the stages even if their inputs did not change", default=False, action="store_true")
 
 # Technique
 parser.add_option('-t','--technique', help="technique", default="")
@@ -54,34 +61,39 @@ if(opts.input == ""):
     sys.exit(1)
 
 #########################
-def launch(command):
-    import subprocess
-    print(("[DEBUG] Launch: "+" ".join(command)))
-    process = subprocess.Popen(command,shell=False)
-    return process.communicate()
+# The stages are run inside this process (see pipeline.py)
+#########################
+currentScenePath = opts.input + os.path.sep + opts.scenename + "_scene"
+stages = pipeline.Pipeline(currentScenePath + os.path.sep + pipeline.STATE_NAME, opts.rerun)
+sceneStages = []
 
 #########################
 # Step 1: Re-generate scene
 #########################scenes
-currentScenePath = opts.input + os.path.sep + opts.scenename + "_scene"
+sceneXML = currentScenePath + os.path.sep + opts.scenename + "_*.xml"
 if(opts.xmlgen):
-    command = [PYTHON_NAME, "scene/generate_scenes_integrators.py",
-               "-i", currentScenePath + os.path.sep + "ori_" + opts.scenename + ".xml",
-               "-p", opts.generator,
-               "-n", opts.scenename,
-               "-o", currentScenePath]
-    launch(command)
-
+    import generate_scenes_integrators
+    oriXML = currentScenePath + os.path.sep + "ori_" + opts.scenename + ".xml"
+    stages.add("generate", generate_scenes_integrators.main,
+               ["-i", oriXML,
+                "-p", opts.generator,
+                "-n", opts.scenename,
+                "-o", currentScenePath],
+               inputs=[oriXML, opts.generator], outputs=[sceneXML])
+    sceneStages.append("generate")
 
     if(opts.variation != ""):
         # We want a variation, run it
-        command = [PYTHON_NAME, "scene/variation_scenes.py",
-                   "-i", currentScenePath + os.path.sep + opts.scenename,
-                   "-r", # Remove
-                   "-c", opts.variation]
-        launch(command)
+        import variation_scenes
+        stages.add("variation", variation_scenes.main,
+                   ["-i", currentScenePath + os.path.sep + opts.scenename,
+                    "-r", # Remove
+                    "-c", opts.variation],
+                   inputs=[sceneXML, opts.variation], outputs=[sceneXML], after=["generate"])
+        sceneStages.append("variation")
 
     if not (opts.compute or opts.pack or opts.packhtml):
+        stages.run()
         print("Finish :)")
         sys.exit(0)
 
@@ -118,28 +130,56 @@ if opts.technique == "":
     techFlag = ["-A"]
 else:
     techFlag = ["-t", opts.technique]
+
+# Metrics of the rendered images (run_mse.py or metric_watcher.py)
+pourcentage = "1.0"
+if(opts.hackMETRIC):
+    pourcentage = "0.999"
+metricCommand = ["-i", currentOutMTS,
+                 "-o", currentOutRES,
+                 "-r", opts.reference,
+                 "-s", opts.dumpiter,
+                 "-p", pourcentage,
+                 "-e", opts.exposure,
+                 "-c", "results/rules.xml"]
+metricCommand += techFlag
 	
 if(opts.compute):
-    command = [PYTHON_NAME, "run/run_batch.py",
-               "-m", opts.mitsuba, # Use this MTS
+    import run_batch
+    command = ["-m", opts.mitsuba, # Use this MTS
                "-s", str(maxTimeSec), # Rendering time
                "-i", currentScenePath + os.path.sep + opts.scenename,
                "-o", currentScenePath + os.path.sep + "out" + opts.output,
-               "-j", opts.jobs
+               "-j", opts.jobs,
+               "-J", opts.parallel,
+               "-E", opts.extend
                ]
+    if(opts.force):
+        command += ["-f"]
     if(opts.cluster):
         print("[CLUSTER MODE]")
-        command += ["-C"]
+        command += ["-C", "-b", opts.backend]
     command += techFlag
-    launch(command)
+    renderStage = run_batch.main
+    if(opts.watch and opts.pack and not opts.avoidMETRIC and not opts.cluster):
+        # The images are scored while they are rendered: the metrics stage
+        # only finds them inside the metric cache
+        import metric_watcher
+        def renderStage(argv, context):
+            with metric_watcher.Watching(metricCommand):
+                return run_batch.main(argv, context)
+    # The cluster jobs end after the submission: always submit them
+    stages.add("render", renderStage, command,
+               inputs=[sceneXML, opts.mitsuba], outputs=[currentOutMTS], after=sceneStages,
+               cache=not (opts.cluster or opts.force))
 
 #########################
 # Step 3: Packing...
 #########################
 if(opts.pack):
     #TODO: Check reference
-    command = [PYTHON_NAME, "results/run_pack.py",
-               "-i", currentOutMTS,
+    import run_pack
+    command = ["-i", currentOutMTS,
                "-o", currentOutRES,
                "-r", opts.reference,
                "-s", opts.dumpiter,
@@ -153,23 +193,19 @@ if(opts.pack):
                "-n", "recons"]
     for t in opts.time:
         command += ["-f", t]
+    if(opts.link):
+        command += ["-l", "-J", opts.jobs]
     command += techFlag
-    launch(command)
+    stages.add("pack", run_pack.main, command,
+               inputs=[currentOutMTS, opts.reference], outputs=[currentOutRES],
+               after=["render"] if opts.compute else sceneStages)
 
     if(not opts.avoidMETRIC):
-        pourcentage = "1.0"
-        if(opts.hackMETRIC):
-            pourcentage = "0.999"
-        command = [PYTHON_NAME, "results/run_mse.py",
-                   "-i", currentOutMTS,
-                   "-o", currentOutRES,
-                   "-r", opts.reference,
-                   "-s", opts.dumpiter,
-                   "-p", pourcentage,
-                   "-e", opts.exposure,
-                   "-c", "results/rules.xml"]
-        command += techFlag
-        launch(command)
+        import run_mse
+        # The CSV files are written next to the packed files
+        stages.add("metrics", run_mse.main, metricCommand,
+                   inputs=[currentOutMTS, opts.reference, "results/rules.xml", currentOutRES],
+                   outputs=[currentOutRES], after=["pack"])
 
 #########################
 # Step 4: Packing...
@@ -177,8 +213,8 @@ if(opts.pack):
 if(opts.packhtml):
     #TODO: Check reference
     #TODO: Check layout
-    command = [PYTHON_NAME, "results/run_html.py",
-               "-j", "./results/data/js",
+    import run_html
+    command = ["-j", "./results/data/js",
                "-i", currentOutRES,
                "-o", currentOutHTML,
                "-r", opts.reference,
@@ -188,4 +224,11 @@ if(opts.packhtml):
                "-s", opts.dumpiter,
                "-n", opts.scenename,
                "-m"]
-    print(launch(command))
+    after = []
+    if(opts.pack):
+        after = ["pack"] if opts.avoidMETRIC else ["pack", "metrics"]
+    stages.add("html", run_html.main, command,
+               inputs=[currentOutRES, opts.layout, "./results/data/js"],
+               outputs=[currentOutHTML + os.path.sep + "index.html"], after=after)
+
+stages.run()
@@ -0,0 +1,178 @@
+"""
+State of a rendering campaign (run_batch.py)
+
+Each technique of an output directory is:
+- complete: its rendering used its whole time budget (or ended by itself)
+- partial: its rendering was stopped before (killed job, node reboot,
+  error in the log) or it was done with a smaller time budget
+- missing: nothing was rendered
+
+The state is read from the outputs of the technique (<tech>_time.csv,
+last image <tech>_pass_<i> or inside its container, <tech>.out log) and
+from the campaign record
+(.campaign.json) where run_batch.py writes how each rendering ended.
+Without record (cluster jobs, older outputs) a rendering is complete if
+its render time is close enough to the time budget.
+The renderer can not continue a rendering (it overwrites its outputs),
+so the partial techniques are rendered again from the beginning.
+"""
+
+import os
+import re
+import json
+import datetime
+import collections
+
+import dir_index
+import time_index
+
+CAMPAIGN_FILE = ".campaign.json"
+
+COMPLETE = "complete"
+PARTIAL = "partial"
+MISSING = "missing"
+
+# Part of the time budget lost to the scene loading
+# (not in <tech>_time.csv) before the rendering is killed
+TIME_TOLERANCE = 0.1
+
+# Log line of a Mitsuba error (see libcore/formatter.cpp)
+ERROR_LINE = re.compile(r"\bERROR\b")
+
+# Iteration dump containers and their index (see rgbe.container, only
+# imported when there is a container: rendering needs no compiled module)
+CONTAINER_FILE = re.compile(r"\.hdrc(\.idx)?$")
+
+TechniqueState = collections.namedtuple("TechniqueState",
+                                        ["name", "status", "iterations", "renderTime", "lastImage", "reason"])
+
+def loadRecord(outputDir):
+    """Campaign record: technique -> how its last rendering ended"""
+    try:
+        with open(os.path.join(outputDir, CAMPAIGN_FILE), "r") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+def saveRecord(outputDir, record):
+    filename = os.path.join(outputDir, CAMPAIGN_FILE)
+    tmpFile = filename + ".tmp"
+    with open(tmpFile, "w") as f:
+        json.dump(record, f, indent=1, sort_keys=True)
+    os.replace(tmpFile, filename)
+
+def logError(outFile):
+    """First error line of a rendering log (None if no error or no log)"""
+    try:
+        with open(outFile, "r", errors="replace") as f:
+            for line in f:
+                if(ERROR_LINE.search(line)):
+                    return line.strip()
+    except OSError:
+        pass
+    return None
+
+def renderedTime(outputDir, technique):
+    """(number of iterations, render time) of the technique"""
+    index = time_index.TimeIndex.forTechnique(outputDir, technique)
+    return len(index), index.timeAt(len(index))
+
+def containerMaxIteration(outputDir, index, nameBase):
+    """Last iteration inside the container of the images <nameBase><i>.hdr (0 if none)"""
+    if(len(index.match(nameBase[:-1] + "*.hdrc")) == 0):
+        return 0
+    import rgbe.container
+    container = rgbe.container.find_container(os.path.join(outputDir, nameBase))
+    if(container is None or len(container) == 0):
+        return 0
+    return max(container.iterations())
+
+def techniqueState(outputDir, technique, budget, index=None, record=None, tolerance=TIME_TOLERANCE):
+    """
+    State of a technique rendered in outputDir
+    :param budget: time budget of the rendering (seconds)
+    :param index: DirIndex of outputDir (scanned if None)
+    :param record: campaign record (loaded if None)
+    """
+    if(index is None):
+        index = dir_index.getIndex(outputDir)
+    if(record is None):
+        record = loadRecord(outputDir)
+
+    if(not index.contains(technique + "_time.csv")):
+        return TechniqueState(technique, MISSING, 0, 0.0, 0, "no time file")
+    iterations, renderTime = renderedTime(outputDir, technique)
+    lastImage = max(index.maxIteration(technique + "_pass_"),
+                    containerMaxIteration(outputDir, index, technique + "_pass_"))
+    state = lambda status, reason: TechniqueState(technique, status, iterations, renderTime, lastImage, reason)
+    if(iterations == 0):
+        return state(MISSING, "no iteration")
+    if(lastImage == 0):
+        return state(PARTIAL, "no image written")
+    error = logError(os.path.join(outputDir, technique + ".out"))
+    if(error is not None):
+        return state(PARTIAL, "error in the log: " + error)
+
+    entry = record.get(technique)
+    if(entry is not None and entry.get("iterations") == iterations):
+        if(entry["status"] == "error"):
+            return state(PARTIAL, "rendering failed")
+        if(entry["budget"] < budget):
+            return state(PARTIAL, "rendered with a time budget of %is" % entry["budget"])
+        return state(COMPLETE, "rendering " + entry["status"])
+    if(renderTime >= budget * (1.0 - tolerance)):
+        return state(COMPLETE, "%.1fs rendered" % renderTime)
+    return state(PARTIAL, "%.1fs rendered out of %is" % (renderTime, budget))
+
+def campaignStates(outputDir, techniques, budget, tolerance=TIME_TOLERANCE):
+    """State of each technique (OrderedDict name -> TechniqueState)"""
+    states = collections.OrderedDict()
+    if(not os.path.isdir(outputDir)):
+        for tech in techniques:
+            states[tech] = TechniqueState(tech, MISSING, 0, 0.0, 0, "no output directory")
+        return states
+    index = dir_index.getIndex(outputDir)
+    record = loadRecord(outputDir)
+    for tech in techniques:
+        states[tech] = techniqueState(outputDir, tech, budget, index, record, tolerance)
+    return states
+
+def techniqueOutputs(index, technique):
+    """Images of the technique (all the prefixes) and its containers.
+    The outputs of the longer technique names (<tech>_L1 for <tech>)
+    are not taken."""
+    longer = [t for t in index.techniques() if t.startswith(technique + "_")]
+    isOwned = lambda name, tech: name.startswith(tech + "_") or name.startswith(tech + ".")
+    outputs = []
+    for name in index.names:
+        if(not isOwned(name, technique) or any(isOwned(name, t) for t in longer)):
+            continue
+        if(dir_index.SERIES_RE.match(name) or CONTAINER_FILE.search(name)):
+            outputs.append(index.path(name))
+    return outputs
+
+def removeOutputs(outputDir, technique):
+    """Remove the images and the containers of a previous rendering of
+    the technique (the new rendering overwrites the time file, the old
+    images would not match it anymore)"""
+    index = dir_index.getIndex(outputDir, useCache=False)
+    outputs = techniqueOutputs(index, technique)
+    for output in outputs:
+        os.remove(output)
+    return len(outputs)
+
+def recordRenderings(outputDir, results, budgets):
+    """
+    Add the renderings to the campaign record
+    :param results: status of each technique ("done", "timeout", "error")
+    :param budgets: time budget of each technique
+    """
+    record = loadRecord(outputDir)
+    date = "{:%Y-%m-%d %H:%M}".format(datetime.datetime.now())
+    for tech, status in results.items():
+        iterations, renderTime = 0, 0.0
+        if(os.path.exists(os.path.join(outputDir, tech + "_time.csv"))):
+            iterations, renderTime = renderedTime(outputDir, tech)
+        record[tech] = {"status": status, "budget": budgets[tech], "iterations": iterations,
+                        "renderTime": renderTime, "date": date}
+    saveRecord(outputDir, record)
@@ -0,0 +1,274 @@
+"""
+Cluster backends of run_batch.py (-C)
+
+All the renderings of a run are submitted as one array job. Each run
+has its own job directory (<output>/.cluster/<date>-<pid>) holding:
+- array.sh: the script of the array (scheduler directives + task runner)
+- task_<k>.args: the task k (one line per value: the log file, the time
+  budget in seconds, then the arguments of the command)
+- task_<k>.state: written by the task ("running", then "exit <code>")
+- job.json: backend, job id and technique of each task
+
+The state of the tasks is read from these files and from the scheduler
+(queued tasks, tasks killed before they wrote their exit code).
+"""
+
+import os
+import json
+import time
+import datetime
+import subprocess
+
+JOBS_DIR = ".cluster"
+JOB_FILE = "job.json"
+
+# Time given to the task runner on top of the rendering time budget
+WALLTIME_MARGIN = 60
+
+# Exit code of timeout(1) when the time budget is over
+TIMEOUT_EXIT = 124
+
+def formatWalltime(seconds):
+    return "%02i:%02i:%02i" % (seconds // 3600, (seconds % 3600) // 60, seconds % 60)
+
+RUNNER = """
+# Task of the array (generated by run_batch.py)
+TASK="%(jobDir)s/task_%(taskId)s"
+MITSUBA_DIR="%(mitsubaDir)s"
+export LD_LIBRARY_PATH="$MITSUBA_DIR:$LD_LIBRARY_PATH"
+export PATH="$MITSUBA_DIR:$PATH"
+
+{ read -r OUT; read -r BUDGET; set --; while IFS= read -r arg; do set -- "$@" "$arg"; done; } < "$TASK.args"
+echo running > "$TASK.state"
+if command -v timeout > /dev/null; then
+    %(launcher)stimeout "$BUDGET" "$@" > "$OUT" 2>&1
+else
+    %(launcher)s"$@" > "$OUT" 2>&1
+fi
+echo "exit $?" > "$TASK.state"
+"""
+
+class Backend:
+    """Array job submission (see PBSBackend, SlurmBackend, LocalBackend)
+    A backend gives submitCommand(script, nbTasks), the command submitting
+    the array script, and isActive(jobId): tasks of the job still queued
+    or running"""
+    name = ""
+    taskId = "$1"   # Index of the task inside the array (shell expression)
+    launcher = ""   # Prefix of the rendering command
+
+    def __init__(self, jobDir, threads, account=None, constraint=None):
+        """
+        :param jobDir: job directory of the submission
+        :param threads: threads of each rendering (cores requested per task)
+        :param account: account charged for the job
+        :param constraint: node property (PBS) or constraint (Slurm)
+        """
+        self.jobDir = os.path.abspath(jobDir)
+        self.threads = threads
+        self.account = account
+        self.constraint = constraint
+
+    def directives(self, nbTasks, walltime):
+        """Scheduler lines of the array script"""
+        return []
+
+    def parseJobId(self, output):
+        return output.strip()
+
+    def runCommand(self, command):
+        return subprocess.check_output(command, shell=False, universal_newlines=True)
+
+    def writeScript(self, nbTasks, walltime, mitsuba):
+        script = os.path.join(self.jobDir, "array.sh")
+        with open(script, "w") as f:
+            f.write("#!/bin/sh\n")
+            for line in self.directives(nbTasks, walltime):
+                f.write(line + "\n")
+            f.write(RUNNER % {"jobDir": self.jobDir, "taskId": self.taskId, "launcher": self.launcher,
+                              "mitsubaDir": os.path.dirname(os.path.abspath(mitsuba))})
+        os.chmod(script, 0o755)
+        return script
+
+    def submit(self, tasks, mitsuba):
+        """
+        Submit the tasks as one array job
+        :param tasks: RenderTask of each rendering (timeout: time budget)
+        :return: the job id
+        """
+        os.makedirs(self.jobDir)
+        for k, task in enumerate(tasks):
+            with open(os.path.join(self.jobDir, "task_%i.args" % k), "w") as f:
+                f.write("\n".join([os.path.abspath(task.outFile), str(task.timeout)] + task.command) + "\n")
+        walltime = max(task.timeout for task in tasks) + WALLTIME_MARGIN
+        script = self.writeScript(len(tasks), walltime, mitsuba)
+        jobId = self.parseJobId(self.runCommand(self.submitCommand(script, len(tasks))))
+        with open(os.path.join(self.jobDir, JOB_FILE), "w") as f:
+            json.dump({"backend": self.name, "jobId": jobId,
+                       "tasks": [task.name for task in tasks],
+                       "budgets": [task.timeout for task in tasks],
+                       "date": "{:%Y-%m-%d %H:%M}".format(datetime.datetime.now())}, f, indent=1)
+        return jobId
+
+class PBSBackend(Backend):
+    """PBS/Torque (qsub -t array)"""
+    name = "pbs"
+    taskId = "${PBS_ARRAYID:-$PBS_ARRAY_INDEX}"
+
+    def directives(self, nbTasks, walltime):
+        nodes = "#PBS -l nodes=1:ppn=%i" % self.threads
+        if(self.constraint):
+            nodes += ":" + self.constraint
+        lines = [nodes, "#PBS -t 0-%i" % (nbTasks - 1),
+                 "#PBS -l walltime=" + formatWalltime(walltime),
+                 # The rendering output goes to <tech>.out, this is the runner output
+                 "#PBS -j oe", "#PBS -o " + os.path.join(self.jobDir, "pbs.out")]
+        if(self.account):
+            lines.append("#PBS -A " + self.account)
+        return lines
+
+    def submitCommand(self, script, nbTasks):
+        return ["qsub", script]
+
+    def isActive(self, jobId):
+        return subprocess.call(["qstat", "-t", jobId], stdout=subprocess.DEVNULL,
+                               stderr=subprocess.DEVNULL) == 0
+
+class SlurmBackend(Backend):
+    """Slurm (sbatch --array)"""
+    name = "slurm"
+    taskId = "$SLURM_ARRAY_TASK_ID"
+    launcher = "srun "
+
+    def directives(self, nbTasks, walltime):
+        lines = ["#SBATCH --array=0-%i" % (nbTasks - 1),
+                 "#SBATCH --time=" + formatWalltime(walltime),
+                 "#SBATCH --ntasks=1",
+                 "#SBATCH --cpus-per-task=%i" % self.threads,
+                 "#SBATCH --output=" + os.path.join(self.jobDir, "slurm_%a.out")]
+        if(self.account):
+            lines.append("#SBATCH --account=" + self.account)
+        if(self.constraint):
+            lines.append("#SBATCH --constraint=" + self.constraint)
+        return lines
+
+    def submitCommand(self, script, nbTasks):
+        return ["sbatch", "--parsable", script]
+
+    def parseJobId(self, output):
+        # <job id>[;<cluster>]
+        return output.strip().split(";")[0]
+
+    def isActive(self, jobId):
+        try:
+            return self.runCommand(["squeue", "-h", "-j", jobId]).strip() != ""
+        except (OSError, subprocess.CalledProcessError):
+            return False
+
+class LocalBackend(Backend):
+    """Fake scheduler: the tasks of the array run one after the
+    other on this machine, in the background (tests of the job files)"""
+    name = "local"
+
+    def submitCommand(self, script, nbTasks):
+        return ["sh", "-c", 'for k in $(seq 0 %i); do sh "%s" $k; done' % (nbTasks - 1, script)]
+
+    def runCommand(self, command):
+        process = subprocess.Popen(command, shell=False, start_new_session=True,
+                                   stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        return str(process.pid)
+
+    def isActive(self, jobId):
+        try:
+            os.kill(int(jobId), 0)
+        except ProcessLookupError:
+            return False
+        except PermissionError:
+            pass
+        # The finished runner is a zombie until this process exits
+        try:
+            return os.waitpid(int(jobId), os.WNOHANG) == (0, 0)
+        except ChildProcessError:
+            return True
+
+BACKENDS = {"pbs": PBSBackend, "slurm": SlurmBackend, "local": LocalBackend}
+
+# Cluster configurations: backend and default options
+# (threads: the only number of threads accepted)
+PRESETS = {"mcgills": ("pbs", {"account": "hbm-700-aa", "constraint": "westmere", "threads": 12}),
+           "custom": ("slurm", {})}
+
+def createBackend(name, output, threads, account=None, constraint=None):
+    """
+    Backend of a new submission inside the output directory
+    :param name: backend (BACKENDS) or configuration (PRESETS)
+    :raise ValueError: unknown backend or unsupported number of threads
+    """
+    preset = {}
+    if(name in PRESETS):
+        name, preset = PRESETS[name]
+    if(name not in BACKENDS):
+        raise ValueError("Unknown cluster backend: " + name)
+    if("threads" in preset and threads != preset["threads"]):
+        raise ValueError("Only %i threads per rendering are possible with this cluster" % preset["threads"])
+    jobDir = os.path.join(output, JOBS_DIR, "{:%Y%m%d-%H%M%S}".format(datetime.datetime.now()) + "-%i" % os.getpid())
+    if(os.path.exists(jobDir)):
+        # Several submissions of this process in the same second
+        k = 1
+        while(os.path.exists(jobDir + "-%i" % k)):
+            k += 1
+        jobDir += "-%i" % k
+    return BACKENDS[name](jobDir, threads, account or preset.get("account"),
+                          constraint or preset.get("constraint"))
+
+def taskStates(jobDir, nbTasks, active):
+    """
+    State of each task of a job
+    :param active: the job is still known by the scheduler
+    :return: "queued", "running", "done", "timeout", "error", "killed" (the
+             task ended without writing its exit code) or "lost" (never started)
+    """
+    states = []
+    for k in range(nbTasks):
+        try:
+            with open(os.path.join(jobDir, "task_%i.state" % k), "r") as f:
+                state = f.read().split()
+        except OSError:
+            state = []
+        if(len(state) == 0):
+            states.append("queued" if active else "lost")
+        elif(state[0] == "running"):
+            states.append("running" if active else "killed")
+        elif(state == ["exit", "0"]):
+            states.append("done")
+        elif(state == ["exit", str(TIMEOUT_EXIT)]):
+            states.append("timeout")
+        else:
+            states.append("error")
+    return states
+
+def loadJobs(output):
+    """Submissions of the output directory: [(job directory, job record)]"""
+    jobs = []
+    jobsDir = os.path.join(output, JOBS_DIR)
+    if(not os.path.isdir(jobsDir)):
+        return jobs
+    for name in sorted(os.listdir(jobsDir)):
+        try:
+            with open(os.path.join(jobsDir, name, JOB_FILE), "r") as f:
+                jobs.append((os.path.join(jobsDir, name), json.load(f)))
+        except (OSError, ValueError):
+            pass # Submission failed
+    return jobs
+
+def jobStates(jobDir, job):
+    """State of each technique of a submission (name -> state)"""
+    backend = BACKENDS[job["backend"]](jobDir, 0)
+    states = taskStates(jobDir, len(job["tasks"]), backend.isActive(job["jobId"]))
+    return dict(zip(job["tasks"], states))
+
+def markRecorded(jobDir, job):
+    """The results of the job were added to the campaign record"""
+    job["recorded"] = time.time()
+    with open(os.path.join(jobDir, JOB_FILE), "w") as f:
+        json.dump(job, f, indent=1)
@@ -1,6 +1,8 @@
 import os, sys, optparse, subprocess
 import rgbe.merge
+import rgbe.image
 import glob
+import numpy
 
 def merge(width, height, blocksize, inputFile, output, name="", ext="hdr"):
     rgbe.merge.merge(inputFile,int(width),int(height),int(blocksize), output, ext)
@@ -9,33 +11,24 @@ def sumblock(w, h, blockSize, path, outFilename, ext="hdr"):
     w = int(w)
     h = int(h)
     blockSize = int(blockSize)
-    pix = []
-    
-    for i in range(w*h):
-        pix.append((0.0,0.0,0.0))
+    pix = numpy.zeros((h, w, 3))
     
     files = glob.glob(path+"*."+ext)
     norm = 0
     for localFile in files:
             # Read and copy all pixels
             print('Read (%s)' % (os.path.basename(localFile)))
-            (wLocal,hLocal), pLocal = rgbe.io.read(localFile)
+            (wLocal,hLocal), pLocal = rgbe.image.read_array(localFile)
             if(wLocal != w and hLocal != h):
                 print("[WARN] size mismatch (%i, %i) for block (%s)" % (wLocal, hLocal, localFile))
             else:
                 norm += 1
-                for pLoc in range(0,w*h):
-                        pix[pLoc] = (pLocal[pLoc][0] + pix[pLoc][0],
-                                     pLocal[pLoc][1] + pix[pLoc][1],
-                                     pLocal[pLoc][2] + pix[pLoc][2])
+                pix += pLocal
     
     # Normalisation contrib
     if(norm != 0):
         print("[INFO] Make normalisation with %i" % (norm))
-        for pLoc in range(0,w*h):
-                pix[pLoc] = (pix[pLoc][0] / norm,
-                             pix[pLoc][1] / norm,
-                             pix[pLoc][2] / norm)
+        pix /= norm
     # Write the final image
     rgbe.io.write(outFilename, w, h, pix)
 
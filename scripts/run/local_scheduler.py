@@ -0,0 +1,160 @@
+"""
+Local scheduler of the renderings (run_batch.py)
+
+Several renderings run at the same time, each one inside a slot owning
+an equal part of the core budget. The renderings can be pinned to the
+cores of their slot (CPU affinity), so they do not steal time from each
+other and their time budgets stay comparable.
+The output of a rendering is written to its .out file while it runs.
+"""
+
+import os
+import sys
+import time
+import heapq
+import signal
+import datetime
+import subprocess
+import collections
+
+# One rendering: the command, its output file and its time budget
+# (seconds, the process is killed after it; None: no limit)
+RenderTask = collections.namedtuple("RenderTask", ["name", "command", "outFile", "timeout"])
+
+def availableCores():
+    """Cores this process can use"""
+    if(hasattr(os, "sched_getaffinity")):
+        return sorted(os.sched_getaffinity(0))
+    return list(range(os.cpu_count() or 1))
+
+def partitionCores(cores, nbSlots):
+    """Split the cores into nbSlots groups of the same size
+    (the slots share the cores if there are more slots than cores)"""
+    if(nbSlots > len(cores)):
+        return [[cores[i % len(cores)]] for i in range(nbSlots)]
+    size = len(cores) // nbSlots
+    return [cores[i*size:(i+1)*size] for i in range(nbSlots)]
+
+def formatDuration(seconds):
+    seconds = int(round(seconds))
+    if(seconds >= 3600):
+        return "%ih%02im" % (seconds // 3600, (seconds % 3600) // 60)
+    return "%im%02is" % (seconds // 60, seconds % 60)
+
+class LocalScheduler:
+    def __init__(self, nbSlots=1, cores=None, pin=False, pollInterval=0.5):
+        """
+        :param nbSlots: number of renderings at the same time
+        :param cores: core budget (default: all the available cores)
+        :param pin: pin each rendering to the cores of its slot
+        """
+        self.cores = cores if cores else availableCores()
+        self.nbSlots = max(1, nbSlots)
+        self.groups = partitionCores(self.cores, self.nbSlots)
+        self.pin = pin and hasattr(os, "sched_setaffinity")
+        if(pin and not self.pin):
+            print("[WARN] CPU affinity is not supported on this platform")
+        self.pollInterval = pollInterval
+
+    def threadsPerTask(self):
+        return len(self.groups[0])
+
+    def eta(self, running, queue, now):
+        """Remaining time if all the renderings use their whole time budget"""
+        slots = [max(0.0, task.timeout - (now - start)) if task.timeout is not None else 0.0
+                 for task, proc, out, start in running.values()]
+        slots += [0.0] * (self.nbSlots - len(slots))
+        heapq.heapify(slots)
+        for task in queue:
+            heapq.heappush(slots, heapq.heappop(slots) + (task.timeout or 0.0))
+        return max(slots)
+
+    def start(self, task, cores):
+        out = open(task.outFile, "w")
+        kwargs = {}
+        if(os.name == "posix"):
+            # Own process group: the children of a .sh launcher are killed too
+            kwargs["start_new_session"] = True
+        if(self.pin):
+            kwargs["preexec_fn"] = lambda: os.sched_setaffinity(0, cores)
+        try:
+            proc = subprocess.Popen(task.command, shell=False, stdout=out, stderr=subprocess.STDOUT, **kwargs)
+        except OSError:
+            out.close()
+            raise
+        return proc, out
+
+    def stop(self, proc):
+        try:
+            if(os.name == "posix"):
+                os.killpg(proc.pid, signal.SIGKILL)
+            else:
+                proc.kill()
+        except OSError:
+            pass # Already finished
+        proc.wait()
+
+    def progress(self, running, queue, results, now):
+        eta = self.eta(running, queue, now)
+        dateEnd = datetime.datetime.now() + datetime.timedelta(seconds=eta)
+        print("[INFO] %i/%i done, %i running, %i waiting, ETA %s (%s)" %
+              (len(results), len(results) + len(running) + len(queue), len(running), len(queue),
+               "{:%H:%M}".format(dateEnd), formatDuration(eta)))
+        sys.stdout.flush()
+
+    def run(self, tasks):
+        """
+        Render all the tasks
+        :return: status of each task name ("done", "timeout", "error")
+        """
+        queue = collections.deque(tasks)
+        running = {} # slot -> (task, proc, out, start time)
+        results = collections.OrderedDict()
+        print("[INFO] %i renderings, %i at the same time, %i threads each%s" %
+              (len(queue), self.nbSlots, self.threadsPerTask(), " (pinned)" if self.pin else ""))
+        try:
+            while(queue or running):
+                changed = False
+                now = time.time()
+                for slot in range(self.nbSlots):
+                    if(slot in running or not queue):
+                        continue
+                    task = queue.popleft()
+                    print("[INFO] Run computation for", task.name, "->", task.outFile)
+                    try:
+                        proc, out = self.start(task, self.groups[slot])
+                    except OSError as e:
+                        print("[ERROR] Impossible to run", task.name, ":", e)
+                        results[task.name] = "error"
+                    else:
+                        running[slot] = (task, proc, out, now)
+                    changed = True
+
+                time.sleep(self.pollInterval)
+                now = time.time()
+                for slot, (task, proc, out, start) in list(running.items()):
+                    ret = proc.poll()
+                    if(ret is None and task.timeout is not None and now - start >= task.timeout):
+                        self.stop(proc)
+                        results[task.name] = "timeout"
+                        print("[INFO] Process killed :) ", task.name, "after", formatDuration(now - start))
+                    elif(ret is None):
+                        continue
+                    elif(ret == 0):
+                        results[task.name] = "done"
+                        print("[INFO] Rendering done:", task.name, "in", formatDuration(now - start))
+                    else:
+                        results[task.name] = "error"
+                        print("[ERROR] Error during the rendering :(", task.name, "(exit code %i)" % ret)
+                    out.close()
+                    del running[slot]
+                    changed = True
+
+                if(changed):
+                    self.progress(running, queue, results, now)
+        finally:
+            # Interrupted: do not leave renderings behind
+            for task, proc, out, start in running.values():
+                self.stop(proc)
+                out.close()
+        return results
@@ -1,9 +1,15 @@
 import optparse
-import glob
 import sys
 import os
-import subprocess
 import datetime
+import collections
+
+# Shared modules of the results scripts
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "results"))
+import dir_index
+import campaign
+import cluster_backends
+from local_scheduler import LocalScheduler, RenderTask
 
 
 def kill(proc_pid):
@@ -13,11 +19,40 @@ def kill(proc_pid):
         proc.kill()
     process.kill()
 
-
-# TODO: Use it as a parameters
-CLUSTER_MODE = "mcgills"
-
-if __name__ == "__main__":
+# Campaign status of the finished cluster tasks
+CLUSTER_RESULTS = {"done": "done", "timeout": "timeout", "error": "error", "killed": "error"}
+
+def clusterStatus(output, verbose=True):
+    """Read the state of the cluster renderings of the output directory
+    and add the finished submissions to the campaign record
+    :param verbose: print the state of all the submissions
+    :return: the techniques still queued or running"""
+    jobs = cluster_backends.loadJobs(output)
+    if (verbose and len(jobs) == 0):
+        print("[INFO] No cluster submission in", output)
+    pending = set()
+    for jobDir, job in jobs:
+        if (not verbose and "recorded" in job):
+            # Finished and recorded: no need to ask the scheduler
+            continue
+        states = cluster_backends.jobStates(jobDir, job)
+        counts = collections.Counter(states.values())
+        if (verbose):
+            print("[INFO] Job %s (%s, %s): %s" % (job["jobId"], job["backend"], job["date"],
+                                                  ", ".join("%i %s" % (n, s) for s, n in sorted(counts.items()))))
+            for tech in job["tasks"]:
+                print("   * %s: %s" % (tech, states[tech]))
+        pending.update(tech for tech in job["tasks"] if states[tech] in ("queued", "running"))
+        if ("recorded" not in job and counts["queued"] == 0 and counts["running"] == 0):
+            results = collections.OrderedDict((tech, CLUSTER_RESULTS[states[tech]])
+                                              for tech in job["tasks"] if states[tech] in CLUSTER_RESULTS)
+            campaign.recordRenderings(output, results, dict(zip(job["tasks"], job["budgets"])))
+            cluster_backends.markRecorded(jobDir, job)
+    return pending
+
+def main(argv=None, context=None):
+    """Render the techniques of a scene
+    :return: the techniques rendered by this run"""
     # Options
     parser = optparse.OptionParser()
     parser.add_option("-m", "--mitsuba", help="the mitsuba .sh or MTS executable")
@@ -29,7 +64,21 @@ if __name__ == "__main__":
     parser.add_option('-A', '--automatic', help='replace -t usage by finding all files', default=False,
                       action="store_true")
     parser.add_option('-C', '--cluster', help='submit the job in the cluster', default=False, action="store_true")
-    (options, args) = parser.parse_args()
+    parser.add_option('-b', '--backend', help='cluster backend: pbs, slurm, local (test) or a configuration: '
+                      + ", ".join(sorted(cluster_backends.PRESETS)), default="mcgills")
+    parser.add_option('-P', '--account', help='cluster account', default=None)
+    parser.add_option('-Q', '--constraint', help='cluster node property/constraint', default=None)
+    parser.add_option('-S', '--status', help='print the state of the cluster renderings (only -o is needed)', default=False, action="store_true")
+    parser.add_option('-J', '--parallel', help='number of renderings at the same time (local mode, the core budget is split between them)', default=1)
+    parser.add_option('-B', '--budget', help='number of cores used by the renderings (local mode, default: all)', default=None)
+    parser.add_option('-a', '--affinity', help='pin each rendering to its cores (local mode)', default=False, action="store_true")
+    parser.add_option('-f', '--force', help='render all the techniques again (default: skip the complete ones)', default=False, action="store_true")
+    parser.add_option('-E', '--extend', help='extra time (in sec) given to the partial techniques rendered again', default=0)
+    (options, args) = parser.parse_args(argv)
+
+    if (options.status and options.output != None):
+        clusterStatus(options.output)
+        return []
 
     # === Error handling
     if (options.input == None):
@@ -61,7 +110,9 @@ if __name__ == "__main__":
     techniques = []
     if (options.automatic):
         print(" === Automatic finding ...")
-        files = glob.glob(options.input + "*.xml")
+        # The scene directory is not a result directory: no cache inside it
+        index = dir_index.getIndex(os.path.dirname(options.input) or ".", useCache=False)
+        files = index.match(os.path.basename(options.input) + "*.xml")
         for fileXML in files:
             filename = os.path.basename(fileXML)
             filenameRoot = os.path.basename(options.input)
@@ -73,11 +124,49 @@ if __name__ == "__main__":
         for tech in options.technique:
             techniques.append(tech.strip())
 
+    # The techniques of the cluster jobs not finished yet are left alone:
+    # their images are being written (the finished jobs are recorded)
+    pending = clusterStatus(options.output, verbose=False)
+    for tech in techniques:
+        if (tech in pending):
+            print("[WARN] %s: still queued or running in a cluster job, skipped" % tech)
+    techniques = [tech for tech in techniques if tech not in pending]
+
+    # Resume the campaign: only the partial and missing techniques are rendered
+    states = campaign.campaignStates(options.output, techniques, int(options.time))
+    budgets = {}
+    for tech, state in states.items():
+        print("[INFO] %s: %s (%s)" % (tech, state.status, state.reason))
+        if (state.status == campaign.PARTIAL):
+            budgets[tech] = int(options.time) + int(options.extend)
+        elif (state.status == campaign.MISSING or options.force):
+            budgets[tech] = int(options.time)
+    skipped = [tech for tech in techniques if tech not in budgets]
+    if (len(skipped) != 0):
+        print("[INFO] Skip the complete techniques:", " ".join(skipped))
+    techniques = [tech for tech in techniques if tech in budgets]
+    for tech in techniques:
+        nbRemoved = campaign.removeOutputs(options.output, tech)
+        if (nbRemoved != 0):
+            print("[INFO] Remove %i images and containers of the previous rendering of %s" % (nbRemoved, tech))
+
+    # Local mode: the renderings are run by the scheduler after this loop
+    scheduler = None
+    tasks = []
+    nbThreads = options.jobs
+    if (not options.cluster):
+        cores = None
+        if (options.budget is not None):
+            cores = LocalScheduler().cores[:int(options.budget)]
+        scheduler = LocalScheduler(int(options.parallel), cores, options.affinity)
+        if (int(options.parallel) > 1 or options.budget is not None):
+            # Each rendering uses the cores of its slot
+            nbThreads = scheduler.threadsPerTask()
+
     dateStart = datetime.datetime.now()
-    dateEnd = dateStart + datetime.timedelta(seconds=int(options.time) * len(techniques))
+    dateEnd = dateStart + datetime.timedelta(seconds=sum(budgets.values()))
     for tech in techniques:
-        print("[INFO] End of rendering tasks: ", "{:%H:%M}".format(dateEnd))
-        command = [options.mitsuba, "-p", str(options.jobs)]
+        command = [options.mitsuba, "-p", str(nbThreads)]
         # Add output
         command += ["-o", options.output + os.path.sep + tech]
         # Add input
@@ -85,88 +174,31 @@ if __name__ == "__main__":
         # Remove the progress bar
         command += ["-z"]
 
-        if (options.cluster):
-            if CLUSTER_MODE == "mcgills":
-                if (int(options.jobs) != 12):
-                    print("With mcgill cluster, only 12 thread at a time is possible.")
-                    raise
-
-                ## Cluster which use torque
-                ## target only westmere
-                TMP_FILE = "/home/neodym60/scratch/cluster_tmp_command.sh"
-                fileCommand = open(TMP_FILE, "w")
-                fileCommand.write("#!/bin/sh\n")
-                fileCommand.write("\n")
-
-                # Number of threads
-                # force to use all the thread on westmere (SW) nodes
-                fileCommand.write("#PBS -l nodes=1:ppn=12:westmere\n")
-                fileCommand.write("#PBS -A hbm-700-aa\n")
-
-                # Redirect regular output (+error)
-                fileCommand.write("#PBS -o "+options.output + os.path.sep + tech + ".out\n")
-                fileCommand.write("#PBS -e "+options.output + os.path.sep + tech + ".err\n")                
-
-                # Write the time
-                minutesTask = int(options.time) // 60
-                secondsTaks = int(options.time) % 60
-                fileCommand.write("#PBS -l walltime=00:" + str(minutesTask) + ":" + str(secondsTaks) + "\n")
-
-                # Add the task (mitsuba call)
-                fileCommand.write("\n")
-                fileCommand.write('MITSUBA_DIR="' + str(os.path.dirname(options.mitsuba)) + '"\n')
-                fileCommand.write('export LD_LIBRARY_PATH="$MITSUBA_DIR:$LD_LIBRARY_PATH"\n')
-                fileCommand.write('export PATH="$MITSUBA_DIR:$PATH"\n')
-                fileCommand.write(" ".join(command) + "\n")
-
-                # Run the file on the cluster
-                fileCommand.close()
-                clusterCommand = ["qsub", TMP_FILE]
-                # process = subprocess.run(clusterCommand,shell=False,stdout=subprocess.PIPE)
-                proc = subprocess.check_output(clusterCommand, shell=False)
-                print(proc)
-            elif CLUSTER_MODE == "custom":
-                ## This are the command for the hand made cluster
-                ## based on slurm
-                print("[CLUSTER] Submit the job")
-                TMP_FILE = "/tmp/cluster_tmp_command.sh"
-                fileCommand = open(TMP_FILE, "w")
-                fileCommand.write("#!/bin/sh\n")
-                fileCommand.write("\n")
-
-                # Write time limit
-                minutesTask = int(options.time) // 60
-                secondsTaks = int(options.time) % 60
-                fileCommand.write("#SBATCH --time=" + str(minutesTask) + ":" + str(secondsTaks) + "\n")
-
-                # Number of threads
-                fileCommand.write("#SBATCH --ntasks=1\n")
-                fileCommand.write("#SBACTH --cpus-per-task=12\n")
-
-                # The main command
-                fileCommand.write("\n")
-                fileCommand.write("srun " + " ".join(command) + "\n")
-
-                # Run the file on the cluster
-                fileCommand.close()
-                clusterCommand = ["sbatch", TMP_FILE]
-                process = subprocess.run(clusterCommand, shell=False, stdout=subprocess.PIPE)
-                print(process)
-            else:
-                print("bad cluster configuration selection")
-                raise
-        else:
-            print("[DEBUG] Run computation for", tech)
-            # Start foo as a process
-            try:
-                proc = subprocess.check_output(command, shell=False, timeout=int(options.time))
-            except subprocess.TimeoutExpired as e:
-                outputFile = open(options.output + os.path.sep + tech + ".out", "w")
-                outputFile.write(e.output.decode("utf-8"))
-                outputFile.close()
-                print("Process killed :)")
-            except subprocess.CalledProcessError as e:
-                outputFile = open(options.output + os.path.sep + tech + ".out", "w")
-                outputFile.write(e.output.decode("utf-8"))
-                outputFile.close()
-                print("Error during the rendering :(")
+        # The output is written to <tech>.out while it runs
+        tasks.append(RenderTask(tech, command, options.output + os.path.sep + tech + ".out",
+                                budgets[tech]))
+
+    if (options.cluster and len(tasks) != 0):
+        # One array job for all the renderings
+        try:
+            backend = cluster_backends.createBackend(options.backend, options.output, int(nbThreads),
+                                                     options.account, options.constraint)
+        except ValueError as e:
+            print("[ERROR]", e)
+            sys.exit(1)
+        print("[INFO] End of rendering tasks: ", "{:%H:%M}".format(dateEnd))
+        jobId = backend.submit(tasks, options.mitsuba)
+        print("[CLUSTER] Job %s submitted (%s, %i tasks): %s" % (jobId, backend.name, len(tasks), backend.jobDir))
+        print("[CLUSTER] State of the renderings: run_batch.py -S -o", options.output)
+
+    if (scheduler is not None):
+        results = scheduler.run(tasks)
+        # Read by the next run to skip the complete techniques
+        campaign.recordRenderings(options.output, results, budgets)
+        failed = [name for name, status in results.items() if status == "error"]
+        if (len(failed) != 0):
+            print("[WARN] Renderings with errors:", " ".join(failed))
+    return techniques
+
+if __name__ == "__main__":
+    main()
@@ -95,13 +95,15 @@ def changeAttrValue(attrs, name, newValue):
                 attr[1]["value"] = newValue
                 print("   = Re-write "+name)
 
-if __name__=="__main__":
+def main(argv=None, context=None):
+    """Generate the scene of each integrator of the generator file
+    :return: the technique names"""
     parser = optparse.OptionParser()
     parser.add_option('-i','--input', help='input XML file')
     parser.add_option('-p','--python', help='python file for generate names')
     parser.add_option('-n', '--name', help='prefix name XML', default="scene")
     parser.add_option('-o','--output', help='output file directory')
-    (opts, args) = parser.parse_args()
+    (opts, args) = parser.parse_args(argv)
     
     if not(opts.input and opts.output):
         parser.error("Need input/output values")
@@ -112,9 +114,19 @@ if __name__=="__main__":
     if not(os.path.exists(opts.python)):
         parser.error("Unable to find: "+str(opts.python))
 
-    with open(opts.python) as f:
-        code = compile(f.read(), opts.python, 'exec')
-        exec(code, globals(),  locals())
+    # The generator file defines INTEGRATORS
+    # (it can parse the options of this script itself)
+    generator = dict(globals())
+    scriptArgv = sys.argv
+    if(argv is not None):
+        sys.argv = [__file__] + list(argv)
+    try:
+        with open(opts.python) as f:
+            code = compile(f.read(), opts.python, 'exec')
+            exec(code, generator)
+    finally:
+        sys.argv = scriptArgv
+    INTEGRATORS = generator["INTEGRATORS"]
 
     # Scene dependant parameters?
     sceneParam = sceneDependentParameter(opts.input)
@@ -156,3 +168,7 @@ if __name__=="__main__":
     
     print("=== OAR Batch")
     print(" -t ".join(techniqueNames))
+    return techniqueNames[1:]
+
+if __name__=="__main__":
+    main()
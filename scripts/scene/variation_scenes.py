@@ -1,13 +1,4 @@
 import os, sys, optparse
-
-# Read the options
-parser = optparse.OptionParser()
-parser.add_option('-i','--input', help='input root path (directory + scene name)')
-parser.add_option('-r','--remove', help='remove files not used for variation', default=False, action="store_true")
-parser.add_option('-c','--config', help='config file')
-(opts, args) = parser.parse_args()
-
-
 import glob
 import xml.etree.ElementTree as ET
 
@@ -52,10 +43,10 @@ class Change:
             attribs.append(xmlEntry(n.tag, n.attrib["name"], n.attrib["value"]))
         return Change(techniques, suffix, attribs)
     
-    def apply(self, xml):
+    def apply(self, xml, inputRoot):
         out = xml.replace(".xml", "_"+self.suffix+".xml")
         generateNewXML(xml, self.listAttr, out)
-        return (out,out.replace(opts.input+"_","").replace(".xml",""))
+        return (out,out.replace(inputRoot+"_","").replace(".xml",""))
     
     def __str__(self):
         s = "[ techniques: "+str(self.techniques)+", suffix: "+str(self.suffix)+"]"
@@ -87,59 +78,73 @@ def loadConfig(configFile):
     
     return (selectedConfig, changes, deleteConfig)
 
-# Read config files
-selected, changes, deletes = loadConfig(opts.config)
+def main(argv=None, context=None):
+    """Apply the variations of the config file to the scenes
+    :return: the technique names"""
+    # Read the options
+    parser = optparse.OptionParser()
+    parser.add_option('-i','--input', help='input root path (directory + scene name)')
+    parser.add_option('-r','--remove', help='remove files not used for variation', default=False, action="store_true")
+    parser.add_option('-c','--config', help='config file')
+    (opts, args) = parser.parse_args(argv)
+
+    # Read config files
+    selected, changes, deletes = loadConfig(opts.config)
+
+    # List all xml files
+    xmls = glob.glob(opts.input+"*.xml")
+    xmlsLists = []
+    print("Base remove: "+opts.input+"_")
+    for xml in xmls:
+        base = xml.replace(opts.input+"_","").replace(".xml","")
+        xmlsLists.append((xml, base))
+
+    if(opts.remove):
+        selectedXmlsLists = []
+        for xml, base in xmlsLists:
+            if base in selected:
+                selectedXmlsLists.append((xml, base))
+            else:
+                print("Remove: ", xml, "(", base, " not in ", str(selected), ")")
+                os.remove(xml)
+        # Copy ptr
+        xmlsLists = selectedXmlsLists
+
+    for change in changes:
+        for xml, base in xmlsLists:
+            if base in change.techniques:
+                xmlsLists.append(change.apply(xml, opts.input))
+
+    xmls = glob.glob(opts.input+"*.xml")
+    xmlsLists = []
+    for xml in xmls:
+        base = xml.replace(opts.input+"_","").replace(".xml","")
+        xmlsLists.append((xml, base))
 
-# List all xml files
-xmls = glob.glob(opts.input+"*.xml")
-xmlsLists = []
-print("Base remove: "+opts.input+"_")
-for xml in xmls:
-    base = xml.replace(opts.input+"_","").replace(".xml","")
-    xmlsLists.append((xml, base))
-
-if(opts.remove):
-    selectedXmlsLists = []
     for xml, base in xmlsLists:
-        if base in selected:
-            selectedXmlsLists.append((xml, base))
-        else:
-            print("Remove: ", xml, "(", base, " not in ", str(selected), ")")
+        if base in deletes:
+            print("Delete",xml)
             os.remove(xml)
-    # Copy ptr
-    xmlsLists = selectedXmlsLists
 
-for change in changes:
-    for xml, base in xmlsLists:
-        if base in change.techniques:
-            xmlsLists.append(change.apply(xml))
-
-xmls = glob.glob(opts.input+"*.xml")
-xmlsLists = []
-for xml in xmls:
-    base = xml.replace(opts.input+"_","").replace(".xml","")
-    xmlsLists.append((xml, base))
-    
-for xml, base in xmlsLists:
-    if base in deletes:
-        print("Delete",xml)
-        os.remove(xml)
+    # --- Final print
+    xmls = glob.glob(opts.input+"*.xml")
+    xmlsLists = []
+    for xml in xmls:
+        base = xml.replace(opts.input+"_","").replace(".xml","")
+        xmlsLists.append((xml, base))
 
-# --- Final print
-xmls = glob.glob(opts.input+"*.xml")
-xmlsLists = []
-for xml in xmls:
-    base = xml.replace(opts.input+"_","").replace(".xml","")
-    xmlsLists.append((xml, base))
+    print("=================")
+    print("=== Generated ===")
+    print("=================")
 
-print("=================")
-print("=== Generated ===")
-print("=================")
+    bases = [base for xml, base in xmlsLists]
+    bases.sort()
 
-bases = [base for xml, base in xmlsLists]
-bases.sort()
+    print("== Number of techniques: "+str(len(bases)))
 
-print("== Number of techniques: "+str(len(bases)))
+    for base in bases:
+        print(" *",base)
+    return bases
 
-for base in bases:
-    print(" *",base)
\ No newline at end of file
+if __name__=="__main__":
+    main()